@@ -0,0 +1,122 @@
+"""
+准入控制
+推送连接（SSE事件流、时间线流、长轮询、WebSocket）会长期占用一个线程或协程，
+按客户端和全局两级限制并发数；超限时立即拒绝而不是排队：
+单个客户端超限返回 429，服务器整体超限返回 503，都带 Retry-After。
+
+config.json 中的 admission 段：
+    "admission": {
+        "max_streams": 1000,           # 全局并发推送连接上限
+        "max_streams_per_client": 16,  # 单个客户端（按来源地址）上限
+        "retry_after": 5               # 拒绝时建议的重试间隔（秒）
+    }
+"""
+import json
+import os
+import threading
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+from arena_metrics import Counter
+
+DEFAULT_MAX_STREAMS = 1000
+DEFAULT_MAX_STREAMS_PER_CLIENT = 16
+DEFAULT_RETRY_AFTER = 5
+
+STREAMS_REJECTED = Counter('arena_streams_rejected_total', '被准入控制拒绝的推送连接（按原因）', ('reason',))
+
+
+class AdmissionRejected(Exception):
+    """连接名额不足"""
+
+    def __init__(self, status: int, message: str, retry_after: int):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+        self.retry_after = retry_after
+
+    def payload(self) -> Dict:
+        return {"status": "error", "message": self.message, "retry_after": self.retry_after}
+
+    def headers(self) -> Dict[str, str]:
+        return {'Retry-After': str(self.retry_after)}
+
+
+class StreamBudget:
+    """推送连接名额：全局计数 + 按客户端计数"""
+
+    def __init__(self, max_streams: int = DEFAULT_MAX_STREAMS,
+                 max_per_client: int = DEFAULT_MAX_STREAMS_PER_CLIENT,
+                 retry_after: int = DEFAULT_RETRY_AFTER):
+        self.max_streams = max_streams
+        self.max_per_client = max_per_client
+        self.retry_after = retry_after
+        self.active = 0
+        self.clients: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, client: str):
+        """
+        占用一个名额
+        :raises AdmissionRejected: 客户端超限（429）或全局超限（503）
+        """
+        with self._lock:
+            held = self.clients.get(client, 0)
+            if held >= self.max_per_client:
+                STREAMS_REJECTED.inc('client')
+                raise AdmissionRejected(429, f"单个客户端最多 {self.max_per_client} 条并发推送连接", self.retry_after)
+            if self.active >= self.max_streams:
+                STREAMS_REJECTED.inc('global')
+                raise AdmissionRejected(503, "服务器推送连接已满，请稍后重试", self.retry_after)
+            self.clients[client] = held + 1
+            self.active += 1
+
+    def release(self, client: str):
+        """归还名额"""
+        with self._lock:
+            held = self.clients.get(client, 0)
+            if held <= 0:
+                return
+            if held == 1:
+                del self.clients[client]
+            else:
+                self.clients[client] = held - 1
+            self.active -= 1
+
+    @contextmanager
+    def slot(self, client: str):
+        """with 期间占用一个名额"""
+        self.acquire(client)
+        try:
+            yield
+        finally:
+            self.release(client)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "active_streams": self.active,
+                "clients": len(self.clients),
+                "max_streams": self.max_streams,
+                "max_streams_per_client": self.max_per_client
+            }
+
+    @classmethod
+    def from_config(cls, path: Optional[str] = None) -> "StreamBudget":
+        """读取 config.json 的 admission 段"""
+        path = path or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'config.json')
+        section = {}
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                section = json.load(f).get('admission', {})
+        except (OSError, ValueError):
+            pass
+        return cls(
+            max_streams=int(section.get('max_streams', DEFAULT_MAX_STREAMS)),
+            max_per_client=int(section.get('max_streams_per_client', DEFAULT_MAX_STREAMS_PER_CLIENT)),
+            retry_after=int(section.get('retry_after', DEFAULT_RETRY_AFTER))
+        )
+
+
+# 全局推送连接名额（Flask 与 ASGI 模式共用）
+stream_budget = StreamBudget.from_config()
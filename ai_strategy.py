@@ -9,11 +9,21 @@ import random
 class TicTacToeAI:
     """井字棋AI"""
     
-    def __init__(self, difficulty: str = "hard"):
+    def __init__(self, difficulty: str = "hard", tablebase=None,
+                 workers: int = 1, time_limit: float = 1.0, k: Optional[int] = None):
         """
         :param difficulty: 难度级别 - "easy", "medium", "hard"
+        :param tablebase: 可选的残局表库（tablebase.Tablebase），命中时直接返回完美着法
+        :param workers: 大于1时启用多进程 Lazy-SMP 并行搜索（进程池常驻，用完调用 close()）
+        :param time_limit: 并行搜索的时间上限（秒）
+        :param k: 并行搜索的连珠数，默认取 min(行数, 列数)
         """
         self.difficulty = difficulty
+        self.tablebase = tablebase
+        self.workers = workers
+        self.time_limit = time_limit
+        self.k = k
+        self._search_pool = None
     
     def get_best_move(self, game) -> Optional[Tuple[int, int]]:
         """
@@ -49,6 +59,15 @@ class TicTacToeAI:
         if not available_moves:
             return None
         
+        # 表库命中则无需搜索（棋盘尺寸和连珠数都要与表库一致）
+        if self.tablebase is not None and self.tablebase.supports(game.board, self._win_length(game.board)):
+            move = self.tablebase.best_move(game.board)
+            if move is not None:
+                return move
+        
+        if self.workers > 1:
+            return self._get_parallel_move(game)
+        
         # 如果是第一步，选择中心或角落（优化性能）
         if game.move_count == 0:
             # 优先选择中心
@@ -85,6 +104,39 @@ class TicTacToeAI:
         
         return best_move
     
+    def _win_length(self, board) -> int:
+        """连珠数，默认取 min(行数, 列数)"""
+        if self.k is not None:
+            return self.k
+        return min(len(board), len(board[0]) if board else 0)
+    
+    def _get_parallel_move(self, game) -> Optional[Tuple[int, int]]:
+        """
+        多进程 Lazy-SMP 搜索（适用于任意 m,n,k 棋盘）
+        """
+        from mnk_board import geometry_for_board
+        from parallel_search import SearchPool
+        
+        if self._search_pool is None:
+            self._search_pool = SearchPool(self.workers)
+        geometry = geometry_for_board(game.board, self.k)
+        x_mask, o_mask = geometry.board_to_masks(game.board)
+        if game.current_player == 'X':
+            own, opp, side = x_mask, o_mask, 0
+        else:
+            own, opp, side = o_mask, x_mask, 1
+        
+        cell, _, _ = self._search_pool.search(geometry, own, opp, side, time_limit=self.time_limit)
+        if cell is None:
+            return self._get_random_move(game)
+        return geometry.position(cell)
+    
+    def close(self):
+        """关闭并行搜索的工作进程和置换表（之后再搜索会重新创建）"""
+        if self._search_pool is not None:
+            self._search_pool.shutdown()
+            self._search_pool = None
+    
     def _minimax(self, game, depth: int, is_maximizing: bool, alpha: float, beta: float) -> float:
         """
         Minimax算法实现（带Alpha-Beta剪枝）
@@ -151,6 +203,12 @@ class SimpleAI:
     适合作为默认AI
     """
     
+    def __init__(self, tablebase=None):
+        """
+        :param tablebase: 可选的残局表库（tablebase.Tablebase），命中时直接返回完美着法
+        """
+        self.tablebase = tablebase
+    
     def get_best_move(self, game) -> Optional[Tuple[int, int]]:
         """
         获取最佳移动
@@ -165,6 +223,12 @@ class SimpleAI:
         if not available_moves:
             return None
         
+        # 表库命中则直接走完美着法（连珠数按 min(行数, 列数)）
+        if self.tablebase is not None and self.tablebase.supports(game.board, min(len(game.board), len(game.board[0]))):
+            move = self.tablebase.best_move(game.board)
+            if move is not None:
+                return move
+        
         current_player = game.current_player
         opponent = 'O' if current_player == 'X' else 'X'
         
@@ -211,3 +275,126 @@ class SimpleAI:
                 return (row, col)
         
         return None
+
+
+class ThreatSpaceAI:
+    """
+    威胁空间搜索AI，适用于大棋盘的k连珠
+    先用VCF求解器寻找连续冲四的强制胜，再检查对手的VCF并抢占其首着，
+    都没有时才交给后备引擎（3×3默认Minimax，大棋盘默认窗口启发式）
+    """
+    
+    def __init__(self, k: Optional[int] = None, max_depth: int = 12,
+                 time_limit: float = 0.5, fallback=None):
+        """
+        :param k: 连珠数，默认取 min(行数, 列数)
+        :param max_depth: VCF最多连续冲四的步数
+        :param time_limit: 每步思考时间上限（秒），由己方和对方的VCF搜索平分
+        :param fallback: 后备引擎（需实现 get_best_move(game)）
+        """
+        self.k = k
+        self.max_depth = max_depth
+        self.time_limit = time_limit
+        self.fallback = fallback
+    
+    def get_best_move(self, game) -> Optional[Tuple[int, int]]:
+        """
+        获取最佳移动
+        """
+        from mnk_board import geometry_for_board
+        from threat_search import ThreatBoard, VCFSolver
+        
+        available_moves = game.get_available_moves()
+        if not available_moves:
+            return None
+        
+        geometry = geometry_for_board(game.board, self.k)
+        board = ThreatBoard(geometry, game.board)
+        player = game.current_player
+        opponent = 'O' if player == 'X' else 'X'
+        solver = VCFSolver(max_depth=self.max_depth, time_limit=self.time_limit / 2)
+        
+        # 1. 己方有强制胜
+        line = solver.solve(board, player)
+        if line:
+            return geometry.position(line[0])
+        
+        # 2. 对手能直接获胜则封堵
+        defender_wins = board.winning_cells(opponent)
+        if defender_wins:
+            return geometry.position(min(defender_wins))
+        
+        # 3. 对手有强制胜，抢占其首着
+        line = solver.solve(board, opponent)
+        if line:
+            return geometry.position(line[0])
+        
+        # 4. 交给后备引擎
+        if self.fallback is not None:
+            return self.fallback.get_best_move(game)
+        if geometry.rows == geometry.cols == geometry.k == 3:
+            return TicTacToeAI(difficulty="hard").get_best_move(game)
+        return self._get_heuristic_move(board, player, opponent)
+    
+    def _get_heuristic_move(self, board, player: str, opponent: str) -> Optional[Tuple[int, int]]:
+        """
+        窗口启发式：进攻分与防守分之和最高的空位
+        """
+        best_cell = None
+        best_score = -1
+        for cell, occupant in enumerate(board.cells):
+            if occupant is not None:
+                continue
+            score = board.cell_score(cell, player) + board.cell_score(cell, opponent)
+            if score > best_score:
+                best_score = score
+                best_cell = cell
+        return board.geometry.position(best_cell) if best_cell is not None else None
+
+
+AI_ENGINES = ('simple', 'minimax', 'threat')
+
+
+def create_ai_from_config(path: Optional[str] = None):
+    """
+    按 config.json 的 game 段创建对局AI：
+        "ai_engine": "simple" | "minimax" | "threat"（默认 simple）
+        "ai_difficulty": "easy" | "medium" | "hard"（minimax 使用）
+        "tablebase_path": "tablebases/3x3k3.tb"（可选，相对项目根目录；由 python tablebase.py 生成）
+    决斗场的棋盘固定为 3×3，威胁空间搜索在这里只会退回 Minimax；它面向大棋盘的k连珠
+    配置了表库时以只读内存映射打开，各引擎命中表库就直接走完美着法（minimax 的 easy/medium 仍按难度随机）
+    """
+    import json
+    import logging
+    import os
+    
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    path = path or os.path.join(base_dir, 'config.json')
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            game_config = json.load(f).get('game', {})
+    except (OSError, ValueError):
+        game_config = {}
+    
+    logger = logging.getLogger(__name__)
+    engine = game_config.get('ai_engine', 'simple')
+    difficulty = game_config.get('ai_difficulty', 'hard')
+    tablebase = None
+    if game_config.get('tablebase_path'):
+        from tablebase import Tablebase
+        tablebase_path = game_config['tablebase_path']
+        if not os.path.isabs(tablebase_path):
+            tablebase_path = os.path.join(base_dir, tablebase_path)
+        try:
+            tablebase = Tablebase(tablebase_path)
+            logger.info(f"已加载残局表库: {tablebase_path} ({tablebase.rows}x{tablebase.cols}, k={tablebase.k})")
+        except (OSError, ValueError) as e:
+            logger.warning(f"无法加载残局表库 {tablebase_path}: {e}，不使用表库")
+    
+    if engine == 'minimax':
+        return TicTacToeAI(difficulty=difficulty, tablebase=tablebase)
+    if engine == 'threat':
+        return ThreatSpaceAI(fallback=TicTacToeAI(difficulty=difficulty, tablebase=tablebase))
+    if engine != 'simple':
+        logger.warning(f"未知的 ai_engine: {engine}，使用 simple（可选 {', '.join(AI_ENGINES)}）")
+    return SimpleAI(tablebase=tablebase)
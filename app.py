@@ -2,50 +2,107 @@
 Flask API服务器
 提供RESTful API和SSE事件流
 """
-from flask import Flask, request, jsonify, Response, stream_with_context, send_from_directory
+from flask import Blueprint, Flask, request, jsonify, Response, stream_with_context, g, current_app
 from flask_cors import CORS
 import json
 import time
 import logging
 import os
-import mimetypes
 from threading import Thread
-from game_manager import game_manager
-from ai_strategy import SimpleAI, TicTacToeAI
-
-# 配置日志
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+from typing import Dict, Optional
+from game_manager import game_manager, MAX_BULK_MOVES, MAX_STATE_WAIT, state_update_frame, version_etag
+from ai_strategy import create_ai_from_config
+from rl_player import rl_batcher, validate_rl_request
+import state_codec
+from arena_logging import fields, get_logger, setup_logging_from_config
+import arena_metrics
+from admission import AdmissionRejected, stream_budget
+from arena_metrics import AI_DECISION_SECONDS, REQUEST_SECONDS, SSE_CONNECTIONS
+from static_assets import IMMUTABLE_CACHE_CONTROL, REVALIDATE_CACHE_CONTROL, static_assets
+
+# 配置日志：队列 + 后台线程输出，级别与采样见 config.json 的 logging 段
+setup_logging_from_config()
 logger = logging.getLogger(__name__)
+move_logger = get_logger('moves')
+sse_logger = get_logger('sse')
 
 # 获取项目根目录
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 
-# 添加MIME类型映射
-mimetypes.add_type('application/javascript', '.js')
-mimetypes.add_type('text/css', '.css')
-mimetypes.add_type('text/html', '.html')
+# SSE空闲连接的心跳间隔（秒）
+SSE_HEARTBEAT_INTERVAL = 15
 
-# 创建Flask应用
-app = Flask(__name__, static_folder='static', static_url_path='/static')
-CORS(app)  # 启用CORS
+# 所有路由注册在蓝图上，由 create_app() 装配成应用
+api = Blueprint('arena', __name__)
 
-# AI实例
-simple_ai = SimpleAI()
-advanced_ai = TicTacToeAI(difficulty="hard")
+# AI实例（引擎按 config.json 的 game 段选择，各请求共用）
+arena_ai = create_ai_from_config()
 
 
-@app.route('/')
+@api.before_app_request
+def _start_timer():
+    g.request_started = time.perf_counter()
+
+
+@api.after_app_request
+def _observe_latency(response):
+    """按路由模板记录耗时，避免每个 game_id 产生一个标签"""
+    started = g.get('request_started')
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        REQUEST_SECONDS.observe(time.perf_counter() - started, route, request.method)
+    return response
+
+
+def _tracked_stream(stream: str, generator):
+    """在推送期间计入连接数"""
+    with SSE_CONNECTIONS.track(stream):
+        yield from generator
+
+
+def _rejected(error: AdmissionRejected):
+    """准入控制拒绝：429（单客户端超限）/ 503（全局超限），带 Retry-After"""
+    response = jsonify(error.payload())
+    response.status_code = error.status
+    response.headers.update(error.headers())
+    return response
+
+
+def _stream_response(stream: str, generator):
+    """
+    占用一个推送连接名额并返回 SSE 响应，名额在连接关闭时归还
+    名额不足时直接返回 429/503，不占用推送线程
+    """
+    client = request.remote_addr or 'unknown'
+    try:
+        stream_budget.acquire(client)
+    except AdmissionRejected as e:
+        sse_logger.warning("拒绝推送连接", extra=fields(client=client, stream=stream, status=e.status))
+        return _rejected(e)
+    response = Response(
+        stream_with_context(_tracked_stream(stream, generator)),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no',
+            'Connection': 'keep-alive'
+        }
+    )
+    response.call_on_close(lambda: stream_budget.release(client))
+    return response
+
+
+@api.route('/')
 def index():
     """
-    主页 - 返回index.html
+    主页 - 返回index.html（其中的资源地址已带指纹）
     """
-    return send_from_directory(BASE_DIR, 'index.html')
+    if current_app.debug:
+        static_assets.reload_if_changed()
+    return _asset_response(static_assets.index, fingerprinted=False)
 
 
-@app.route('/api/game/create', methods=['POST'])
+@api.route('/api/game/create', methods=['POST'])
 def create_game():
     """
     创建新游戏
@@ -55,7 +112,17 @@ def create_game():
         player_x_type = data.get('player_x_type', 'human')
         player_o_type = data.get('player_o_type', 'human')
         
-        game = game_manager.create_game(player_x_type, player_o_type)
+        rl_model, rl_error = validate_rl_request(player_x_type, player_o_type, data.get('rl_model'))
+        if rl_error:
+            return jsonify({
+                "status": "error",
+                "message": rl_error
+            }), 400
+        
+        game = game_manager.create_game(player_x_type, player_o_type, rl_model)
+        
+        if rl_model:
+            rl_batcher.schedule_if_needed(game)
         
         logger.info(f"创建游戏成功: {game.game_id}")
         
@@ -73,12 +140,38 @@ def create_game():
         }), 500
 
 
-@app.route('/api/game/<game_id>/state', methods=['GET'])
+def _with_etag(response, etag):
+    """附加 ETag，并要求客户端缓存每次都重新验证"""
+    if etag:
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'no-cache'
+        response.headers['Vary'] = 'Accept'
+    return response
+
+
+def _not_modified(etag):
+    """304 Not Modified"""
+    return _with_etag(Response(status=304), etag)
+
+
+@api.route('/api/game/<game_id>/state', methods=['GET'])
 def get_game_state(game_id):
     """
     获取游戏状态
+    带 since=<版本号> 时为长轮询：最多等待 wait 秒直到版本号超过 since，超时返回 304
     """
     try:
+        since = request.args.get('since', type=int)
+        wait = min(max(request.args.get('wait', 0.0, type=float), 0.0), MAX_STATE_WAIT)
+        if since is not None and wait > 0:
+            # 长轮询同样占用一个请求线程，计入推送连接名额
+            client = request.remote_addr or 'unknown'
+            try:
+                with stream_budget.slot(client):
+                    game_manager.wait_for_version(game_id, since, wait)
+            except AdmissionRejected as e:
+                return _rejected(e)
+        
         game = game_manager.get_game(game_id)
         if not game:
             return jsonify({
@@ -86,10 +179,22 @@ def get_game_state(game_id):
                 "message": "游戏不存在"
             }), 404
         
-        return jsonify({
-            "status": "success",
-            "game_state": game.get_state()
-        })
+        # 局面未变化时只比较请求头，不构建和序列化状态
+        binary = state_codec.wants_binary(request.args.get('format'), request.headers.get('Accept'))
+        etag = version_etag(game, 'bin') if binary else version_etag(game)
+        if since is not None and game.version <= since:
+            return _not_modified(etag)
+        if request.if_none_match.contains_weak(etag):
+            return _not_modified(etag)
+        
+        if binary:
+            response = Response(state_codec.pack_state(game), mimetype=state_codec.MIME_TYPE)
+        else:
+            response = jsonify({
+                "status": "success",
+                "game_state": game.get_state()
+            })
+        return _with_etag(response, etag)
     except Exception as e:
         logger.error(f"获取游戏状态失败: {str(e)}")
         return jsonify({
@@ -98,7 +203,7 @@ def get_game_state(game_id):
         }), 500
 
 
-@app.route('/api/game/<game_id>/move', methods=['POST'])
+@api.route('/api/game/<game_id>/move', methods=['POST'])
 def make_move(game_id):
     """
     下棋
@@ -118,7 +223,8 @@ def make_move(game_id):
         result = game_manager.make_move(game_id, row, col, player)
         
         if result["status"] == "success":
-            logger.info(f"游戏 {game_id}: 玩家移动到 ({row}, {col})")
+            move_logger.info("玩家落子", extra=fields(game_id=game_id, row=row, col=col))
+            rl_batcher.schedule_if_needed(game_manager.get_game(game_id))
             return jsonify(result)
         else:
             return jsonify(result), 400
@@ -131,7 +237,81 @@ def make_move(game_id):
         }), 500
 
 
-@app.route('/api/game/<game_id>/ai-move', methods=['POST'])
+@api.route('/api/game/<game_id>/move-and-reply', methods=['POST'])
+def move_and_reply(game_id):
+    """
+    下棋并让内置AI立即回应，一次请求返回最终局面
+    """
+    try:
+        data = request.json
+        row = data.get('row')
+        col = data.get('col')
+        player = data.get('player_id')
+        
+        if row is None or col is None:
+            return jsonify({
+                "status": "error",
+                "message": "缺少行列参数"
+            }), 400
+        
+        result = game_manager.make_move_and_reply(game_id, row, col, arena_ai, player)
+        
+        if result["status"] == "success":
+            rl_batcher.schedule_if_needed(game_manager.get_game(game_id))
+            return jsonify(result)
+        else:
+            status_code = 404 if result.get("message") == "游戏不存在" else 400
+            return jsonify(result), status_code
+            
+    except Exception as e:
+        logger.error(f"下棋失败: {str(e)}")
+        return jsonify({
+            "status": "error",
+            "message": str(e)
+        }), 500
+
+
+@api.route('/api/moves', methods=['POST'])
+def bulk_moves():
+    """
+    批量下棋：一次请求为多局游戏各走一步
+    """
+    try:
+        data = request.json
+        moves = data.get('moves') if isinstance(data, dict) else data
+        
+        if not isinstance(moves, list):
+            return jsonify({
+                "status": "error",
+                "message": "缺少moves列表"
+            }), 400
+        if len(moves) > MAX_BULK_MOVES:
+            return jsonify({
+                "status": "error",
+                "message": f"单次最多提交 {MAX_BULK_MOVES} 步"
+            }), 400
+        
+        results = game_manager.make_moves(moves, arena_ai)
+        for item in results:
+            if item["status"] == "success":
+                rl_batcher.schedule_if_needed(game_manager.get_game(item["game_id"]))
+        
+        return jsonify({
+            "status": "success",
+            "results": results,
+            "count": len(results),
+            "succeeded": sum(1 for item in results if item["status"] == "success")
+        })
+            
+    except Exception as e:
+        logger.error(f"批量下棋失败: {str(e)}")
+        return jsonify({
+            "status": "error",
+            "message": str(e)
+        }), 500
+
+
+@api.route('/api/game/<game_id>/ai-move', methods=['POST'])
 def ai_move(game_id):
     """
     AI下棋
@@ -157,7 +337,8 @@ def ai_move(game_id):
             }), 400
         
         # 获取AI移动
-        move = simple_ai.get_best_move(game)
+        with AI_DECISION_SECONDS.time(type(arena_ai).__name__):
+            move = arena_ai.get_best_move(game)
         
         if move is None:
             return jsonify({
@@ -169,7 +350,8 @@ def ai_move(game_id):
         result = game_manager.make_move(game_id, row, col)
         
         if result["status"] == "success":
-            logger.info(f"游戏 {game_id}: AI移动到 ({row}, {col})")
+            move_logger.info("AI落子", extra=fields(game_id=game_id, row=row, col=col))
+            rl_batcher.schedule_if_needed(game_manager.get_game(game_id))
             return jsonify(result)
         else:
             return jsonify(result), 400
@@ -182,7 +364,7 @@ def ai_move(game_id):
         }), 500
 
 
-@app.route('/api/game/<game_id>/timeline', methods=['GET'])
+@api.route('/api/game/<game_id>/timeline', methods=['GET'])
 def game_timeline(game_id):
     """获取整局对弈时间线（只在游戏结束后可用）"""
     try:
@@ -195,12 +377,23 @@ def game_timeline(game_id):
         except ValueError:
             replay_speed = 1.0
 
+        binary = state_codec.wants_binary(request.args.get('format'), request.headers.get('Accept'))
+        game = game_manager.get_game(game_id)
+        etag = None
+        if game:
+            etag = version_etag(game, 'bin') if binary else version_etag(game, replay_speed)
+        if etag and request.if_none_match.contains_weak(etag):
+            return _not_modified(etag)
+
         result = game_manager.get_timeline(game_id)
         if result.get('status') == 'success':
+            if binary:
+                response = Response(state_codec.pack_timeline(game), mimetype=state_codec.MIME_TYPE)
+                return _with_etag(response, etag), 200
             # 注入回放速度
             if 'timeline' in result:
                 result['timeline']['replay_speed'] = replay_speed
-            return jsonify(result), 200
+            return _with_etag(jsonify(result), etag), 200
         else:
             return jsonify(result), 400
     except Exception as e:
@@ -208,7 +401,7 @@ def game_timeline(game_id):
         return jsonify({"status": "error", "message": str(e)}), 500
 
 
-@app.route('/api/game/<game_id>/timeline-stream')
+@api.route('/api/game/<game_id>/timeline-stream')
 def game_timeline_stream(game_id):
     """SSE：阻塞直到游戏结束后一次性推送 timeline"""
     def generate():
@@ -238,8 +431,7 @@ def game_timeline_stream(game_id):
                     yield f"data: {json.dumps({'type': 'error', 'message': result.get('message', '无法获取timeline')})}\n\n"
                 return
 
-            last_heartbeat = time.time()
-            # 轮询直到结束
+            # 等待游戏的完成事件，超时只用于发送心跳（每5秒）
             while True:
                 game = game_manager.get_game(game_id)
                 if not game:
@@ -255,33 +447,27 @@ def game_timeline_stream(game_id):
                     else:
                         yield f"data: {json.dumps({'type': 'error', 'message': result.get('message', '无法获取timeline')})}\n\n"
                     break
-                # 心跳每5秒
-                now = time.time()
-                if now - last_heartbeat > 5:
+                if not game_manager.wait_for_completion(game_id, timeout=5):
                     yield f": heartbeat\n\n"
-                    last_heartbeat = now
-                time.sleep(0.2)
         except GeneratorExit:
             logger.info(f"timeline-stream 连接关闭: {game_id}")
         except Exception as e:
             logger.error(f"timeline-stream 错误: {e}")
             yield f"data: {json.dumps({'type': 'error', 'message': str(e)})}\n\n"
 
-    return Response(
-        stream_with_context(generate()),
-        mimetype='text/event-stream',
-        headers={
-            'Cache-Control': 'no-cache',
-            'X-Accel-Buffering': 'no',
-            'Connection': 'keep-alive'
-        }
-    )
+    return _stream_response('timeline', generate())
 
 
-@app.route('/api/timelines-stream')
+@api.route('/api/timelines-stream')
 def global_timelines_stream():
-    """SSE：连续推送每一个已结束游戏的完整timeline（包含game_id）"""
+    """
+    SSE：连续推送每一个已结束游戏的完整timeline（包含game_id）
+    按结束日志的序号推进游标，支持 Last-Event-ID 断线续传
+    """
+    cursor = _parse_last_event_id()
+
     def generate():
+        nonlocal cursor
         try:
             replay_speed_raw = request.args.get('replay_speed', '1.0')
             try:
@@ -291,54 +477,38 @@ def global_timelines_stream():
             except ValueError:
                 replay_speed = 1.0
 
-            sent_ids = set()  # 已推送的游戏ID，避免重复
-            last_heartbeat = time.time()
             yield f"data: {json.dumps({'type': 'connected', 'mode': 'global_timelines'})}\n\n"
 
             while True:
-                # 获取所有已结束但未推送的游戏
-                finished_ids = game_manager.get_finished_game_ids()
-                new_ids = [gid for gid in finished_ids if gid not in sent_ids]
-                for gid in new_ids:
-                    result = game_manager.get_timeline(gid)
-                    if result.get('status') == 'success':
-                        timeline = result['timeline']
-                        timeline['replay_speed'] = replay_speed
-                        payload = {
-                            'type': 'timeline',
-                            'game_id': gid,
-                            'timeline': timeline
-                        }
-                        yield f"data: {json.dumps(payload, ensure_ascii=False)}\n\n"
-                        sent_ids.add(gid)
-                    else:
-                        err_payload = {'type': 'error', 'game_id': gid, 'message': result.get('message', '无法获取timeline')}
-                        yield f"data: {json.dumps(err_payload, ensure_ascii=False)}\n\n"
-
-                # 心跳保持连接（每10秒）
-                now = time.time()
-                if now - last_heartbeat > 10:
+                # 阻塞等待新的结束记录，超时发送心跳保持连接（每10秒）
+                entries = game_manager.wait_for_finished(cursor, timeout=10)
+                if not entries:
                     yield f": heartbeat\n\n"
-                    last_heartbeat = now
-                time.sleep(1.0)
+                    continue
+                for entry in entries:
+                    yield entry.encode(replay_speed)
+                    cursor = entry.seq
         except GeneratorExit:
             logger.info("global timelines 流连接关闭")
         except Exception as e:
             logger.error(f"global timelines 流错误: {e}")
             yield f"data: {json.dumps({'type': 'error', 'message': str(e)})}\n\n"
 
-    return Response(
-        stream_with_context(generate()),
-        mimetype='text/event-stream',
-        headers={
-            'Cache-Control': 'no-cache',
-            'X-Accel-Buffering': 'no',
-            'Connection': 'keep-alive'
-        }
-    )
+    return _stream_response('timelines', generate())
+
 
+def _parse_last_event_id() -> int:
+    """
+    读取 SSE 断线续传游标（Last-Event-ID 头或 last_event_id 参数）
+    """
+    raw = request.headers.get('Last-Event-ID') or request.args.get('last_event_id') or '0'
+    try:
+        return max(0, int(raw))
+    except ValueError:
+        return 0
 
-@app.route('/api/game/<game_id>/reset', methods=['POST'])
+
+@api.route('/api/game/<game_id>/reset', methods=['POST'])
 def reset_game(game_id):
     """
     重置游戏
@@ -348,6 +518,7 @@ def reset_game(game_id):
         
         if result["status"] == "success":
             logger.info(f"重置游戏: {game_id}")
+            rl_batcher.schedule_if_needed(game_manager.get_game(game_id))
             return jsonify(result)
         else:
             return jsonify(result), 404
@@ -360,28 +531,35 @@ def reset_game(game_id):
         }), 500
 
 
-@app.route('/api/game/<game_id>/events')
+@api.route('/api/game/<game_id>/events')
 def game_events(game_id):
     """
     SSE事件流
-    实时推送游戏更新
+    实时推送游戏更新；每个连接按自己的游标读取事件日志，多个观战者互不影响
+    断线重连带 Last-Event-ID 时从该序号之后继续推送
     """
+    resume = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    cursor = _parse_last_event_id() if resume else None
+
     def generate():
         """生成SSE事件流"""
+        nonlocal cursor
         try:
-            # 验证游戏存在
-            game = game_manager.get_game(game_id)
-            if not game:
+            # 验证游戏存在，同时取得一致的局面和游标
+            subscription = game_manager.subscribe_events(game_id)
+            if subscription is None:
                 yield f"data: {json.dumps({'type': 'error', 'message': '游戏不存在'})}\n\n"
                 return
             
             # 发送初始连接成功消息
             yield f"data: {json.dumps({'type': 'connected', 'game_id': game_id})}\n\n"
             
-            # 发送当前游戏状态
-            yield f"data: {json.dumps({'type': 'state_update', 'game_state': game.get_state()})}\n\n"
+            # 新连接发送当前游戏状态，之后只推送游标之后的事件
+            if cursor is None:
+                state, cursor = subscription
+                yield state_update_frame(state, cursor)
             
-            # 持续监听事件
+            # 持续监听事件：阻塞等待新事件，空闲时只按心跳间隔醒来
             while True:
                 # 检查游戏是否还存在
                 game = game_manager.get_game(game_id)
@@ -389,84 +567,57 @@ def game_events(game_id):
                     yield f"data: {json.dumps({'type': 'game_deleted'})}\n\n"
                     break
                 
-                # 获取待发送的事件
-                events = game_manager.get_events(game_id)
+                # 获取游标之后的事件
+                events, missed = game_manager.wait_for_events(game_id, cursor, timeout=SSE_HEARTBEAT_INTERVAL)
                 
-                if events:
-                    print(f"📡 SSE推送 {len(events)} 个事件到 [{game_id[:8]}...]")
+                if missed:
+                    # 落后太多（事件已被覆盖）或游标无效：重发当前局面，从最新序号继续
+                    subscription = game_manager.subscribe_events(game_id)
+                    if subscription is not None:
+                        state, cursor = subscription
+                        yield state_update_frame(state, cursor)
+                    continue
                 
-                for event in events:
-                    event_type = event.get('type')
-                    player = event.get('player', 'N/A')
-                    print(f"  → type={event_type}, player={player}")
-                    event_data = json.dumps(event)
-                    yield f"data: {event_data}\n\n"
+                if not events:
+                    # 超时才发心跳；被删除唤醒时回到循环开头发送 game_deleted
+                    if game_manager.get_game(game_id):
+                        yield f": heartbeat\n\n"
+                    continue
                 
-                # 发送心跳包（每30秒）
-                yield f": heartbeat\n\n"
+                if sse_logger.isEnabledFor(logging.DEBUG):
+                    sse_logger.debug("SSE推送", extra=fields(
+                        game_id=game_id, count=len(events), types=[event.type for event in events]
+                    ))
                 
-                # 短暂休眠，避免CPU占用过高
-                time.sleep(0.5)
+                # 事件在入日志时已编码，所有连接共享同一段文本
+                for event in events:
+                    yield event.frame
+                cursor = events[-1].seq
                 
         except GeneratorExit:
-            logger.info(f"客户端断开SSE连接: {game_id}")
+            sse_logger.info("客户端断开SSE连接", extra=fields(game_id=game_id))
         except Exception as e:
             logger.error(f"SSE事件流错误: {str(e)}")
             yield f"data: {json.dumps({'type': 'error', 'message': str(e)})}\n\n"
     
-    return Response(
-        stream_with_context(generate()),
-        mimetype='text/event-stream',
-        headers={
-            'Cache-Control': 'no-cache',
-            'X-Accel-Buffering': 'no',
-            'Connection': 'keep-alive'
-        }
-    )
+    return _stream_response('events', generate())
 
 
-@app.route('/api/games', methods=['GET'])
+@api.route('/api/games', methods=['GET'])
 def list_games():
     """
-    列出所有游戏
-    可选参数: status=in_progress 只返回进行中的游戏
+    列出游戏（按创建顺序分页，走二级索引，不构建完整状态）
+    过滤: status / player_x_type / player_o_type / player_type / move_count
+    分页: limit、cursor（上一页返回的 next_cursor）
+    投影: fields=game_id,status,...
     """
     try:
-        status_filter = request.args.get('status', None)
-        
-        all_games = game_manager.get_all_games()
-        
-        # 如果指定了状态过滤
-        if status_filter:
-            filtered_games = {
-                game_id: game 
-                for game_id, game in all_games.items() 
-                if game.get('status') == status_filter
-            }
-        else:
-            filtered_games = all_games
-        
-        # 添加更多有用的信息
-        games_with_info = {}
-        for game_id, game in filtered_games.items():
-            games_with_info[game_id] = {
-                'game_id': game_id,
-                'status': game['status'],
-                'player_x_type': game['player_x_type'],
-                'player_o_type': game['player_o_type'],
-                'current_player': game['current_player'],
-                'move_count': game['move_count'],
-                'winner': game['winner'],
-                'created_at': game['created_at'],
-                'updated_at': game['updated_at']
-            }
-        
+        return jsonify(game_manager.query_games(request.args.to_dict()))
+    except ValueError as e:
         return jsonify({
-            "status": "success",
-            "games": games_with_info,
-            "count": len(games_with_info),
-            "total_games": len(all_games)
-        })
+            "status": "error",
+            "message": str(e)
+        }), 400
     except Exception as e:
         logger.error(f"获取游戏列表失败: {str(e)}")
         return jsonify({
@@ -475,7 +626,7 @@ def list_games():
         }), 500
 
 
-@app.route('/api/game/<game_id>', methods=['DELETE'])
+@api.route('/api/game/<game_id>', methods=['DELETE'])
 def delete_game(game_id):
     """
     删除游戏
@@ -503,7 +654,7 @@ def delete_game(game_id):
         }), 500
 
 
-@app.route('/api/health', methods=['GET'])
+@api.route('/api/health', methods=['GET'])
 def health_check():
     """
     健康检查
@@ -512,26 +663,51 @@ def health_check():
         "status": "healthy",
         "service": "Tic-Tac-Toe Arena",
         "version": "1.0.0",
-        "active_games": len(game_manager.games)
+        "active_games": len(game_manager.games),
+        "streams": stream_budget.stats()
     })
 
 
+@api.route('/metrics', methods=['GET'])
+def metrics():
+    """
+    Prometheus 指标
+    """
+    return Response(arena_metrics.render(), content_type=arena_metrics.CONTENT_TYPE)
+
+
 # 静态文件路由
-@app.route('/static/<path:filename>')
+@api.route('/static/<path:filename>')
 def serve_static(filename):
     """
-    提供静态文件，带正确的MIME类型
+    提供静态文件：内存中的预压缩版本，带指纹的地址永久缓存，原地址按 ETag 验证
     """
-    mime_type = mimetypes.guess_type(filename)[0]
-    return send_from_directory(
-        os.path.join(BASE_DIR, 'static'), 
-        filename,
-        mimetype=mime_type
-    )
+    if current_app.debug:
+        static_assets.reload_if_changed()
+    asset, fingerprinted = static_assets.get('/static/' + filename)
+    if asset is None:
+        return jsonify({"status": "error", "message": "文件不存在"}), 404
+    return _asset_response(asset, fingerprinted)
+
+
+def _asset_response(asset, fingerprinted):
+    body, encoding = asset.select(request.headers.get('Accept-Encoding'))
+    etag = asset.etag(encoding)
+    headers = {
+        'ETag': etag,
+        'Cache-Control': IMMUTABLE_CACHE_CONTROL if fingerprinted else REVALIDATE_CACHE_CONTROL,
+        'Vary': 'Accept-Encoding'
+    }
+    # 逐个比较 If-None-Match 列表中的标签（弱比较，支持 *），而不是在整个请求头里找子串
+    if request.if_none_match.contains_weak(etag.strip('"')):
+        return Response(status=304, headers=headers)
+    if encoding:
+        headers['Content-Encoding'] = encoding
+    return Response(body, content_type=asset.content_type, headers=headers)
 
 
 # 错误处理
-@app.errorhandler(404)
+@api.app_errorhandler(404)
 def not_found(error):
     return jsonify({
         "status": "error",
@@ -539,7 +715,7 @@ def not_found(error):
     }), 404
 
 
-@app.errorhandler(500)
+@api.app_errorhandler(500)
 def internal_error(error):
     logger.error(f"内部服务器错误: {str(error)}")
     return jsonify({
@@ -567,14 +743,30 @@ def cleanup_games_background():
             logger.error(f"游戏清理失败: {str(e)}")
 
 
+def create_app(config: Optional[Dict] = None) -> Flask:
+    """
+    创建Flask应用
+    :param config: 写入 app.config 的配置项（如 {'TESTING': True}）
+    """
+    # 静态文件由 static_assets 从内存提供，不使用 Flask 自带的静态路由
+    app = Flask(__name__, static_folder=None)
+    app.config.update(config or {})
+    CORS(app)  # 启用CORS
+    app.register_blueprint(api)
+    return app
+
+
 if __name__ == '__main__':
+    # 开发服务器；生产环境请使用 python arena_server.py
+    from arena_server import load_server_config
+    server = load_server_config()
     logger.info("启动井字棋决斗场服务器...")
-    logger.info("访问 http://localhost:5000 开始游戏")
+    logger.info(f"访问 http://localhost:{server['port']} 开始游戏")
     
     # 启动后台清理线程
     cleanup_thread = Thread(target=cleanup_games_background, daemon=True)
     cleanup_thread.start()
     logger.info("已启动游戏清理后台线程")
     
-    app.run(host='0.0.0.0', port=5000, debug=True, threaded=True)
+    create_app().run(host=server['host'], port=server['port'], debug=server['debug'], threaded=True)
 
@@ -0,0 +1,194 @@
+"""
+结构化日志
+所有日志记录先进入有界队列，由后台线程统一格式化和输出，请求线程只做一次入队；
+热路径（每步落子、每个事件、每次SSE推送）使用独立的分类 logger，可以单独设置级别和采样率。
+
+分类（logger 名称为 arena.<分类>）：
+    moves   每一步落子 / AI落子
+    events  事件入队
+    sse     SSE 推送与连接
+    http    请求耗时
+
+config.json 中的 logging 段：
+    "logging": {
+        "level": "INFO",
+        "format": "text",                      # text 或 json
+        "categories": {"events": "WARNING"},   # 分类或模块 logger 的级别
+        "sample": {"moves": 0.1}               # INFO 及以下按比例采样，WARNING 以上不采样
+    }
+
+记录结构化字段：
+    move_logger.info("落子", extra=fields(game_id=game_id, row=row, col=col))
+"""
+import atexit
+import itertools
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+from typing import Dict, Optional
+
+CATEGORY_PREFIX = 'arena.'
+DEFAULT_QUEUE_SIZE = 10000
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+_listener: Optional[logging.handlers.QueueListener] = None
+_queue_handler: Optional["DroppingQueueHandler"] = None
+_setup_lock = threading.Lock()
+
+
+def get_logger(category: str) -> logging.Logger:
+    """获取分类 logger（arena.<category>）"""
+    return logging.getLogger(CATEGORY_PREFIX + category)
+
+
+def fields(**kwargs) -> Dict:
+    """把结构化字段包装成 logging 的 extra 参数"""
+    return {'fields': kwargs}
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """队列满时丢弃记录并计数，绝不阻塞请求线程"""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class SamplingFilter(logging.Filter):
+    """
+    计数采样：每 N 条 INFO 及以下级别的记录只保留 1 条，WARNING 以上全部保留
+    用计数而不是随机数，开销只有一次自增
+    """
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.every = max(1, round(1.0 / rate)) if rate > 0 else 0
+        self._counter = itertools.count()
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+        if self.every == 0:
+            return False
+        return next(self._counter) % self.every == 0
+
+
+class StructuredFormatter(logging.Formatter):
+    """在文本日志后追加 key=value 字段，或输出一行 JSON"""
+
+    def __init__(self, fmt: str = TEXT_FORMAT, json_lines: bool = False):
+        super().__init__(fmt)
+        self.json_lines = json_lines
+
+    def format(self, record):
+        extra = getattr(record, 'fields', None)
+        if self.json_lines:
+            payload = {
+                'time': self.formatTime(record),
+                'level': record.levelname,
+                'logger': record.name,
+                'message': record.getMessage(),
+            }
+            if extra:
+                payload.update(extra)
+            if record.exc_info:
+                payload['exc_info'] = self.formatException(record.exc_info)
+            return json.dumps(payload, ensure_ascii=False, default=str)
+        text = super().format(record)
+        if extra:
+            text += ' ' + ' '.join(f'{key}={value}' for key, value in extra.items())
+        return text
+
+
+def setup_logging(level: str = 'INFO', categories: Optional[Dict[str, str]] = None,
+                  sample: Optional[Dict[str, float]] = None, json_lines: bool = False,
+                  queue_size: int = DEFAULT_QUEUE_SIZE, stream=None):
+    """
+    配置根 logger：QueueHandler -> 后台 QueueListener -> StreamHandler
+    重复调用会替换之前的配置
+    :param categories: {分类或 logger 名称: 级别}
+    :param sample: {分类或 logger 名称: 采样率(0-1)}
+    """
+    global _listener, _queue_handler
+    with _setup_lock:
+        root = logging.getLogger()
+        if _listener is not None:
+            _listener.stop()
+            root.removeHandler(_queue_handler)
+        else:
+            # 替换 basicConfig 等之前添加的同步 handler
+            for handler in list(root.handlers):
+                root.removeHandler(handler)
+
+        output = logging.StreamHandler(stream or sys.stderr)
+        output.setFormatter(StructuredFormatter(json_lines=json_lines))
+
+        log_queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        _queue_handler = DroppingQueueHandler(log_queue)
+        _listener = logging.handlers.QueueListener(log_queue, output, respect_handler_level=False)
+        _listener.start()
+
+        root.addHandler(_queue_handler)
+        root.setLevel(level.upper())
+
+        for name, category_level in (categories or {}).items():
+            _resolve(name).setLevel(category_level.upper())
+        for name, rate in (sample or {}).items():
+            target = _resolve(name)
+            for existing in [f for f in target.filters if isinstance(f, SamplingFilter)]:
+                target.removeFilter(existing)
+            target.addFilter(SamplingFilter(float(rate)))
+
+
+def setup_logging_from_config(path: Optional[str] = None):
+    """读取 config.json 的 logging 段（缺省时使用 features.log_level）"""
+    path = path or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'config.json')
+    config = {}
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            config = json.load(f)
+    except (OSError, ValueError):
+        pass
+    section = config.get('logging', {})
+    level = section.get('level') or config.get('features', {}).get('log_level', 'INFO')
+    setup_logging(
+        level=level,
+        categories=section.get('categories'),
+        sample=section.get('sample'),
+        json_lines=section.get('format') == 'json',
+        queue_size=section.get('queue_size', DEFAULT_QUEUE_SIZE)
+    )
+
+
+def dropped_records() -> int:
+    """队列满被丢弃的日志条数"""
+    return _queue_handler.dropped if _queue_handler is not None else 0
+
+
+def shutdown_logging():
+    """停止后台线程并输出队列中剩余的记录"""
+    global _listener
+    with _setup_lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
+
+
+def _resolve(name: str) -> logging.Logger:
+    # 已知分类名映射到 arena.<分类>，其余按模块 logger 名称处理
+    if name in ('moves', 'events', 'sse', 'http'):
+        return get_logger(name)
+    return logging.getLogger(name)
+
+
+atexit.register(shutdown_logging)
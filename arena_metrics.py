@@ -0,0 +1,249 @@
+"""
+Prometheus 格式的运行指标
+计数器、仪表和直方图按线程分片：每个线程只写自己的分片，写入路径没有锁；
+/metrics 抓取时才加锁汇总，已退出线程的分片并入归档，分片数量随存活线程数而不是请求数增长。
+
+    MOVES.inc('ai')
+    with AI_DECISION_SECONDS.time('SimpleAI'):
+        move = ai.get_best_move(game)
+    print(render())
+"""
+import abc
+import bisect
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Sequence, Tuple
+
+# 请求与AI决策耗时的默认分桶（秒）
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+_REGISTRY: List["_Metric"] = []
+
+
+def _merge(total: Dict, source: Dict):
+    """逐元素累加分片数据"""
+    for labels, cell in source.items():
+        current = total.get(labels)
+        if current is None:
+            total[labels] = list(cell)
+        else:
+            for index, value in enumerate(cell):
+                current[index] += value
+
+
+class _ThreadShards:
+    """每个线程一份 {标签: 数值列表} 分片"""
+
+    def __init__(self):
+        self._local = threading.local()
+        self._shards: List[Tuple[threading.Thread, Dict]] = []
+        self._retired: Dict = {}
+        self._lock = threading.Lock()
+
+    def shard(self) -> Dict:
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            shard = {}
+            self._local.shard = shard
+            with self._lock:
+                self._shards.append((threading.current_thread(), shard))
+        return shard
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            alive = []
+            for thread, shard in self._shards:
+                if thread.is_alive():
+                    alive.append((thread, shard))
+                else:
+                    # 线程已退出，分片不会再被写入
+                    _merge(self._retired, shard)
+            self._shards = alive
+            total: Dict = {}
+            _merge(total, self._retired)
+            for _, shard in alive:
+                _merge(total, dict(shard))
+        return total
+
+
+class _Metric(abc.ABC):
+    kind = 'untyped'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        _REGISTRY.append(self)
+
+    def _label_text(self, labels: Tuple, extra: str = '') -> str:
+        pairs = [f'{name}="{_escape(value)}"' for name, value in zip(self.labelnames, labels)]
+        if extra:
+            pairs.append(extra)
+        return '{' + ','.join(pairs) + '}' if pairs else ''
+
+    @abc.abstractmethod
+    def samples(self) -> List[str]:
+        """指标的样本行（不含 HELP/TYPE）"""
+
+    def render(self) -> str:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        lines.extend(self.samples())
+        return '\n'.join(lines)
+
+
+class Counter(_Metric):
+    """单调递增计数器"""
+
+    kind = 'counter'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._shards = _ThreadShards()
+
+    def inc(self, *labels, amount: float = 1):
+        shard = self._shards.shard()
+        cell = shard.get(labels)
+        if cell is None:
+            shard[labels] = [amount]
+        else:
+            cell[0] += amount
+
+    def values(self) -> Dict[Tuple, float]:
+        return {labels: cell[0] for labels, cell in self._shards.snapshot().items()}
+
+    def samples(self) -> List[str]:
+        return [f'{self.name}{self._label_text(labels)} {_number(value)}'
+                for labels, value in sorted(self.values().items())]
+
+
+class Gauge(Counter):
+    """可增可减的仪表（如当前连接数）"""
+
+    kind = 'gauge'
+
+    def add(self, amount: float, *labels):
+        self.inc(*labels, amount=amount)
+
+    @contextmanager
+    def track(self, *labels):
+        """进入时 +1，退出时 -1"""
+        self.add(1, *labels)
+        try:
+            yield
+        finally:
+            self.add(-1, *labels)
+
+
+class CallbackGauge(_Metric):
+    """抓取时调用函数取值的仪表，函数返回数值或 {标签元组: 数值}"""
+
+    kind = 'gauge'
+
+    def __init__(self, name: str, documentation: str, callback: Callable, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self.callback = callback
+
+    def samples(self) -> List[str]:
+        try:
+            value = self.callback()
+        except Exception:
+            return []
+        if value is None:
+            return []
+        if not isinstance(value, dict):
+            value = {(): value}
+        return [f'{self.name}{self._label_text(labels)} {_number(number)}'
+                for labels, number in sorted(value.items())]
+
+
+class Histogram(_Metric):
+    """预先分桶的直方图；分片中每个标签保存 [各桶计数..., +Inf计数, 总和, 次数]"""
+
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._shards = _ThreadShards()
+
+    def observe(self, value: float, *labels):
+        shard = self._shards.shard()
+        cell = shard.get(labels)
+        if cell is None:
+            cell = [0] * (len(self.buckets) + 3)
+            shard[labels] = cell
+        cell[bisect.bisect_left(self.buckets, value)] += 1
+        cell[-2] += value
+        cell[-1] += 1
+
+    @contextmanager
+    def time(self, *labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, *labels)
+
+    def samples(self) -> List[str]:
+        lines = []
+        for labels, cell in sorted(self._shards.snapshot().items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), cell):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else _number(bound)
+                bucket_labels = self._label_text(labels, f'le="{le}"')
+                lines.append(f'{self.name}_bucket{bucket_labels} {cumulative}')
+            lines.append(f'{self.name}_sum{self._label_text(labels)} {_number(cell[-2])}')
+            lines.append(f'{self.name}_count{self._label_text(labels)} {cell[-1]}')
+        return lines
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _number(value: float) -> str:
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def _process_rss_bytes():
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError, AttributeError):
+        try:
+            import resource
+            # 非 Linux 平台退化为峰值 RSS（macOS 单位为字节，其余为KB）
+            peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            return peak if os.uname().sysname == 'Darwin' else peak * 1024
+        except (ImportError, AttributeError):
+            return None
+
+
+def _log_dropped():
+    from arena_logging import dropped_records
+    return dropped_records()
+
+
+def render() -> str:
+    """输出全部指标（Prometheus 文本格式）"""
+    return '\n'.join(metric.render() for metric in _REGISTRY) + '\n'
+
+
+REQUEST_SECONDS = Histogram(
+    'arena_http_request_duration_seconds', 'HTTP请求处理耗时（SSE只计到开始推送）', ('route', 'method'))
+MOVES = Counter('arena_moves_total', '成功落子数（按落子方的玩家类型）', ('player_type',))
+AI_DECISION_SECONDS = Histogram('arena_ai_decision_seconds', 'AI决策耗时（按引擎）', ('engine',))
+SSE_CONNECTIONS = Gauge('arena_stream_connections', '当前推送连接数（按流类型）', ('stream',))
+CLEANUP_SECONDS = Histogram(
+    'arena_cleanup_duration_seconds', '游戏清理耗时', ('kind',),
+    buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0))
+PROCESS_RSS = CallbackGauge('process_resident_memory_bytes', '进程常驻内存（字节）', _process_rss_bytes)
+LOG_DROPPED = CallbackGauge('arena_log_records_dropped', '日志队列满被丢弃的记录数', _log_dropped)
@@ -0,0 +1,292 @@
+"""
+生产环境启动器（Flask 线程模式）
+读取 config.json 的 server 段，用 gunicorn 的 gthread 工作进程运行 app.create_app()：
+    - workers / threads：进程数与每个进程的线程数（每条 SSE 连接占用一个线程）
+    - keepalive：空闲长连接保持的秒数
+    - preload：在主进程里创建应用并预热，再 fork 出工作进程（共享已构建的表，启动更快）
+接受连接前先预热：构建棋盘几何表、加载默认 RL 模型（可用时）、跑一轮自对弈，
+启动日志报告冷启动耗时和稳态吞吐，同时写入 /metrics（arena_startup_seconds、arena_warmup_moves_per_second）。
+
+config.json 中的 server 段：
+    "server": {
+        "host": "0.0.0.0",
+        "port": 5000,
+        "debug": true,          # 只影响 python app.py（开发服务器）
+        "workers": 1,           # 多进程需配合 sqlite 存储和事件总线，见 QUICKSTART.md
+        "threads": 32,
+        "keepalive": 5,
+        "timeout": 30,
+        "preload": true,
+        "warmup_seconds": 0.5
+    }
+
+未安装 gunicorn（如 Windows）时退回 Werkzeug 的多线程服务器：单进程，支持 HTTP/1.1 长连接。
+
+运行：
+    python arena_server.py
+    python arena_server.py --workers 4 --threads 64
+"""
+import time
+
+# 冷启动计时起点：放在其他导入之前
+_BOOT_STARTED = time.perf_counter()
+
+import argparse
+import json
+import logging
+import os
+import random
+from threading import Thread
+from typing import Dict, Optional
+
+try:
+    from gunicorn.app.base import BaseApplication  # 可选依赖：pip install gunicorn（仅 Linux/macOS）
+except ImportError:
+    BaseApplication = None
+
+from arena_logging import setup_logging_from_config
+from arena_metrics import Gauge
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+DEFAULT_SERVER_CONFIG = {
+    "host": "0.0.0.0",
+    "port": 5000,
+    "debug": False,
+    "workers": 1,
+    "threads": 32,
+    "keepalive": 5,
+    "timeout": 30,
+    "preload": True,
+    "warmup_seconds": 0.5
+}
+
+STARTUP_SECONDS = Gauge('arena_startup_seconds', '启动各阶段耗时（秒）', ('phase',))
+WARMUP_THROUGHPUT = Gauge('arena_warmup_moves_per_second', '启动预热测得的稳态吞吐（着法/秒）')
+
+
+def _load_config(path: Optional[str] = None) -> Dict:
+    path = path or os.path.join(BASE_DIR, 'config.json')
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def load_server_config(path: Optional[str] = None) -> Dict:
+    """读取 config.json 的 server 段，缺省项取默认值"""
+    config = dict(DEFAULT_SERVER_CONFIG)
+    config.update(_load_config(path).get('server', {}))
+    return config
+
+
+def warm_up(seconds: float = 0.5) -> Dict:
+    """
+    预热：构建引擎用到的表并跑一轮自对弈
+    自对弈直接驱动 TicTacToeGame + 对局AI + 状态序列化（与请求走同样的代码），
+    不经过 GameManager，不会产生游戏、事件或业务指标
+    :param seconds: 自对弈时长；前一半作为预热，后一半计算稳态吞吐
+    :return: 各项耗时与吞吐
+    """
+    from ai_strategy import create_ai_from_config
+    from game_logic import TicTacToeGame
+    from mnk_board import get_geometry
+    from rl_player import DEFAULT_MODEL, rl_policy_pool
+    import state_codec
+
+    report = {}
+    started = time.perf_counter()
+    get_geometry(3, 3, 3)
+    if rl_policy_pool.resolve(DEFAULT_MODEL) and rl_policy_pool.available(DEFAULT_MODEL):
+        rl_policy_pool.get(DEFAULT_MODEL)
+    else:
+        logger.info("默认RL模型不可用，跳过预加载")
+    report['tables'] = time.perf_counter() - started
+
+    ai = create_ai_from_config()
+    rng_state = random.getstate()
+
+    def play() -> int:
+        game = TicTacToeGame('ai', 'ai')
+        while True:
+            move = ai.get_best_move(game)
+            if move is None:
+                break
+            result = game.make_move(*move)
+            json.dumps(game.get_state())
+            state_codec.pack_state(game)
+            if not result['success'] or result['game_over']:
+                break
+        return game.move_count
+
+    started = time.perf_counter()
+    play()
+    report['first_game'] = time.perf_counter() - started
+
+    # 前一半时间预热，后一半计算稳态吞吐
+    deadline = time.perf_counter() + seconds / 2
+    while time.perf_counter() < deadline:
+        play()
+    moves = 0
+    measured = time.perf_counter()
+    deadline = measured + seconds / 2
+    while time.perf_counter() < deadline:
+        moves += play()
+    report['moves_per_second'] = moves / max(time.perf_counter() - measured, 1e-9)
+    random.setstate(rng_state)
+    return report
+
+
+def build_app(server: Dict):
+    """创建应用并预热，记录冷启动耗时"""
+    started = time.perf_counter()
+    from app import create_app
+    application = create_app()
+    loaded = time.perf_counter()
+    report = warm_up(server['warmup_seconds'])
+    ready = time.perf_counter()
+
+    STARTUP_SECONDS.add(loaded - started, 'load')
+    STARTUP_SECONDS.add(ready - loaded, 'warmup')
+    STARTUP_SECONDS.add(ready - _BOOT_STARTED, 'boot')
+    WARMUP_THROUGHPUT.add(report['moves_per_second'])
+    logger.info(
+        f"冷启动 {(ready - _BOOT_STARTED) * 1000:.0f}ms"
+        f"（加载应用 {(loaded - started) * 1000:.0f}ms, 构建表 {report['tables'] * 1000:.0f}ms, "
+        f"首局 {report['first_game'] * 1000:.1f}ms）, 稳态吞吐 {report['moves_per_second']:.0f} 着法/秒"
+    )
+    return application
+
+
+def start_worker_services(threads: int):
+    """
+    每个工作进程的后台服务：游戏清理线程；推送连接上限不超过线程数的 3/4，留出线程处理普通请求
+    """
+    from admission import stream_budget
+    from app import cleanup_games_background
+
+    Thread(target=cleanup_games_background, daemon=True).start()
+    limit = max(1, threads - max(1, threads // 4))
+    if stream_budget.max_streams > limit:
+        stream_budget.max_streams = limit
+        logger.info(f"推送连接上限按线程数调整为 {limit}")
+
+
+def _check_deployment(server: Dict):
+    if server['workers'] <= 1:
+        return
+    config = _load_config()
+    if config.get('storage', {}).get('backend', 'memory') == 'memory':
+        logger.warning("多个工作进程使用进程内存储：各进程的游戏互不可见，请在 storage 段启用 sqlite")
+    elif not config.get('event_bus', {}).get('enabled'):
+        logger.warning("多个工作进程未启用事件总线：连接在其他进程上的观战者收不到推送")
+
+
+if BaseApplication is not None:
+    class ArenaApplication(BaseApplication):
+        """gunicorn 应用：配置来自 server 段，应用由 create_app() 创建"""
+
+        def __init__(self, server: Dict):
+            self.server = server
+            super().__init__()
+
+        def load_config(self):
+            server = self.server
+            self.cfg.set('bind', f"{server['host']}:{server['port']}")
+            self.cfg.set('workers', server['workers'])
+            self.cfg.set('worker_class', 'gthread')
+            self.cfg.set('threads', server['threads'])
+            self.cfg.set('keepalive', server['keepalive'])
+            self.cfg.set('timeout', server['timeout'])
+            self.cfg.set('preload_app', server['preload'])
+            self.cfg.set('pre_fork', _pre_fork)
+            self.cfg.set('post_fork', _post_fork)
+            self.cfg.set('post_worker_init', _post_worker_init)
+
+        def load(self):
+            return build_app(self.server)
+
+
+def _pre_fork(server, worker):
+    """
+    主进程 fork 之前：preload 时主进程已导入 game_manager，
+    关闭主进程的数据库连接和事件总线连接，工作进程各自重新建立
+    """
+    import sys
+    game_manager_module = sys.modules.get('game_manager')
+    if game_manager_module is None:
+        return
+    manager = game_manager_module.game_manager
+    manager.store.close()
+    if manager.event_bus is not None:
+        manager.event_bus.close()
+        manager.event_bus = None
+
+
+def _post_fork(server, worker):
+    """工作进程：线程不会随 fork 复制，重启日志线程并重新连接事件总线"""
+    import sys
+    worker.forked_at = time.perf_counter()
+    setup_logging_from_config()
+    game_manager_module = sys.modules.get('game_manager')
+    if game_manager_module is not None:
+        from event_bus import event_bus_from_config
+        manager = game_manager_module.game_manager
+        manager.event_bus = event_bus_from_config(manager.apply_bus_message)
+
+
+def _post_worker_init(worker):
+    start_worker_services(worker.cfg.threads)
+    elapsed = time.perf_counter() - worker.forked_at
+    STARTUP_SECONDS.add(elapsed, 'worker')
+    logger.info(f"工作进程 {worker.pid} 就绪，用时 {elapsed * 1000:.0f}ms")
+
+
+def _serve_werkzeug(server: Dict):
+    """未安装 gunicorn 时的单进程多线程服务器"""
+    from werkzeug.serving import WSGIRequestHandler, make_server
+
+    class KeepAliveRequestHandler(WSGIRequestHandler):
+        protocol_version = 'HTTP/1.1'
+        timeout = server['keepalive']
+
+    if server['workers'] > 1:
+        logger.warning("未安装 gunicorn，忽略 workers 配置，以单进程运行")
+    application = build_app(server)
+    start_worker_services(server['threads'])
+    httpd = make_server(server['host'], server['port'], application, threaded=True,
+                        request_handler=KeepAliveRequestHandler)
+    logger.info(f"监听 {server['host']}:{server['port']}（Werkzeug 多线程）")
+    httpd.serve_forever()
+
+
+def main():
+    server = load_server_config()
+    parser = argparse.ArgumentParser(description='井字棋决斗场 - 生产环境启动器')
+    parser.add_argument('--host', default=server['host'])
+    parser.add_argument('--port', type=int, default=server['port'])
+    parser.add_argument('--workers', type=int, default=server['workers'])
+    parser.add_argument('--threads', type=int, default=server['threads'])
+    parser.add_argument('--keepalive', type=int, default=server['keepalive'])
+    parser.add_argument('--no-preload', action='store_true', help='各工作进程分别创建应用并预热')
+    args = parser.parse_args()
+    server.update(host=args.host, port=args.port, workers=args.workers,
+                  threads=args.threads, keepalive=args.keepalive)
+    if args.no_preload:
+        server['preload'] = False
+
+    setup_logging_from_config()
+    _check_deployment(server)
+    logger.info(f"启动井字棋决斗场: {server['workers']} 个进程 × {server['threads']} 个线程, "
+                f"keep-alive {server['keepalive']}s, preload={server['preload']}")
+    if BaseApplication is None:
+        _serve_werkzeug(server)
+    else:
+        ArenaApplication(server).run()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,965 @@
+"""
+ASGI / asyncio 服务模式
+提供与 app.py 相同的API（创建、下棋、AI下棋、状态、事件流、时间线）和页面、静态资源，
+SSE连接是协程而不是线程：GameManager 的事件监听器跨线程唤醒等待中的协程，
+空闲连接只在心跳时醒来，单进程即可承载成千上万条并发流。
+同步的落子、AI 搜索和存储读写放到线程池执行，事件循环只负责等待和推送。
+
+运行：
+    pip install -r requirements-asgi.txt
+    python asgi_app.py
+    # 或 uvicorn asgi_app:app --host 0.0.0.0 --port 5000
+
+外部 Agent 可以通过 WebSocket 端点 /ws/agent 在一条长连接上订阅多局游戏、
+接收 your_turn 推送并直接回传着法（协议见 API.md）。
+"""
+import asyncio
+import functools
+import json
+import logging
+import re
+import time
+from typing import Dict, Optional, Set
+from urllib.parse import parse_qs
+
+from ai_strategy import create_ai_from_config
+from game_logic import GameStatus
+from game_manager import game_manager, MAX_BULK_MOVES, MAX_STATE_WAIT, state_update_frame, version_etag
+from rl_player import rl_batcher, validate_rl_request
+import state_codec
+from static_assets import IMMUTABLE_CACHE_CONTROL, REVALIDATE_CACHE_CONTROL, etag_matches, static_assets
+from arena_logging import fields, get_logger, setup_logging_from_config
+import arena_metrics
+from admission import AdmissionRejected, stream_budget
+from arena_metrics import AI_DECISION_SECONDS, REQUEST_SECONDS, SSE_CONNECTIONS
+
+logger = logging.getLogger(__name__)
+http_logger = get_logger('http')
+
+SSE_HEARTBEAT_INTERVAL = 15
+TIMELINE_HEARTBEAT_INTERVAL = 5
+GLOBAL_TIMELINES_HEARTBEAT_INTERVAL = 10
+
+arena_ai = create_ai_from_config()
+
+
+class _Subscription:
+    """单个等待者：通知到来时置位"""
+
+    def __init__(self, notifier: "AsyncNotifier", key: str):
+        self.notifier = notifier
+        self.key = key
+        self.event = asyncio.Event()
+
+    def __enter__(self):
+        self.notifier.waiters.setdefault(self.key, set()).add(self.event)
+        return self
+
+    def __exit__(self, *exc):
+        waiters = self.notifier.waiters.get(self.key)
+        if waiters is not None:
+            waiters.discard(self.event)
+            if not waiters:
+                del self.notifier.waiters[self.key]
+
+    async def wait(self, timeout: float) -> bool:
+        """
+        等待通知
+        :return: True=收到通知, False=超时
+        """
+        try:
+            await asyncio.wait_for(self.event.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            self.event.clear()
+
+
+class AsyncNotifier:
+    """
+    把 GameManager 的事件通知（可能来自任意线程）转成 asyncio 唤醒
+    先订阅、再检查状态、最后等待，保证不会丢失唤醒
+    """
+
+    GLOBAL_KEY = '*'  # 任意游戏结束/重置/删除
+    COMPLETION_PREFIX = 'done:'  # 单局游戏结束/删除
+
+    def __init__(self):
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.waiters: Dict[str, Set[asyncio.Event]] = {}
+
+    def attach(self, loop: asyncio.AbstractEventLoop):
+        if self.loop is None:
+            self.loop = loop
+            game_manager.add_listener(self.on_event)
+
+    def on_event(self, game_id: str, event: Optional[Dict]):
+        """GameManager 监听器（任意线程调用）"""
+        if self.loop is None:
+            return
+        keys = [game_id]
+        # timeline：其他进程结束的游戏经事件总线写入了本进程的结束日志
+        if event is None or event.get('type') in ('game_over', 'reset', 'timeline'):
+            keys.append(self.GLOBAL_KEY)
+        if event is None or event.get('type') == 'game_over':
+            keys.append(self.COMPLETION_PREFIX + game_id)
+        self.loop.call_soon_threadsafe(self._wake, keys)
+
+    def _wake(self, keys):
+        for key in keys:
+            for event in self.waiters.get(key, ()):
+                event.set()
+
+    def subscribe(self, key: str) -> _Subscription:
+        return _Subscription(self, key)
+
+
+notifier = AsyncNotifier()
+
+
+# ---------------------------------------------------------------------------
+# 请求 / 响应
+# ---------------------------------------------------------------------------
+
+# 分片模式的工作进程只监听 Unix 域套接字（连接没有来源地址），客户端地址由前端放在 X-Real-IP 中；
+# 只有这种进程才信任该请求头，直接对外的进程忽略它，客户端无法伪造地址绕过准入控制
+trust_forwarded_client = False
+
+
+def _client_address(scope) -> str:
+    client = scope.get('client')
+    if client:
+        return client[0]
+    if trust_forwarded_client:
+        for name, value in scope.get('headers', []):
+            if name.lower() == b'x-real-ip':
+                return value.decode('latin-1')
+    return 'unknown'
+
+
+class Request:
+    """最小化的请求对象"""
+
+    def __init__(self, scope, receive):
+        self.scope = scope
+        self.receive = receive
+        self.method = scope['method']
+        self.path = scope['path']
+        self.query = {k: v[-1] for k, v in parse_qs(scope.get('query_string', b'').decode()).items()}
+        self.headers = {k.decode('latin-1').lower(): v.decode('latin-1') for k, v in scope.get('headers', [])}
+        self.client = _client_address(scope)
+        self._body: Optional[bytes] = None
+
+    async def body(self) -> bytes:
+        if self._body is None:
+            chunks = []
+            while True:
+                message = await self.receive()
+                chunks.append(message.get('body', b''))
+                if not message.get('more_body'):
+                    break
+            self._body = b''.join(chunks)
+        return self._body
+
+    async def json(self):
+        body = await self.body()
+        if not body:
+            return None
+        return json.loads(body)
+
+
+class SSEStream:
+    """由异步生成器产出 SSE 文本块的流式响应"""
+
+    def __init__(self, generator, name: str = 'events'):
+        self.generator = generator
+        self.name = name
+
+
+_CORS_HEADERS = [
+    (b'access-control-allow-origin', b'*'),
+    (b'access-control-allow-headers', b'Content-Type'),
+    (b'access-control-allow-methods', b'GET, POST, DELETE, OPTIONS'),
+]
+
+
+async def _send_json(send, status: int, payload, headers=None):
+    """发送JSON（或 BinaryResponse）响应；payload 为 None 时（如304）不带响应体"""
+    extra = [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in (headers or {}).items()]
+    if payload is None:
+        await send({'type': 'http.response.start', 'status': status, 'headers': extra + _CORS_HEADERS})
+        await send({'type': 'http.response.body', 'body': b''})
+        return
+    if isinstance(payload, BinaryResponse):
+        body, content_type = payload.body, payload.content_type.encode('latin-1')
+    else:
+        body, content_type = json.dumps(payload, ensure_ascii=False).encode('utf-8'), b'application/json'
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(b'content-type', content_type),
+                    (b'content-length', str(len(body)).encode())] + extra + _CORS_HEADERS,
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+
+class BinaryResponse:
+    """二进制响应体（紧凑状态编码）"""
+
+    def __init__(self, body: bytes, content_type: str = state_codec.MIME_TYPE):
+        self.body = body
+        self.content_type = content_type
+
+
+def _etag_headers(etag: str) -> Dict[str, str]:
+    return {'ETag': f'"{etag}"', 'Cache-Control': 'no-cache', 'Vary': 'Accept'}
+
+
+def _wants_binary(request: Request) -> bool:
+    return state_codec.wants_binary(request.query.get('format'), request.headers.get('accept'))
+
+
+def _etag_matches(request: Request, etag: str) -> bool:
+    """If-None-Match 弱比较"""
+    return etag_matches(request.headers.get('if-none-match'), f'"{etag}"')
+
+
+async def _send_sse(send, receive, stream: SSEStream):
+    """推送SSE，同时监听客户端断开"""
+    await send({
+        'type': 'http.response.start',
+        'status': 200,
+        'headers': [(b'content-type', b'text/event-stream'),
+                    (b'cache-control', b'no-cache'),
+                    (b'x-accel-buffering', b'no')] + _CORS_HEADERS,
+    })
+
+    async def pump():
+        async for chunk in stream.generator:
+            await send({'type': 'http.response.body', 'body': chunk.encode('utf-8'), 'more_body': True})
+
+    async def watch_disconnect():
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                return
+
+    pump_task = asyncio.ensure_future(pump())
+    watch_task = asyncio.ensure_future(watch_disconnect())
+    try:
+        with SSE_CONNECTIONS.track(stream.name):
+            await asyncio.wait({pump_task, watch_task}, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for task in (pump_task, watch_task):
+            task.cancel()
+        await asyncio.gather(pump_task, watch_task, return_exceptions=True)
+        await stream.generator.aclose()
+
+    if not pump_task.cancelled():
+        if pump_task.exception() is not None:
+            logger.error(f"SSE推送失败: {pump_task.exception()}")
+        else:
+            # 流正常结束（如游戏被删除），关闭响应
+            await send({'type': 'http.response.body', 'body': b'', 'more_body': False})
+
+
+async def _run_blocking(func, *args):
+    """
+    在线程池中执行同步调用（落子、AI搜索、存储读写、表库查询），
+    事件循环只等待结果，不被这些调用阻塞
+    """
+    return await asyncio.get_running_loop().run_in_executor(None, functools.partial(func, *args))
+
+
+def _schedule_rl(game_id: str):
+    """落子后轮到 RL 玩家时提交微批请求"""
+    rl_batcher.schedule_if_needed(game_manager.get_game(game_id))
+
+
+def _sse(payload: Dict) -> str:
+    return f"data: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+
+def _last_event_id(request: Request) -> int:
+    """SSE 断线续传游标（Last-Event-ID 头或 last_event_id 参数）"""
+    raw = request.headers.get('last-event-id') or request.query.get('last_event_id') or '0'
+    try:
+        return max(0, int(raw))
+    except ValueError:
+        return 0
+
+
+def _replay_speed(request: Request) -> float:
+    try:
+        replay_speed = float(request.query.get('replay_speed', '1.0'))
+        return replay_speed if replay_speed > 0 else 1.0
+    except ValueError:
+        return 1.0
+
+
+# ---------------------------------------------------------------------------
+# 路由处理
+# ---------------------------------------------------------------------------
+
+async def create_game(request: Request):
+    data = await request.json() or {}
+    player_x_type = data.get('player_x_type', 'human')
+    player_o_type = data.get('player_o_type', 'human')
+
+    rl_model, rl_error = validate_rl_request(player_x_type, player_o_type, data.get('rl_model'))
+    if rl_error:
+        return 400, {"status": "error", "message": rl_error}
+
+    game = await _run_blocking(game_manager.create_game, player_x_type, player_o_type, rl_model)
+    if rl_model:
+        rl_batcher.schedule_if_needed(game)
+
+    return 200, {
+        "status": "success",
+        "message": "游戏创建成功",
+        "game_id": game.game_id,
+        "game_state": game.get_state()
+    }
+
+
+async def get_game_state(request: Request, game_id: str):
+    try:
+        since = int(request.query['since']) if 'since' in request.query else None
+        wait = min(max(float(request.query.get('wait', 0)), 0.0), MAX_STATE_WAIT)
+    except ValueError:
+        since, wait = None, 0.0
+
+    game = await _run_blocking(game_manager.get_game, game_id)
+    if since is not None and wait > 0 and game is not None:
+        # 长轮询：先订阅再检查，版本号超过 since 或超时后返回；等待期间占用推送连接名额
+        try:
+            stream_budget.acquire(request.client)
+        except AdmissionRejected as e:
+            return e.status, e.payload(), e.headers()
+        deadline = time.monotonic() + wait
+        try:
+            with notifier.subscribe(game_id) as subscription:
+                while game is not None and game.version <= since:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0 or not await subscription.wait(remaining):
+                        break
+                    game = await _run_blocking(game_manager.get_game, game_id)
+        finally:
+            stream_budget.release(request.client)
+
+    if not game:
+        return 404, {"status": "error", "message": "游戏不存在"}
+    binary = _wants_binary(request)
+    etag = version_etag(game, 'bin') if binary else version_etag(game)
+    if since is not None and game.version <= since:
+        return 304, None, _etag_headers(etag)
+    if _etag_matches(request, etag):
+        return 304, None, _etag_headers(etag)
+    if binary:
+        return 200, BinaryResponse(await _run_blocking(state_codec.pack_state, game)), _etag_headers(etag)
+    return 200, {"status": "success", "game_state": await _run_blocking(game.get_state)}, _etag_headers(etag)
+
+
+async def make_move(request: Request, game_id: str):
+    data = await request.json() or {}
+    row = data.get('row')
+    col = data.get('col')
+    if row is None or col is None:
+        return 400, {"status": "error", "message": "缺少行列参数"}
+
+    result = await _run_blocking(game_manager.make_move, game_id, row, col, data.get('player_id'))
+    if result["status"] != "success":
+        return 400, result
+    await _run_blocking(_schedule_rl, game_id)
+    return 200, result
+
+
+async def move_and_reply(request: Request, game_id: str):
+    data = await request.json() or {}
+    row = data.get('row')
+    col = data.get('col')
+    if row is None or col is None:
+        return 400, {"status": "error", "message": "缺少行列参数"}
+
+    result = await _run_blocking(game_manager.make_move_and_reply, game_id, row, col, arena_ai,
+                                 data.get('player_id'))
+    if result["status"] != "success":
+        return (404 if result.get("message") == "游戏不存在" else 400), result
+    await _run_blocking(_schedule_rl, game_id)
+    return 200, result
+
+
+async def bulk_moves(request: Request):
+    data = await request.json()
+    moves = data.get('moves') if isinstance(data, dict) else data
+    if not isinstance(moves, list):
+        return 400, {"status": "error", "message": "缺少moves列表"}
+    if len(moves) > MAX_BULK_MOVES:
+        return 400, {"status": "error", "message": f"单次最多提交 {MAX_BULK_MOVES} 步"}
+
+    results = await _run_blocking(game_manager.make_moves, moves, arena_ai)
+    for item in results:
+        if item["status"] == "success":
+            await _run_blocking(_schedule_rl, item["game_id"])
+    return 200, {
+        "status": "success",
+        "results": results,
+        "count": len(results),
+        "succeeded": sum(1 for item in results if item["status"] == "success")
+    }
+
+
+def _apply_ai_move(game_id: str):
+    """让内置AI走一步，返回 (HTTP状态码, 响应体)；同步执行，由 _run_blocking 放到线程池"""
+    game = game_manager.get_game(game_id)
+    if not game:
+        return 404, {"status": "error", "message": "游戏不存在"}
+
+    if game.status == GameStatus.FINISHED:
+        game_state = game.get_state()
+        return 400, {
+            "status": "error",
+            "message": "游戏未进行中",
+            "game_over": True,
+            "winner": game_state.get('winner'),
+            "is_draw": game_state.get('is_draw'),
+            "game_state": game_state
+        }
+
+    with AI_DECISION_SECONDS.time(type(arena_ai).__name__):
+        move = arena_ai.get_best_move(game)
+    if move is None:
+        return 400, {"status": "error", "message": "无可用移动"}
+
+    row, col = move
+    result = game_manager.make_move(game_id, row, col)
+    if result["status"] != "success":
+        return 400, result
+    _schedule_rl(game_id)
+    return 200, result
+
+
+async def ai_move(request: Request, game_id: str):
+    return await _run_blocking(_apply_ai_move, game_id)
+
+
+async def reset_game(request: Request, game_id: str):
+    result = await _run_blocking(game_manager.reset_game, game_id)
+    if result["status"] != "success":
+        return 404, result
+    await _run_blocking(_schedule_rl, game_id)
+    return 200, result
+
+
+async def list_games(request: Request):
+    try:
+        return 200, await _run_blocking(game_manager.query_games, request.query)
+    except ValueError as e:
+        return 400, {"status": "error", "message": str(e)}
+
+
+async def delete_game(request: Request, game_id: str):
+    if await _run_blocking(game_manager.delete_game, game_id):
+        return 200, {"status": "success", "message": "游戏已删除"}
+    return 404, {"status": "error", "message": "游戏不存在"}
+
+
+async def game_timeline(request: Request, game_id: str):
+    replay_speed = _replay_speed(request)
+    binary = _wants_binary(request)
+    game = await _run_blocking(game_manager.get_game, game_id)
+    etag = None
+    if game:
+        etag = version_etag(game, 'bin') if binary else version_etag(game, replay_speed)
+    if etag and _etag_matches(request, etag):
+        return 304, None, _etag_headers(etag)
+
+    result = await _run_blocking(game_manager.get_timeline, game_id)
+    if result.get('status') != 'success':
+        return 400, result
+    if binary:
+        return 200, BinaryResponse(await _run_blocking(state_codec.pack_timeline, game)), _etag_headers(etag)
+    result['timeline']['replay_speed'] = replay_speed
+    return 200, result, _etag_headers(etag)
+
+
+async def health_check(request: Request):
+    return 200, {
+        "status": "healthy",
+        "service": "Tic-Tac-Toe Arena",
+        "version": "1.0.0",
+        "mode": "asgi",
+        "active_games": len(game_manager.games),
+        "streams": stream_budget.stats()
+    }
+
+
+async def metrics(request: Request):
+    return 200, BinaryResponse(arena_metrics.render().encode('utf-8'), arena_metrics.CONTENT_TYPE)
+
+
+async def index(request: Request):
+    """主页：index.html（其中的资源地址已带指纹）"""
+    return _asset_response(request, static_assets.index, fingerprinted=False)
+
+
+async def serve_static(request: Request, filename: str):
+    """静态文件：与 app.py 相同，内存中的预压缩版本，带指纹的地址永久缓存，原地址按 ETag 验证"""
+    asset, fingerprinted = static_assets.get('/static/' + filename)
+    if asset is None:
+        return 404, {"status": "error", "message": "文件不存在"}
+    return _asset_response(request, asset, fingerprinted)
+
+
+def _asset_response(request: Request, asset, fingerprinted: bool):
+    body, encoding = asset.select(request.headers.get('accept-encoding'))
+    etag = asset.etag(encoding)
+    headers = {
+        'ETag': etag,
+        'Cache-Control': IMMUTABLE_CACHE_CONTROL if fingerprinted else REVALIDATE_CACHE_CONTROL,
+        'Vary': 'Accept-Encoding'
+    }
+    if _etag_matches(request, etag.strip('"')):
+        return 304, None, headers
+    if encoding:
+        headers['Content-Encoding'] = encoding
+    return 200, BinaryResponse(body, asset.content_type), headers
+
+
+async def game_events(request: Request, game_id: str):
+    # 断线重连带 Last-Event-ID 时从该序号之后继续，否则从当前局面开始
+    resume = request.headers.get('last-event-id') or request.query.get('last_event_id')
+    cursor = _last_event_id(request) if resume else None
+
+    async def generate():
+        nonlocal cursor
+        with notifier.subscribe(game_id) as subscription:
+            # 先订阅再取游标，两者之间的事件不会漏掉
+            snapshot = await _run_blocking(game_manager.subscribe_events, game_id)
+            if snapshot is None:
+                yield _sse({'type': 'error', 'message': '游戏不存在'})
+                return
+
+            yield _sse({'type': 'connected', 'game_id': game_id})
+            if cursor is None:
+                state, cursor = snapshot
+                yield state_update_frame(state, cursor)
+
+            while True:
+                if not await _run_blocking(game_manager.get_game, game_id):
+                    yield _sse({'type': 'game_deleted'})
+                    return
+                events, missed = game_manager.read_events(game_id, cursor)
+                if missed:
+                    # 事件已被覆盖或游标无效：重发当前局面
+                    snapshot = await _run_blocking(game_manager.subscribe_events, game_id)
+                    if snapshot is not None:
+                        state, cursor = snapshot
+                        yield state_update_frame(state, cursor)
+                    continue
+                for event in events:
+                    yield event.frame
+                if events:
+                    cursor = events[-1].seq
+                    continue
+                if not await subscription.wait(SSE_HEARTBEAT_INTERVAL):
+                    yield ": heartbeat\n\n"
+
+    return SSEStream(generate())
+
+
+async def game_timeline_stream(request: Request, game_id: str):
+    replay_speed = _replay_speed(request)
+
+    async def generate():
+        # 只订阅该局的完成通知，对局过程中的每一步都不会唤醒
+        with notifier.subscribe(AsyncNotifier.COMPLETION_PREFIX + game_id) as subscription:
+            while True:
+                game = await _run_blocking(game_manager.get_game, game_id)
+                if not game:
+                    yield _sse({'type': 'error', 'message': '游戏不存在'})
+                    return
+                if game.status == GameStatus.FINISHED:
+                    result = await _run_blocking(game_manager.get_timeline, game_id)
+                    if result.get('status') == 'success':
+                        result['timeline']['replay_speed'] = replay_speed
+                        yield _sse({'type': 'timeline', 'timeline': result['timeline']})
+                    else:
+                        yield _sse({'type': 'error', 'message': result.get('message', '无法获取timeline')})
+                    return
+                if not await subscription.wait(TIMELINE_HEARTBEAT_INTERVAL):
+                    yield ": heartbeat\n\n"
+
+    return SSEStream(generate(), 'timeline')
+
+
+async def global_timelines_stream(request: Request):
+    replay_speed = _replay_speed(request)
+    cursor = _last_event_id(request)
+
+    async def generate():
+        nonlocal cursor
+        yield _sse({'type': 'connected', 'mode': 'global_timelines'})
+        with notifier.subscribe(AsyncNotifier.GLOBAL_KEY) as subscription:
+            while True:
+                entries = game_manager.finished_since(cursor)
+                for entry in entries:
+                    yield entry.encode(replay_speed)
+                    cursor = entry.seq
+                if entries:
+                    continue
+                if not await subscription.wait(GLOBAL_TIMELINES_HEARTBEAT_INTERVAL):
+                    yield ": heartbeat\n\n"
+
+    return SSEStream(generate(), 'timelines')
+
+
+# ---------------------------------------------------------------------------
+# WebSocket Agent 协议
+# ---------------------------------------------------------------------------
+
+AGENT_IDLE_TIMEOUT = 30
+
+
+class AgentConnection:
+    """
+    一条 /ws/agent 连接
+    每个订阅对应一个等待协程：局面变化时被通知器唤醒，轮到该方时推送 your_turn，
+    对局结束时推送 game_over；着法从同一连接回传，不再需要轮询和多次HTTP往返
+    """
+
+    def __init__(self, send):
+        self._send = send
+        self._send_lock = asyncio.Lock()
+        self.watchers: Dict[str, asyncio.Task] = {}
+        self.players: Dict[str, Optional[str]] = {}
+
+    async def send(self, payload: Dict):
+        # 多个等待协程共用一条连接，发送需要串行化
+        async with self._send_lock:
+            await self._send({'type': 'websocket.send', 'text': json.dumps(payload, ensure_ascii=False)})
+
+    async def handle(self, message: Dict):
+        msg_type = message.get('type')
+        handler = getattr(self, f'on_{msg_type}', None) if isinstance(msg_type, str) else None
+        if handler is None:
+            await self.send({'type': 'error', 'message': f'未知消息类型: {msg_type}'})
+            return
+        await handler(message)
+
+    async def on_ping(self, message: Dict):
+        await self.send({'type': 'pong', 'id': message.get('id')})
+
+    async def on_create(self, message: Dict):
+        player_x_type = message.get('player_x_type', 'agent')
+        player_o_type = message.get('player_o_type', 'ai')
+        rl_model, rl_error = validate_rl_request(player_x_type, player_o_type, message.get('rl_model'))
+        if rl_error:
+            await self.send({'type': 'error', 'id': message.get('id'), 'message': rl_error})
+            return
+        try:
+            game = await _run_blocking(game_manager.create_game, player_x_type, player_o_type, rl_model)
+        except ValueError:
+            await self.send({'type': 'error', 'id': message.get('id'), 'message': '无效的玩家类型'})
+            return
+        if rl_model:
+            rl_batcher.schedule_if_needed(game)
+
+        await self.send({
+            'type': 'created',
+            'id': message.get('id'),
+            'game_id': game.game_id,
+            'game_state': game.get_state()
+        })
+        await self.subscribe(game.game_id, message.get('player'), message.get('id'))
+
+    async def on_subscribe(self, message: Dict):
+        await self.subscribe(message.get('game_id'), message.get('player'), message.get('id'))
+
+    async def on_unsubscribe(self, message: Dict):
+        game_id = message.get('game_id')
+        task = self.watchers.pop(game_id, None)
+        self.players.pop(game_id, None)
+        if task is not None:
+            task.cancel()
+        await self.send({'type': 'unsubscribed', 'id': message.get('id'), 'game_id': game_id})
+
+    async def on_move(self, message: Dict):
+        game_id = message.get('game_id')
+        row = message.get('row')
+        col = message.get('col')
+        if row is None or col is None:
+            await self.send({'type': 'error', 'id': message.get('id'), 'game_id': game_id,
+                             'message': '缺少行列参数'})
+            return
+
+        # 订阅了某一方时只能替该方走棋
+        player = self.players.get(game_id) or message.get('player')
+        if message.get('reply'):
+            result = await _run_blocking(game_manager.make_move_and_reply, game_id, row, col, arena_ai, player)
+        else:
+            result = await _run_blocking(game_manager.make_move, game_id, row, col, player)
+        if result['status'] == 'success':
+            await _run_blocking(_schedule_rl, game_id)
+        await self.send(self._move_result(message, result))
+
+    async def on_ai_move(self, message: Dict):
+        _, result = await _run_blocking(_apply_ai_move, message.get('game_id'))
+        await self.send(self._move_result(message, result))
+
+    @staticmethod
+    def _move_result(message: Dict, result: Dict) -> Dict:
+        payload = {
+            'type': 'move_result',
+            'id': message.get('id'),
+            'game_id': message.get('game_id'),
+            'status': result['status'],
+        }
+        if result['status'] == 'success':
+            payload['result'] = result['result']
+            if 'ai_move' in result:
+                payload['ai_move'] = result['ai_move']
+        else:
+            payload['message'] = result.get('message')
+        return payload
+
+    async def subscribe(self, game_id: Optional[str], player: Optional[str], request_id=None):
+        game = await _run_blocking(game_manager.get_game, game_id) if game_id else None
+        if game is None:
+            await self.send({'type': 'error', 'id': request_id, 'game_id': game_id, 'message': '游戏不存在'})
+            return
+        if player is None:
+            # 未指定时扮演 agent 类型的一方
+            if game.player_x_type.value == 'agent':
+                player = 'X'
+            elif game.player_o_type.value == 'agent':
+                player = 'O'
+        elif player not in ('X', 'O'):
+            await self.send({'type': 'error', 'id': request_id, 'game_id': game_id, 'message': '无效的玩家'})
+            return
+
+        previous = self.watchers.pop(game_id, None)
+        if previous is not None:
+            previous.cancel()
+        self.players[game_id] = player
+        await self.send({'type': 'subscribed', 'id': request_id, 'game_id': game_id, 'player': player})
+        self.watchers[game_id] = asyncio.ensure_future(self._watch(game_id, player))
+
+    async def _watch(self, game_id: str, player: Optional[str]):
+        last_seen = None
+        with notifier.subscribe(game_id) as subscription:
+            while True:
+                game = await _run_blocking(game_manager.get_game, game_id)
+                if game is None:
+                    await self.send({'type': 'game_deleted', 'game_id': game_id})
+                    self.watchers.pop(game_id, None)
+                    self.players.pop(game_id, None)
+                    return
+
+                # 局面没有变化（如重复通知）时不重复推送
+                seen = (game.status, game.move_count, game.current_player)
+                if seen != last_seen:
+                    last_seen = seen
+                    if game.status == GameStatus.FINISHED:
+                        await self.send({
+                            'type': 'game_over',
+                            'game_id': game_id,
+                            'winner': game.winner,
+                            'is_draw': game.winner is None,
+                            'winning_line': game.winning_line,
+                            'board': [row[:] for row in game.board],
+                            'move_count': game.move_count
+                        })
+                    elif game.current_player == player:
+                        last_move = game.move_history[-1] if game.move_history else None
+                        await self.send({
+                            'type': 'your_turn',
+                            'game_id': game_id,
+                            'player': player,
+                            'board': [row[:] for row in game.board],
+                            'move_count': game.move_count,
+                            'last_move': [last_move['row'], last_move['col']] if last_move else None
+                        })
+
+                await subscription.wait(AGENT_IDLE_TIMEOUT)
+
+    async def close(self):
+        tasks = list(self.watchers.values())
+        self.watchers.clear()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def agent_websocket(scope, receive, send):
+    """/ws/agent：Agent 长连接"""
+    message = await receive()
+    if message['type'] != 'websocket.connect':
+        return
+    await send({'type': 'websocket.accept'})
+    client = _client_address(scope)
+    try:
+        stream_budget.acquire(client)
+    except AdmissionRejected as e:
+        # 1013 = Try Again Later；先接受再关闭，客户端才能收到关闭码和原因
+        await send({'type': 'websocket.close', 'code': 1013,
+                    'reason': f"{e.message} (retry_after={e.retry_after})"})
+        return
+
+    connection = AgentConnection(send)
+    try:
+        with SSE_CONNECTIONS.track('ws_agent'):
+            await _agent_loop(receive, connection)
+    finally:
+        stream_budget.release(client)
+        await connection.close()
+
+
+async def _agent_loop(receive, connection: "AgentConnection"):
+    """逐条处理客户端消息，直到断开"""
+    while True:
+        message = await receive()
+        if message['type'] == 'websocket.disconnect':
+            break
+        if message['type'] != 'websocket.receive':
+            continue
+        text = message.get('text')
+        if text is None and message.get('bytes') is not None:
+            text = message['bytes'].decode('utf-8', errors='replace')
+        try:
+            payload = json.loads(text or '')
+        except ValueError:
+            await connection.send({'type': 'error', 'message': '消息不是有效的JSON'})
+            continue
+        if not isinstance(payload, dict):
+            await connection.send({'type': 'error', 'message': '消息必须是JSON对象'})
+            continue
+        try:
+            await connection.handle(payload)
+        except Exception as e:
+            logger.error(f"Agent消息处理失败: {e}")
+            await connection.send({'type': 'error', 'id': payload.get('id'), 'message': str(e)})
+
+
+WEBSOCKET_ROUTES = {
+    '/ws/agent': agent_websocket,
+}
+
+
+ROUTES = [
+    ('POST', r'/api/game/create', create_game),
+    ('GET', r'/api/game/(?P<game_id>[^/]+)/state', get_game_state),
+    ('POST', r'/api/game/(?P<game_id>[^/]+)/move', make_move),
+    ('POST', r'/api/game/(?P<game_id>[^/]+)/move-and-reply', move_and_reply),
+    ('POST', r'/api/game/(?P<game_id>[^/]+)/ai-move', ai_move),
+    ('POST', r'/api/game/(?P<game_id>[^/]+)/reset', reset_game),
+    ('GET', r'/api/game/(?P<game_id>[^/]+)/timeline', game_timeline),
+    ('GET', r'/api/game/(?P<game_id>[^/]+)/timeline-stream', game_timeline_stream),
+    ('GET', r'/api/game/(?P<game_id>[^/]+)/events', game_events),
+    ('DELETE', r'/api/game/(?P<game_id>[^/]+)', delete_game),
+    ('POST', r'/api/moves', bulk_moves),
+    ('GET', r'/api/games', list_games),
+    ('GET', r'/api/timelines-stream', global_timelines_stream),
+    ('GET', r'/api/health', health_check),
+    ('GET', r'/metrics', metrics),
+    ('GET', r'/', index),
+    ('GET', r'/static/(?P<filename>.+)', serve_static),
+]
+# 第四项是指标用的路由模板（/api/game/<game_id>/state），与 Flask 的 url_rule 一致
+_COMPILED_ROUTES = [
+    (method, re.compile(pattern + '$'), handler, re.sub(r'\(\?P<(\w+)>[^)]*\)', r'<\1>', pattern))
+    for method, pattern, handler in ROUTES
+]
+
+
+async def _cleanup_games_background():
+    """后台定期清理过期游戏（与 app.py 的清理线程一致）"""
+    while True:
+        await asyncio.sleep(60)
+        try:
+            await _run_blocking(game_manager.cleanup_old_finished_games, 20)
+        except Exception as e:
+            logger.error(f"游戏清理失败: {e}")
+
+
+async def _lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            notifier.attach(asyncio.get_running_loop())
+            asyncio.ensure_future(_cleanup_games_background())
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def app(scope, receive, send):
+    """ASGI 入口"""
+    if scope['type'] == 'lifespan':
+        await _lifespan(receive, send)
+        return
+    if scope['type'] == 'websocket':
+        notifier.attach(asyncio.get_running_loop())
+        handler = WEBSOCKET_ROUTES.get(scope['path'])
+        if handler is None:
+            await send({'type': 'websocket.close', 'code': 4404})
+            return
+        await handler(scope, receive, send)
+        return
+    if scope['type'] != 'http':
+        return
+
+    notifier.attach(asyncio.get_running_loop())
+    request = Request(scope, receive)
+    if request.method == 'OPTIONS':
+        await send({'type': 'http.response.start', 'status': 204, 'headers': _CORS_HEADERS})
+        await send({'type': 'http.response.body', 'body': b''})
+        return
+
+    for method, pattern, handler, route in _COMPILED_ROUTES:
+        match = pattern.match(request.path)
+        if match and method == request.method:
+            break
+    else:
+        await _send_json(send, 404, {"status": "error", "message": "端点不存在"})
+        return
+
+    started = time.perf_counter()
+    try:
+        response = await handler(request, **match.groupdict())
+    except Exception as e:
+        logger.error(f"请求处理失败 {request.method} {request.path}: {e}")
+        await _send_json(send, 500, {"status": "error", "message": str(e)})
+        return
+
+    if isinstance(response, SSEStream):
+        REQUEST_SECONDS.observe(time.perf_counter() - started, route, request.method)
+        try:
+            stream_budget.acquire(request.client)
+        except AdmissionRejected as e:
+            await response.generator.aclose()
+            await _send_json(send, e.status, e.payload(), e.headers())
+            return
+        try:
+            await _send_sse(send, receive, response)
+        finally:
+            stream_budget.release(request.client)
+    else:
+        status, payload, *headers = response
+        await _send_json(send, status, payload, headers[0] if headers else None)
+        REQUEST_SECONDS.observe(time.perf_counter() - started, route, request.method)
+        if http_logger.isEnabledFor(logging.DEBUG):
+            http_logger.debug("请求完成", extra=fields(
+                method=request.method, path=request.path, status=status,
+                ms=round((time.perf_counter() - started) * 1000, 1)
+            ))
+
+
+if __name__ == '__main__':
+    import uvicorn
+
+    setup_logging_from_config()
+    logger.info("以 ASGI 模式启动井字棋决斗场服务器...")
+    uvicorn.run(app, host='0.0.0.0', port=5000, log_level='info')
@@ -16,6 +16,9 @@ class BenchmarkAgent:
         self.name = name
         self.game_id = None
         self.player = None
+        # 条件请求缓存：局面未变化时服务器返回 304
+        self._state_etag = None
+        self._state = None
     
     def create_game(self, player_x='agent', player_o='ai'):
         """创建游戏"""
@@ -35,9 +38,15 @@ class BenchmarkAgent:
     def get_state(self):
         """获取状态"""
         try:
-            response = requests.get(f'{self.base_url}/api/game/{self.game_id}/state', timeout=5)
+            headers = {'If-None-Match': self._state_etag} if self._state_etag else {}
+            response = requests.get(f'{self.base_url}/api/game/{self.game_id}/state',
+                                    headers=headers, timeout=5)
+            if response.status_code == 304:
+                return self._state
             if response.status_code == 200:
-                return response.json().get('game_state')
+                self._state_etag = response.headers.get('ETag')
+                self._state = response.json().get('game_state')
+                return self._state
         except:
             pass
         return None
@@ -83,11 +92,11 @@ class RLAgent(BenchmarkAgent):
     def __init__(self, base_url='http://127.0.0.1:5000', name="RL-Agent", model_path='models/rl_agent_ppo'):
         super().__init__(base_url, name)
         
-        # 加载模型
-        from stable_baselines3 import PPO
+        # 加载模型（存在导出的 .npz 时无需 torch）
+        from numpy_policy import load_policy
         import numpy as np
         
-        self.model = PPO.load(model_path)
+        self.model = load_policy(model_path, algorithm='ppo')
         self.np = np
     
     def decide_move(self, board):
@@ -242,7 +251,7 @@ def compare_agents(num_games=50):
     print("\n【2/2】测试强化学习 Agent")
     
     model_path = 'models/rl_agent_ppo'
-    if not os.path.exists(f"{model_path}.zip"):
+    if not os.path.exists(f"{model_path}.zip") and not os.path.exists(f"{model_path}.npz"):
         print(f"✗ 模型不存在: {model_path}.zip")
         print("请先训练模型: python rl_agent.py --train 5000")
         return
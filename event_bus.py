@@ -0,0 +1,262 @@
+"""
+跨进程事件总线
+多个工作进程共享存储（见 game_store.py）时，一个进程里的落子要推送给连接在其他进程上的观战者。
+本机起一个代理进程，监听 Unix 域套接字；每个工作进程连上代理，
+GameManager 把本进程产生的事件、删除和结束的时间线发布到总线，代理原样转发给其他所有进程，
+收到的消息写入本进程的事件队列并唤醒 SSE / 长轮询，和本地事件走同一条路径。
+
+帧格式：4 字节大端长度 + JSON 数组，每个元素为 [类型, game_id, 数据]
+    event     游戏事件 {seq, event}（move / game_over / reset / game_created），seq 为该局的事件序号，
+              接收方用同一个序号追加，同一条事件在各进程的 SSE id 相同
+    deleted   游戏被删除
+    finished  游戏结束的完整 timeline（全局时间线流使用）
+
+发送线程阻塞等待第一条消息，然后把队列里已有的消息全部取出合成一帧：
+空闲时单条消息立即发出，繁忙时自然成批，不引入额外的等待时间。
+代理不解析消息，只按帧转发；跟不上的连接会被断开，重连后客户端由 SSE 初始的 state_update 重新同步。
+
+运行：
+    python event_bus.py              # 代理进程，套接字路径见 config.json 的 event_bus 段
+    # config.json: "event_bus": {"enabled": true, "socket": "data/arena-bus.sock"}
+    # 然后启动多个工作进程（如 uvicorn asgi_app:app --workers 4，配合 sqlite 存储）
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import queue
+import socket
+import struct
+import threading
+import time
+from typing import Callable, Optional, Set
+
+from arena_metrics import Counter
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_SOCKET_PATH = os.path.join('data', 'arena-bus.sock')
+
+_FRAME_HEADER = struct.Struct('>I')
+
+# 单帧最多合并的消息数
+MAX_BATCH = 512
+# 发送队列上限，代理不可用或发送跟不上时丢弃新消息
+MAX_PENDING = 10000
+# 代理为单个连接缓存的未发送字节数上限，超出即断开该连接
+MAX_CLIENT_BUFFER = 4 * 1024 * 1024
+# 连接代理失败后的重试间隔（秒）
+RECONNECT_INTERVAL = 1.0
+
+BUS_MESSAGES = Counter('arena_bus_messages_total', '事件总线消息数（按方向）', ('direction',))
+BUS_FRAMES = Counter('arena_bus_frames_sent_total', '事件总线发送的帧数（每帧一批消息）')
+BUS_DROPPED = Counter('arena_bus_messages_dropped_total', '事件总线丢弃的消息数（队列满或未连接）')
+
+
+def _recv_exactly(sock: socket.socket, size: int) -> bytes:
+    chunks = []
+    while size:
+        chunk = sock.recv(size)
+        if not chunk:
+            raise ConnectionError("代理已断开")
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b''.join(chunks)
+
+
+class EventBus:
+    """工作进程一侧的总线连接：发布本进程的消息，把其他进程的消息交给 handler"""
+
+    def __init__(self, path: str, handler: Callable[[str, str, Optional[dict]], None],
+                 max_pending: int = MAX_PENDING):
+        self.path = path
+        self.handler = handler
+        self.dropped = 0
+        self._queue: queue.Queue = queue.Queue(maxsize=max_pending)
+        self._sock: Optional[socket.socket] = None
+        self._closed = False
+        threading.Thread(target=self._receive_loop, name='event-bus-receive', daemon=True).start()
+        threading.Thread(target=self._send_loop, name='event-bus-send', daemon=True).start()
+
+    def publish(self, kind: str, game_id: str, payload: Optional[dict] = None):
+        """发布消息（不阻塞）"""
+        try:
+            self._queue.put_nowait((kind, game_id, payload))
+        except queue.Full:
+            self._drop(1)
+
+    def _drop(self, count: int):
+        self.dropped += count
+        BUS_DROPPED.inc(amount=count)
+
+    def _send_loop(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            batch = [item]
+            while len(batch) < MAX_BATCH:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    return
+                batch.append(item)
+
+            sock = self._sock
+            if sock is None:
+                self._drop(len(batch))
+                continue
+            data = json.dumps(batch, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+            try:
+                sock.sendall(_FRAME_HEADER.pack(len(data)) + data)
+            except OSError:
+                self._drop(len(batch))
+                self._disconnect(sock)
+                continue
+            BUS_FRAMES.inc()
+            BUS_MESSAGES.inc('out', amount=len(batch))
+
+    def _connect(self) -> Optional[socket.socket]:
+        warned = False
+        while not self._closed:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                sock.connect(self.path)
+                logger.info(f"已连接事件总线: {self.path}")
+                self._sock = sock
+                return sock
+            except OSError as e:
+                sock.close()
+                if not warned:
+                    logger.warning(f"无法连接事件总线 {self.path}: {e}，稍后重试")
+                    warned = True
+                time.sleep(RECONNECT_INTERVAL)
+        return None
+
+    def _disconnect(self, sock: socket.socket):
+        if self._sock is sock:
+            self._sock = None
+        try:
+            sock.close()
+        except OSError:
+            pass
+
+    def _receive_loop(self):
+        while not self._closed:
+            sock = self._connect()
+            if sock is None:
+                return
+            try:
+                while True:
+                    (length,) = _FRAME_HEADER.unpack(_recv_exactly(sock, _FRAME_HEADER.size))
+                    batch = json.loads(_recv_exactly(sock, length))
+                    BUS_MESSAGES.inc('in', amount=len(batch))
+                    for kind, game_id, payload in batch:
+                        try:
+                            self.handler(kind, game_id, payload)
+                        except Exception as e:
+                            logger.error(f"处理总线消息失败 {kind} {game_id}: {e}")
+            except (OSError, ValueError) as e:
+                if not self._closed:
+                    logger.warning(f"事件总线连接断开: {e}")
+            finally:
+                self._disconnect(sock)
+
+    def close(self):
+        self._closed = True
+        sock = self._sock
+        if sock is not None:
+            self._disconnect(sock)
+        try:
+            self._queue.put_nowait(None)
+        except queue.Full:
+            pass
+
+
+class EventBroker:
+    """代理：把每个连接发来的帧转发给其他所有连接"""
+
+    def __init__(self, path: str, max_client_buffer: int = MAX_CLIENT_BUFFER):
+        self.path = path
+        self.max_client_buffer = max_client_buffer
+        self.clients: Set[asyncio.StreamWriter] = set()
+
+    async def serve(self):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        server = await asyncio.start_unix_server(self._handle, self.path)
+        logger.info(f"事件总线代理监听: {self.path}")
+        async with server:
+            await server.serve_forever()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.clients.add(writer)
+        logger.info(f"工作进程接入，当前连接数: {len(self.clients)}")
+        try:
+            while True:
+                header = await reader.readexactly(_FRAME_HEADER.size)
+                (length,) = _FRAME_HEADER.unpack(header)
+                frame = header + await reader.readexactly(length)
+                for client in list(self.clients):
+                    if client is writer:
+                        continue
+                    if client.transport.get_write_buffer_size() > self.max_client_buffer:
+                        logger.warning("工作进程接收过慢，断开连接")
+                        self.clients.discard(client)
+                        client.close()
+                        continue
+                    client.write(frame)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self.clients.discard(writer)
+            writer.close()
+            logger.info(f"工作进程断开，当前连接数: {len(self.clients)}")
+
+
+def _load_section(path: Optional[str] = None) -> dict:
+    path = path or os.path.join(BASE_DIR, 'config.json')
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f).get('event_bus', {})
+    except (OSError, ValueError):
+        return {}
+
+
+def socket_path_from_config(section: Optional[dict] = None) -> str:
+    section = _load_section() if section is None else section
+    path = section.get('socket', DEFAULT_SOCKET_PATH)
+    return path if os.path.isabs(path) else os.path.join(BASE_DIR, path)
+
+
+def event_bus_from_config(handler: Callable[[str, str, Optional[dict]], None],
+                          config_path: Optional[str] = None) -> Optional[EventBus]:
+    """config.json 的 event_bus 段启用时连接总线，否则返回 None"""
+    section = _load_section(config_path)
+    if not section.get('enabled'):
+        return None
+    return EventBus(socket_path_from_config(section), handler)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='井字棋决斗场 - 跨进程事件总线代理')
+    parser.add_argument('--socket', default=None, help='Unix 域套接字路径（默认取 config.json）')
+    args = parser.parse_args()
+
+    from arena_logging import setup_logging_from_config
+    setup_logging_from_config()
+    broker = EventBroker(args.socket or socket_path_from_config())
+    try:
+        asyncio.run(broker.serve())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+"""
+外部Agent接入示例 - WebSocket 长连接版本
+一条连接上创建/订阅游戏，服务器在轮到自己时推送 your_turn，着法直接从同一连接回传，
+每步只需一帧往返，没有轮询和 sleep
+
+需要以 ASGI 模式启动服务器：
+    pip install -r requirements-asgi.txt
+    python asgi_app.py
+    python example_ws_agent.py --games 10
+"""
+import argparse
+import json
+import random
+import time
+
+from websockets.sync.client import connect
+
+
+class WebSocketAgent:
+    """示例Agent - 随机策略，通过 /ws/agent 对战内置AI"""
+
+    def __init__(self, url='ws://127.0.0.1:5000/ws/agent'):
+        self.url = url
+
+    @staticmethod
+    def choose_move(board):
+        empty = [(r, c) for r in range(3) for c in range(3) if board[r][c] is None]
+        return random.choice(empty)
+
+    def play(self, games=1):
+        results = {'win': 0, 'loss': 0, 'draw': 0}
+        with connect(self.url) as ws:
+            for index in range(games):
+                started = time.perf_counter()
+                ws.send(json.dumps({'type': 'create', 'player_x_type': 'agent', 'player_o_type': 'ai'}))
+                player = None
+                moves = 0
+                while True:
+                    message = json.loads(ws.recv())
+                    msg_type = message['type']
+                    if msg_type == 'subscribed':
+                        player = message['player']
+                    elif msg_type == 'your_turn':
+                        row, col = self.choose_move(message['board'])
+                        ws.send(json.dumps({'type': 'move', 'game_id': message['game_id'],
+                                            'row': row, 'col': col}))
+                        moves += 1
+                    elif msg_type == 'move_result':
+                        if message['status'] != 'success':
+                            print(f"❌ 下棋失败: {message.get('message')}")
+                            return results
+                        if not message['result']['game_over']:
+                            # 对手是内置AI，请求它回应
+                            ws.send(json.dumps({'type': 'ai_move', 'game_id': message['game_id']}))
+                    elif msg_type == 'game_over':
+                        winner = message['winner']
+                        outcome = 'draw' if winner is None else ('win' if winner == player else 'loss')
+                        results[outcome] += 1
+                        elapsed = (time.perf_counter() - started) * 1000
+                        print(f"第 {index + 1} 局: {outcome} ({moves} 步, {elapsed:.1f}ms)")
+                        ws.send(json.dumps({'type': 'unsubscribe', 'game_id': message['game_id']}))
+                    elif msg_type == 'unsubscribed':
+                        break
+                    elif msg_type == 'error':
+                        print(f"❌ 错误: {message.get('message')}")
+                        return results
+        return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='WebSocket Agent 示例')
+    parser.add_argument('--url', default='ws://127.0.0.1:5000/ws/agent')
+    parser.add_argument('--games', type=int, default=5)
+    args = parser.parse_args()
+
+    results = WebSocketAgent(args.url).play(args.games)
+    print(f"\n胜: {results['win']} | 负: {results['loss']} | 平: {results['draw']}")
+
+
+if __name__ == '__main__':
+    main()
@@ -13,6 +13,7 @@ class PlayerType(Enum):
     HUMAN = "human"
     AI = "ai"
     AGENT = "agent"
+    RL = "rl"  # 服务端进程内的RL策略模型
 
 
 class GameStatus(Enum):
@@ -25,8 +26,9 @@ class GameStatus(Enum):
 class TicTacToeGame:
     """井字棋游戏类"""
     
-    def __init__(self, player_x_type: str = "human", player_o_type: str = "human"):
-        self.game_id = str(uuid.uuid4())
+    def __init__(self, player_x_type: str = "human", player_o_type: str = "human",
+                 game_id: Optional[str] = None):
+        self.game_id = game_id or str(uuid.uuid4())
         self.board = [[None for _ in range(3)] for _ in range(3)]
         self.current_player = 'X'
         self.status = GameStatus.IN_PROGRESS
@@ -37,6 +39,9 @@ class TicTacToeGame:
         self.created_at = datetime.now()
         self.updated_at = datetime.now()
         self.ended_at: Optional[datetime] = None  # 游戏结束时间
+        self.version = 0  # 局面版本号，每次落子/重置加一（ETag、长轮询使用）
+        self.event_seq = 0  # 最后一条事件的序号（SSE id），由 GameManager 推进并随记录保存，各进程一致
+        self.rl_model: Optional[str] = None  # RL 玩家使用的模型（创建时指定，重置后不变，随记录保存）
         
         # 玩家类型
         self.player_x_type = PlayerType(player_x_type)
@@ -76,6 +81,7 @@ class TicTacToeGame:
         # 执行移动
         self.board[row][col] = player
         self.move_count += 1
+        self.version += 1
         self.move_history.append({
             "player": player,
             "row": row,
@@ -203,6 +209,7 @@ class TicTacToeGame:
         self.move_history = []
         self.updated_at = datetime.now()
         self.ended_at = None
+        self.version += 1
     
     def get_state(self) -> Dict:
         """
@@ -216,6 +223,7 @@ class TicTacToeGame:
             "winner": self.winner,
             "winning_line": self.winning_line,
             "move_count": self.move_count,
+            "version": self.version,
             "move_history": self.move_history,
             "player_x_type": self.player_x_type.value,
             "player_o_type": self.player_o_type.value,
@@ -224,6 +232,21 @@ class TicTacToeGame:
             "ended_at": self.ended_at.isoformat() if self.ended_at else None
         }
     
+    def get_compact_state(self) -> Dict:
+        """
+        获取精简状态（批量接口使用）
+        board 为按行展开的9字符字符串，'.' 表示空格
+        """
+        return {
+            "game_id": self.game_id,
+            "board": ''.join(cell or '.' for row in self.board for cell in row),
+            "current_player": self.current_player,
+            "status": self.status.value,
+            "winner": self.winner,
+            "move_count": self.move_count,
+            "version": self.version
+        }
+    
     def get_available_moves(self) -> List[Tuple[int, int]]:
         """
         获取所有可用的移动位置
@@ -235,6 +258,41 @@ class TicTacToeGame:
                     moves.append((row, col))
         return moves
     
+    def to_record(self) -> Dict:
+        """
+        持久化用的紧凑记录：只保存着法，局面、胜负由重放得到
+        """
+        return {
+            "game_id": self.game_id,
+            "x": self.player_x_type.value,
+            "o": self.player_o_type.value,
+            "version": self.version,
+            "event_seq": self.event_seq,
+            "rl_model": self.rl_model,
+            "moves": [[move["row"], move["col"], move["timestamp"]] for move in self.move_history],
+            "created_at": self.created_at.isoformat(),
+            "updated_at": self.updated_at.isoformat(),
+            "ended_at": self.ended_at.isoformat() if self.ended_at else None
+        }
+    
+    @classmethod
+    def from_record(cls, record: Dict) -> "TicTacToeGame":
+        """
+        由 to_record 的记录恢复游戏
+        """
+        game = cls(record["x"], record["o"])
+        game.game_id = record["game_id"]
+        for row, col, timestamp in record["moves"]:
+            game.make_move(row, col)
+            game.move_history[-1]["timestamp"] = timestamp
+        game.version = record["version"]
+        game.event_seq = record.get("event_seq", 0)
+        game.rl_model = record.get("rl_model")
+        game.created_at = datetime.fromisoformat(record["created_at"])
+        game.updated_at = datetime.fromisoformat(record["updated_at"])
+        game.ended_at = datetime.fromisoformat(record["ended_at"]) if record["ended_at"] else None
+        return game
+    
     def clone(self):
         """
         克隆游戏状态（用于AI模拟）
@@ -248,6 +306,9 @@ class TicTacToeGame:
         cloned.status = self.status
         cloned.winner = self.winner
         cloned.move_count = self.move_count
+        cloned.version = self.version
+        cloned.event_seq = self.event_seq
+        cloned.rl_model = self.rl_model
         return cloned
     
     def __str__(self):
@@ -2,31 +2,250 @@
 游戏管理器
 管理多个游戏实例
 """
-from typing import Dict, Optional
-from game_logic import TicTacToeGame, GameStatus
+from typing import Callable, Dict, List, Optional, Tuple
+from game_logic import TicTacToeGame, GameStatus, PlayerType
+from game_store import GameStore, MemoryGameStore, store_from_config
+from event_bus import event_bus_from_config
+from arena_logging import fields, get_logger
+from arena_metrics import AI_DECISION_SECONDS, CLEANUP_SECONDS, MOVES, CallbackGauge, Counter
+from collections import deque
 from datetime import datetime, timedelta
+from itertools import islice
+import bisect
+import json
 import logging
+import random
+import threading
+import time
+import uuid
 
 logger = logging.getLogger(__name__)
+event_logger = get_logger('events')
+
+# 批量下棋接口单次最多处理的条目数
+MAX_BULK_MOVES = 1000
+
+# 长轮询 /state?since=&wait= 的最长等待（秒）
+MAX_STATE_WAIT = 30
+
+# 每局事件日志（环形缓冲）容量：没有人订阅 /events 时不会无限增长，满了覆盖最旧的事件
+MAX_QUEUED_EVENTS = 256
+
+# 共享存储下落子版本冲突（其他进程抢先写入）时的最多重试次数
+MAX_SAVE_RETRIES = 3
+
+EVENTS_DROPPED = Counter('arena_events_dropped_total', '事件日志已满被覆盖的最旧事件数')
+
+# /api/games 分页
+DEFAULT_LIST_LIMIT = 100
+MAX_LIST_LIMIT = 1000
+
+# 列表接口可选字段（fields 投影）及取值方式，都只读游戏属性，不构建完整状态
+GAME_SUMMARY_FIELDS: Dict[str, Callable[[TicTacToeGame], object]] = {
+    'game_id': lambda game: game.game_id,
+    'status': lambda game: game.status.value,
+    'player_x_type': lambda game: game.player_x_type.value,
+    'player_o_type': lambda game: game.player_o_type.value,
+    'current_player': lambda game: game.current_player,
+    'move_count': lambda game: game.move_count,
+    'winner': lambda game: game.winner,
+    'version': lambda game: game.version,
+    'board': lambda game: game.board,
+    'created_at': lambda game: game.created_at.isoformat(),
+    'updated_at': lambda game: game.updated_at.isoformat(),
+}
+DEFAULT_SUMMARY_FIELDS = (
+    'game_id', 'status', 'player_x_type', 'player_o_type', 'current_player',
+    'move_count', 'winner', 'created_at', 'updated_at'
+)
+# 可用二级索引过滤的参数
+INDEXED_FILTERS = ('status', 'player_x_type', 'player_o_type', 'player_type', 'move_count')
+
+
+def version_etag(game: TicTacToeGame, *variant) -> str:
+    """
+    由局面版本号生成 ETag（不含引号），局面不变时保持不变
+    :param variant: 影响响应内容的其他参数（如回放速度）
+    """
+    return '-'.join([game.game_id, str(game.version)] + [str(part) for part in variant])
+
+
+def shard_of(game_id: str, shard_count: int) -> Optional[int]:
+    """
+    游戏所属分片：ID 第一段（8位十六进制）对分片数取模
+    不是合法 ID 时返回 None
+    """
+    try:
+        return int(game_id[:8], 16) % shard_count
+    except ValueError:
+        return None
+
+
+def new_shard_game_id(shard: int, shard_count: int) -> str:
+    """生成属于指定分片的游戏ID（仍是标准 UUID 格式，客户端无需改动）"""
+    game_id = str(uuid.uuid4())
+    prefix = random.getrandbits(32)
+    prefix -= prefix % shard_count
+    if prefix + shard > 0xFFFFFFFF:
+        prefix -= shard_count
+    return f"{prefix + shard:08x}{game_id[8:]}"
+
+
+class FinishedGameEntry:
+    """
+    已结束游戏日志中的一条记录
+    timeline 只构建一次，SSE 文本按回放速度缓存，所有订阅者共享
+    """
+    
+    def __init__(self, seq: int, game_id: str, timeline: Dict):
+        self.seq = seq
+        self.game_id = game_id
+        self.timeline = timeline
+        self._encoded: Dict[float, str] = {}
+    
+    def encode(self, replay_speed: float = 1.0) -> str:
+        """返回带 id 的 SSE 消息文本"""
+        encoded = self._encoded.get(replay_speed)
+        if encoded is None:
+            payload = {
+                'type': 'timeline',
+                'game_id': self.game_id,
+                'timeline': dict(self.timeline, replay_speed=replay_speed)
+            }
+            encoded = f"id: {self.seq}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+            self._encoded[replay_speed] = encoded
+        return encoded
+
+
+class GameEvent:
+    """
+    事件日志中的一条事件
+    追加时在游戏锁内编码一次（此时的局面快照），所有订阅者共享同一段 SSE 文本
+    """
+    
+    __slots__ = ('seq', 'type', 'data', 'frame')
+    
+    def __init__(self, seq: int, event: Dict):
+        self.seq = seq
+        self.type = event.get('type')
+        self.data = json.dumps(event, ensure_ascii=False)
+        self.frame = f"id: {seq}\ndata: {self.data}\n\n"
+    
+    @property
+    def event(self) -> Dict:
+        """事件内容（解码后的副本）"""
+        return json.loads(self.data)
+
+
+def state_update_frame(state: Dict, cursor: int) -> str:
+    """
+    当前局面的 SSE 消息，id 为事件日志游标：断线重连时从这里继续
+    """
+    payload = json.dumps({'type': 'state_update', 'game_state': state}, ensure_ascii=False)
+    return f"id: {cursor}\ndata: {payload}\n\n"
+
+
+class GameEventLog:
+    """
+    单局游戏的事件日志：环形缓冲，序号从 1 连续递增
+    读取不移除事件，每个订阅者自己保存游标（最后读到的序号），多个观战者互不影响
+    """
+    
+    def __init__(self, capacity: int, last_seq: int = 0):
+        """
+        :param last_seq: 起始序号（从共享存储载入的游戏从其已有的事件序号继续）
+        """
+        self.events: deque = deque(maxlen=capacity)
+        self.last_seq = last_seq
+    
+    def append(self, event: Dict, seq: Optional[int] = None) -> bool:
+        """
+        追加事件
+        :param seq: 事件序号（随游戏记录保存，多进程下各进程一致）；None 时取下一个序号
+        :return: 是否覆盖了最旧的事件
+        """
+        seq = self.last_seq + 1 if seq is None else seq
+        if seq <= self.last_seq:
+            # 迟到的事件：本进程已经按更新的序号追加过，订阅者不会再读它
+            return False
+        if seq != self.last_seq + 1:
+            # 中间的事件没有送达本进程（总线丢弃或乱序）：清空日志，
+            # 游标落在缺口之前的订阅者按错过处理，从 state_update 重新同步
+            self.events.clear()
+        overwritten = len(self.events) == self.events.maxlen
+        self.last_seq = seq
+        self.events.append(GameEvent(seq, event))
+        return overwritten
+    
+    def since(self, cursor: int) -> Tuple[List[GameEvent], bool]:
+        """
+        序号大于游标的事件
+        :return: (事件列表, 是否有事件已被覆盖而读不到)
+        游标比最新序号还大（如服务重启后序号重新开始）也视为错过，订阅者需要重新同步
+        """
+        if cursor > self.last_seq:
+            return list(self.events), True
+        if cursor == self.last_seq:
+            return [], False
+        first = self.events[0].seq if self.events else self.last_seq + 1
+        if cursor + 1 < first:
+            return list(self.events), True
+        return list(islice(self.events, cursor + 1 - first, None)), False
+    
+    def __len__(self) -> int:
+        return len(self.events)
 
 
 class GameManager:
     """游戏管理器"""
     
-    def __init__(self, game_ttl_minutes: int = 120):  # 增加到120分钟（2小时）
+    def __init__(self, game_ttl_minutes: int = 120,  # 增加到120分钟（2小时）
+                 max_queued_events: int = MAX_QUEUED_EVENTS,
+                 store: Optional[GameStore] = None):
+        # 存储：默认进程内；共享存储（SQLite）时 games 是本进程的缓存，读取前按版本号与存储同步
+        self.store = store or MemoryGameStore()
+        # 分片模式下本进程负责的分片 (序号, 总数)，新游戏的ID编码所属分片
+        self.shard: Optional[Tuple[int, int]] = None
+        # 跨进程事件总线（多个进程共享存储时），本进程产生的事件、删除和结束 timeline 都发布到总线
+        self.event_bus = None
+        self.store_lock = threading.RLock()
         self.games: Dict[str, TicTacToeGame] = {}
-        self.event_queues: Dict[str, list] = {}  # 存储每个游戏的事件队列
+        self.event_logs: Dict[str, GameEventLog] = {}  # 每个游戏的事件日志（环形缓冲，满时覆盖最旧的）
+        self.max_queued_events = max_queued_events
+        self.dropped_events = 0
+        # 每个游戏一个条件变量：既是该游戏的操作锁，也用于唤醒等待事件的SSE连接
+        self.event_conditions: Dict[str, threading.Condition] = {}
+        # 每个游戏一个完成事件：游戏结束（或被删除）时置位，重置时清除
+        self.completion_events: Dict[str, threading.Event] = {}
         self.game_timestamps: Dict[str, datetime] = {}  # 记录游戏创建时间
         self.game_ttl_minutes = game_ttl_minutes  # 游戏保留时间（分钟）
+        # 已结束游戏的追加日志（按序号递增），全局 timeline 流按游标读取
+        self.finished_log: List[FinishedGameEntry] = []
+        self.finished_entries: Dict[str, FinishedGameEntry] = {}
+        self.finished_seq = 0
+        self.finished_condition = threading.Condition()
+        # 事件监听器：callback(game_id, event)，游戏删除时 event 为 None
+        self.listeners: List[Callable[[str, Optional[Dict]], None]] = []
+        # 列表二级索引：(字段, 值) -> 按创建序号排序的序号列表，分页游标即创建序号
+        self.game_seqs: Dict[str, int] = {}
+        self.seq_games: Dict[int, str] = {}
+        self.created_seq = 0
+        self.indexes: Dict[tuple, List[int]] = {}
+        self.index_keys: Dict[str, set] = {}
+        self.index_lock = threading.Lock()
     
-    def create_game(self, player_x_type: str = "human", player_o_type: str = "human") -> TicTacToeGame:
+    def create_game(self, player_x_type: str = "human", player_o_type: str = "human",
+                    rl_model: Optional[str] = None) -> TicTacToeGame:
         """
         创建新游戏
+        :param rl_model: RL 玩家使用的模型，随游戏保存（重置后不变，共享存储时各进程读到同一个值）
         """
-        game = TicTacToeGame(player_x_type, player_o_type)
-        self.games[game.game_id] = game
-        self.event_queues[game.game_id] = []
-        self.game_timestamps[game.game_id] = datetime.now()
+        game_id = new_shard_game_id(*self.shard) if self.shard else None
+        game = TicTacToeGame(player_x_type, player_o_type, game_id)
+        game.rl_model = rl_model
+        game.event_seq = 1  # game_created
+        self.store.insert(game)
+        self._register(game)
         
         # 定期清理过期游戏
         self._cleanup_expired_games()
@@ -38,33 +257,148 @@ class GameManager:
             "type": "game_created",
             "game_id": game.game_id,
             "game_state": game.get_state()
-        })
+        }, seq=game.event_seq)
         
         return game
     
+    def configure_shard(self, index: int, count: int):
+        """分片模式：本进程只创建属于第 index 个分片（共 count 个）的游戏"""
+        if not 0 <= index < count:
+            raise ValueError(f"分片序号越界: {index}/{count}")
+        self.shard = (index, count)
+    
+    def _register(self, game: TicTacToeGame, created_at: Optional[datetime] = None, event_seq: int = 0):
+        """
+        在本进程登记游戏（新建，或从共享存储载入其他进程创建的游戏）
+        :param event_seq: 事件日志的起始序号（载入的游戏从其已有的事件序号继续）
+        """
+        self.games[game.game_id] = game
+        self.event_logs[game.game_id] = GameEventLog(self.max_queued_events, event_seq)
+        self.event_conditions[game.game_id] = threading.Condition(threading.RLock())
+        self.completion_events[game.game_id] = threading.Event()
+        self.game_timestamps[game.game_id] = created_at or datetime.now()
+        self._reindex(game)
+    
+    def _sync(self, game_id: str, stored_version: Optional[int],
+              force: bool = False) -> Optional[TicTacToeGame]:
+        """
+        让本进程的缓存与共享存储一致：载入其他进程创建或修改过的游戏，丢弃已被删除的游戏
+        :param stored_version: 存储中的版本号（不存在为 None）
+        :param force: 版本号相同也重新载入（本地副本已被改动但未能写入时）
+        """
+        with self.store_lock:
+            cached = self.games.get(game_id)
+            if stored_version is None:
+                if cached is not None:
+                    self._drop_local(game_id)
+                return None
+            if cached is not None and cached.version == stored_version and not force:
+                return cached
+            game = self.store.load(game_id)
+            if game is None:
+                if cached is not None:
+                    self._drop_local(game_id)
+                return None
+            if cached is None:
+                self._register(game, game.created_at, game.event_seq)
+            else:
+                # 整体替换对象而不是原地修改，并发读取者不会看到重放到一半的局面
+                self.games[game_id] = game
+                self._reindex(game)
+            finished = game.status == GameStatus.FINISHED
+            completion = self.completion_events.get(game_id)
+            if finished and game_id not in self.finished_entries:
+                self._record_finished(game_id, publish=False)
+            elif not finished:
+                self._forget_finished(game_id)
+                if completion is not None:
+                    completion.clear()
+            return game
+    
+    def _sync_all(self):
+        """与共享存储全量同步（列表查询前）；存储自上次同步以来没有被其他连接修改时跳过扫描"""
+        if not self.store.changed():
+            return
+        versions = self.store.versions()
+        for game_id in list(self.games):
+            if game_id not in versions:
+                self._sync(game_id, None)
+        for game_id, version in versions.items():
+            cached = self.games.get(game_id)
+            if cached is None or cached.version != version:
+                self._sync(game_id, version)
+    
+    def add_listener(self, callback: Callable[[str, Optional[Dict]], None]):
+        """
+        注册事件监听器（如 asyncio 服务模式的唤醒回调）
+        """
+        self.listeners.append(callback)
+    
+    def _notify_listeners(self, game_id: str, event: Optional[Dict]):
+        for callback in self.listeners:
+            try:
+                callback(game_id, event)
+            except Exception as e:
+                logger.error(f"事件监听器出错: {e}")
+    
     def get_game(self, game_id: str) -> Optional[TicTacToeGame]:
         """
         获取游戏实例
+        共享存储下每次读取先比较存储中的版本号（主键查询），有变化才重新载入
         """
-        return self.games.get(game_id)
+        if not self.store.shared:
+            return self.games.get(game_id)
+        return self._sync(game_id, self.store.version(game_id))
+    
+    def _game_lock(self, game_id: str) -> threading.Condition:
+        """
+        获取游戏的锁（条件变量），游戏不存在时返回一个临时锁
+        """
+        if self.store.shared and game_id not in self.event_conditions:
+            # 其他进程创建的游戏先载入，才能拿到它在本进程的锁
+            self.get_game(game_id)
+        return self.event_conditions.get(game_id) or threading.Condition(threading.RLock())
     
     def make_move(self, game_id: str, row: int, col: int, player: str = None) -> Dict:
         """
         在指定游戏中下棋
         """
-        game = self.get_game(game_id)
-        if not game:
+        with self._game_lock(game_id):
+            return self._make_move_locked(game_id, row, col, player)
+    
+    def _make_move_locked(self, game_id: str, row: int, col: int, player: str = None) -> Dict:
+        for _ in range(MAX_SAVE_RETRIES):
+            game = self.get_game(game_id)
+            if not game:
+                return {
+                    "status": "error",
+                    "message": "游戏不存在"
+                }
+            
+            # 记录下棋前的玩家；重试时固定为这一方，避免替对手走棋
+            player_before = game.current_player
+            player = player or player_before
+            
+            expected_version = game.version
+            result = game.make_move(row, col, player)
+            if result["success"]:
+                # 事件序号与局面一起保存：落子一条事件，终局再加一条 game_over
+                game.event_seq += 2 if result.get("game_over") else 1
+            if not result["success"] or self.store.save(game, expected_version):
+                break
+            # 其他进程抢先写入：丢弃本地改动，按存储中的最新局面重试
+            logger.info(f"落子版本冲突，重试: {game_id}")
+            self._sync(game_id, self.store.version(game_id), force=True)
+        else:
             return {
                 "status": "error",
-                "message": "游戏不存在"
+                "message": "并发冲突，请重试"
             }
         
-        # 记录下棋前的玩家
-        player_before = game.current_player
-        
-        result = game.make_move(row, col, player)
-        
         if result["success"]:
+            self._reindex(game)
+            mover_type = game.player_x_type if player_before == 'X' else game.player_o_type
+            MOVES.inc(mover_type.value)
             # 发送移动事件（player应该是下棋的玩家，即game_over之前的current_player）
             self._add_event(game_id, {
                 "type": "move",
@@ -74,17 +408,18 @@ class GameManager:
                 "player": player_before,  # 下棋的玩家
                 "move_number": game.move_count,
                 "next_player": result.get("next_player")  # 下一个玩家
-            })
+            }, seq=game.event_seq - 1 if result.get("game_over") else game.event_seq)
             
-            # 如果游戏结束，发送游戏结束事件
+            # 如果游戏结束，先写入结束日志，再发送游戏结束事件
             if result.get("game_over"):
+                self._record_finished(game_id)
                 self._add_event(game_id, {
                     "type": "game_over",
                     "game_id": game_id,
                     "winner": result.get("winner"),
                     "winning_line": result.get("winning_line"),
                     "is_draw": result.get("is_draw", False)
-                })
+                }, seq=game.event_seq)
                 # 结束事件不需要立即推送整局，新的 timeline 接口统一提供
             
             return {
@@ -99,25 +434,120 @@ class GameManager:
                 "message": result.get("error", "移动失败")
             }
     
-    def reset_game(self, game_id: str) -> Dict:
+    def make_move_and_reply(self, game_id: str, row: int, col: int, reply_ai,
+                            player: str = None) -> Dict:
         """
-        重置游戏
+        下棋；对局继续且下一手属于内置AI时，在同一把锁内让AI立即回应
+        :param reply_ai: 内置AI策略（提供 get_best_move(game)）
+        :return: 己方着法结果、AI着法（没有回应时为None）、最终结局与局面
         """
-        game = self.get_game(game_id)
-        if not game:
+        with self._game_lock(game_id):
+            move_result = self._make_move_locked(game_id, row, col, player)
+            if move_result["status"] != "success":
+                return move_result
+            
+            game = self.get_game(game_id)
+            ai_move = None
+            if not move_result["result"].get("game_over"):
+                next_type = game.player_x_type if game.current_player == 'X' else game.player_o_type
+                if next_type == PlayerType.AI:
+                    with AI_DECISION_SECONDS.time(type(reply_ai).__name__):
+                        move = reply_ai.get_best_move(game)
+                    if move is not None:
+                        ai_player = game.current_player
+                        ai_result = self._make_move_locked(game_id, move[0], move[1])
+                        if ai_result["status"] == "success":
+                            ai_move = {
+                                "row": move[0],
+                                "col": move[1],
+                                "player": ai_player,
+                                "result": ai_result["result"]
+                            }
+            
+            game_over = game.status == GameStatus.FINISHED
             return {
-                "status": "error",
-                "message": "游戏不存在"
+                "status": "success",
+                "message": "移动成功",
+                "result": move_result["result"],
+                "ai_move": ai_move,
+                "game_over": game_over,
+                "winner": game.winner,
+                "is_draw": game_over and game.winner is None,
+                "game_state": game.get_state()
             }
-        
-        game.reset()
-        
-        # 发送重置事件
-        self._add_event(game_id, {
-            "type": "reset",
-            "game_id": game_id,
-            "game_state": game.get_state()
-        })
+    
+    def make_moves(self, moves: List[Dict], reply_ai=None) -> List[Dict]:
+        """
+        批量下棋：按顺序处理每一条 {game_id, row, col, player, reply}，
+        每条在对应游戏的锁内原子执行，互不影响
+        :param reply_ai: 内置AI策略，条目带 reply=true 时让AI立即回应
+        :return: 与输入一一对应的结果（带精简状态）
+        """
+        results = []
+        for entry in moves:
+            if not isinstance(entry, dict):
+                results.append({"status": "error", "message": "条目格式错误"})
+                continue
+            game_id = entry.get('game_id')
+            row = entry.get('row')
+            col = entry.get('col')
+            if not isinstance(game_id, str) or not isinstance(row, int) or not isinstance(col, int):
+                results.append({"game_id": game_id, "status": "error", "message": "缺少游戏ID或行列参数"})
+                continue
+            
+            if entry.get('reply') and reply_ai is not None:
+                result = self.make_move_and_reply(game_id, row, col, reply_ai, entry.get('player'))
+            else:
+                result = self.make_move(game_id, row, col, entry.get('player'))
+            
+            item = {"game_id": game_id, "status": result["status"]}
+            if result["status"] == "success":
+                item["result"] = result["result"]
+                if "ai_move" in result:
+                    item["ai_move"] = result["ai_move"]
+            else:
+                item["message"] = result.get("message")
+            game = self.get_game(game_id)
+            if game is not None:
+                item["state"] = game.get_compact_state()
+            results.append(item)
+        return results
+    
+    def reset_game(self, game_id: str) -> Dict:
+        """
+        重置游戏
+        """
+        with self._game_lock(game_id):
+            for _ in range(MAX_SAVE_RETRIES):
+                game = self.get_game(game_id)
+                if not game:
+                    return {
+                        "status": "error",
+                        "message": "游戏不存在"
+                    }
+                expected_version = game.version
+                game.reset()
+                game.event_seq += 1
+                if self.store.save(game, expected_version):
+                    break
+                self._sync(game_id, self.store.version(game_id), force=True)
+            else:
+                return {
+                    "status": "error",
+                    "message": "并发冲突，请重试"
+                }
+            self._reindex(game)
+            self._forget_finished(game_id)
+            completion = self.completion_events.get(game_id)
+            if completion is not None:
+                completion.clear()
+            
+            # 发送重置事件
+            self._add_event(game_id, {
+                "type": "reset",
+                "game_id": game_id,
+                "game_state": game.get_state()
+            }, seq=game.event_seq)
         
         logger.info(f"重置游戏: {game_id}")
         
@@ -131,14 +561,208 @@ class GameManager:
         """
         删除游戏
         """
+        if self.store.shared:
+            self.get_game(game_id)
         if game_id in self.games:
-            del self.games[game_id]
-            if game_id in self.event_queues:
-                del self.event_queues[game_id]
+            self.store.delete(game_id)
+            self._drop_local(game_id)
+            if self.event_bus is not None:
+                self.event_bus.publish('deleted', game_id)
             logger.info(f"删除游戏: {game_id}")
             return True
         return False
     
+    def apply_bus_message(self, kind: str, game_id: str, payload: Optional[Dict]):
+        """
+        处理其他进程经事件总线发来的消息（总线接收线程调用）
+        """
+        if kind == 'event':
+            # 共享存储下先按版本号同步局面，再像本地事件一样追加到事件日志、唤醒等待者
+            if self.get_game(game_id) is not None:
+                self._add_event(game_id, payload["event"], seq=payload.get("seq"), publish=False)
+        elif kind == 'deleted':
+            self._drop_local(game_id)
+        elif kind == 'finished':
+            # 同步局面时可能已经记录过
+            if game_id not in self.finished_entries:
+                self._append_finished(game_id, payload)
+                self._notify_listeners(game_id, {"type": "timeline", "game_id": game_id})
+    
+    def _drop_local(self, game_id: str):
+        """从本进程移除游戏并唤醒等待它的连接"""
+        if self.games.pop(game_id, None) is not None:
+            self._unindex(game_id)
+            self._forget_finished(game_id)
+            self.event_logs.pop(game_id, None)
+            completion = self.completion_events.pop(game_id, None)
+            if completion is not None:
+                # 唤醒等待结束的 timeline 流，让它们发现游戏已删除
+                completion.set()
+            condition = self.event_conditions.pop(game_id, None)
+            if condition is not None:
+                # 唤醒等待中的SSE连接，让它们发现游戏已删除
+                with condition:
+                    condition.notify_all()
+            self._notify_listeners(game_id, None)
+            self.game_timestamps.pop(game_id, None)
+    
+    @staticmethod
+    def _index_keys_for(game: TicTacToeGame) -> set:
+        x_type = game.player_x_type.value
+        o_type = game.player_o_type.value
+        keys = {
+            ('all',),
+            ('status', game.status.value),
+            ('player_x_type', x_type),
+            ('player_o_type', o_type),
+            ('player_type', x_type),
+            ('player_type', o_type),
+        }
+        if game.move_count == 0:
+            # 等待第一手的游戏
+            keys.add(('move_count', '0'))
+        return keys
+    
+    def _reindex(self, game: TicTacToeGame):
+        """创建/落子/重置后更新二级索引，只改动发生变化的索引项"""
+        with self.index_lock:
+            game_id = game.game_id
+            seq = self.game_seqs.get(game_id)
+            if seq is None:
+                self.created_seq += 1
+                seq = self.created_seq
+                self.game_seqs[game_id] = seq
+                self.seq_games[seq] = game_id
+            old_keys = self.index_keys.get(game_id, set())
+            new_keys = self._index_keys_for(game)
+            for key in old_keys - new_keys:
+                self._index_remove(key, seq)
+            for key in new_keys - old_keys:
+                # 新序号总是最大的，通常直接追加
+                seqs = self.indexes.setdefault(key, [])
+                if not seqs or seqs[-1] < seq:
+                    seqs.append(seq)
+                else:
+                    bisect.insort(seqs, seq)
+            self.index_keys[game_id] = new_keys
+    
+    def _unindex(self, game_id: str):
+        with self.index_lock:
+            seq = self.game_seqs.pop(game_id, None)
+            if seq is None:
+                return
+            self.seq_games.pop(seq, None)
+            for key in self.index_keys.pop(game_id, set()):
+                self._index_remove(key, seq)
+    
+    def _index_remove(self, key: tuple, seq: int):
+        seqs = self.indexes.get(key)
+        if not seqs:
+            return
+        position = bisect.bisect_left(seqs, seq)
+        if position < len(seqs) and seqs[position] == seq:
+            del seqs[position]
+        if not seqs:
+            del self.indexes[key]
+    
+    def list_games(self, filters: Optional[Dict[str, str]] = None, cursor: int = 0,
+                   limit: int = DEFAULT_LIST_LIMIT,
+                   newest_first: bool = False) -> Tuple[List[TicTacToeGame], Optional[int]]:
+        """
+        按二级索引分页列出游戏（按创建顺序）
+        :param filters: {字段: 值}，字段见 INDEXED_FILTERS；move_count 只索引 0
+        :param cursor: 上一页返回的游标（创建序号），只返回之后（newest_first 时为之前）创建的游戏
+        :param newest_first: 从最新创建的游戏开始倒序列出（轮询新游戏时第一页就能看到）
+        :return: (游戏列表, 下一页游标；没有更多时为 None)
+        """
+        if self.store.shared:
+            self._sync_all()
+        keys = [('all',)]
+        extra = {}
+        for name, value in (filters or {}).items():
+            if name == 'move_count' and str(value) != '0':
+                extra[name] = int(value)
+            else:
+                keys.append((name, str(value)))
+        
+        with self.index_lock:
+            # 从最小的索引开始扫描，其余条件用该游戏的索引键集合判断
+            base_key = min(keys, key=lambda key: len(self.indexes.get(key, ())))
+            base = self.indexes.get(base_key, [])
+            other_keys = set(keys) - {base_key}
+            
+            games = []
+            next_cursor = None
+            if newest_first:
+                position = bisect.bisect_left(base, cursor) if cursor else len(base)
+                step = -1
+            else:
+                position = bisect.bisect_right(base, cursor)
+                step = 1
+            while True:
+                index = position if step == 1 else position - 1
+                if not 0 <= index < len(base):
+                    break
+                seq = base[index]
+                position += step
+                game_id = self.seq_games.get(seq)
+                if game_id is None or not other_keys <= self.index_keys.get(game_id, set()):
+                    continue
+                game = self.games.get(game_id)
+                if game is None:
+                    continue
+                if 'move_count' in extra and game.move_count != extra['move_count']:
+                    continue
+                if len(games) == limit:
+                    next_cursor = self.game_seqs.get(games[-1].game_id)
+                    break
+                games.append(game)
+        return games, next_cursor
+    
+    def query_games(self, params: Dict[str, str]) -> Dict:
+        """
+        /api/games 查询：解析过滤、分页与字段投影参数并返回响应体
+        参数错误时抛出 ValueError
+        """
+        filters = {name: params[name] for name in INDEXED_FILTERS if params.get(name)}
+        if 'move_count' in filters and not str(filters['move_count']).isdigit():
+            raise ValueError("move_count 必须是非负整数")
+        try:
+            cursor = int(params.get('cursor') or 0)
+            limit = int(params.get('limit') or DEFAULT_LIST_LIMIT)
+        except ValueError:
+            raise ValueError("cursor / limit 必须是整数")
+        limit = max(1, min(limit, MAX_LIST_LIMIT))
+        order = params.get('order') or 'asc'
+        if order not in ('asc', 'desc'):
+            raise ValueError("order 必须是 asc 或 desc")
+        
+        fields = DEFAULT_SUMMARY_FIELDS
+        if params.get('fields'):
+            fields = tuple(field.strip() for field in params['fields'].split(',') if field.strip())
+            unknown = [field for field in fields if field not in GAME_SUMMARY_FIELDS]
+            if unknown:
+                raise ValueError(f"未知字段: {', '.join(unknown)}")
+        
+        games, next_cursor = self.list_games(filters, cursor, limit, newest_first=order == 'desc')
+        summaries = {game.game_id: self.summarize(game, fields) for game in games}
+        result = {
+            "status": "success",
+            "games": summaries,
+            "count": len(summaries),
+            "total_games": len(self.games),
+            "next_cursor": next_cursor
+        }
+        if params.get('cursors') == '1':
+            # 每局对应的游标（分片前端合并各分片结果后，用它算出截断处的下一页游标）
+            result["cursors"] = [self.game_seqs.get(game.game_id) for game in games]
+        return result
+    
+    @staticmethod
+    def summarize(game: TicTacToeGame, fields=DEFAULT_SUMMARY_FIELDS) -> Dict:
+        """只取所需字段的游戏摘要"""
+        return {field: GAME_SUMMARY_FIELDS[field](game) for field in fields}
+    
     def get_all_games(self) -> Dict[str, Dict]:
         """
         获取所有游戏的状态
@@ -148,43 +772,114 @@ class GameManager:
             for game_id, game in self.games.items()
         }
     
-    def _add_event(self, game_id: str, event: Dict):
+    def _add_event(self, game_id: str, event: Dict, seq: Optional[int] = None, publish: bool = True):
+        """
+        追加事件到事件日志
+        :param seq: 事件序号（游戏记录中的 event_seq），None 时取本进程日志的下一个序号
+        :param publish: 是否发布到跨进程事件总线（来自总线的事件不再转发）
+        """
+        if game_id in self.event_logs:
+            condition = self._game_lock(game_id)
+            with condition:
+                log = self.event_logs.get(game_id)
+                if log is None:
+                    return
+                if log.append(event, seq):
+                    # 订阅者跟不上或根本没人订阅：覆盖最旧的事件，落后的订阅者从 state_update 重新同步
+                    self.dropped_events += 1
+                    EVENTS_DROPPED.inc()
+                condition.notify_all()
+            self._notify_listeners(game_id, event)
+            if publish and self.event_bus is not None:
+                # 带上序号，其他进程用同一个序号追加，同一条事件在各进程的 SSE id 相同
+                self.event_bus.publish('event', game_id, {"seq": seq, "event": event})
+            if event_logger.isEnabledFor(logging.DEBUG):
+                event_logger.debug("事件入队", extra=fields(
+                    game_id=game_id, type=event.get('type'), player=event.get('player'),
+                    row=event.get('row'), col=event.get('col')
+                ))
+    
+    def subscribe_events(self, game_id: str) -> Optional[Tuple[Dict, int]]:
+        """
+        新订阅者的起点：当前局面和事件日志的最新序号（同一把锁内取得，两者一致）
+        :return: (游戏状态, 游标)，游戏不存在返回 None
+        """
+        if self.get_game(game_id) is None:
+            return None
+        with self._game_lock(game_id):
+            game = self.games.get(game_id)
+            log = self.event_logs.get(game_id)
+            if game is None or log is None:
+                return None
+            return game.get_state(), log.last_seq
+    
+    def read_events(self, game_id: str, cursor: int) -> Tuple[List[GameEvent], bool]:
         """
-        添加事件到队列
+        读取序号大于游标的事件（不移除，其他订阅者照样能读到）
+        :return: (事件列表, 是否有事件已被覆盖而错过)
         """
-        if game_id in self.event_queues:
-            self.event_queues[game_id].append(event)
-            event_type = event.get('type')
-            player = event.get('player', 'N/A')
-            row = event.get('row', 'N/A')
-            col = event.get('col', 'N/A')
-            print(f"📤 事件入队 [{game_id[:8]}...]: type={event_type}, player={player}, pos=({row},{col})")
+        log = self.event_logs.get(game_id)
+        if log is None:
+            return [], False
+        with self._game_lock(game_id):
+            return log.since(cursor)
     
-    def get_events(self, game_id: str) -> list:
+    def wait_for_events(self, game_id: str, cursor: int, timeout: float) -> Tuple[List[GameEvent], bool]:
         """
-        获取并清空事件队列
+        阻塞直到有序号大于游标的事件、游戏被删除或超时
+        :return: 同 read_events
         """
-        if game_id in self.event_queues:
-            events = self.event_queues[game_id][:]
-            self.event_queues[game_id].clear()
-            return events
-        return []
+        condition = self.event_conditions.get(game_id)
+        log = self.event_logs.get(game_id)
+        if condition is None or log is None:
+            return [], False
+        with condition:
+            if log.last_seq == cursor:
+                condition.wait(timeout)
+            return log.since(cursor)
     
-    def has_events(self, game_id: str) -> bool:
+    def wait_for_version(self, game_id: str, since: int, timeout: float) -> bool:
         """
-        检查是否有待发送的事件
+        阻塞直到局面版本号超过 since、游戏被删除或超时
+        与事件流共用同一个条件变量，落子/重置时立即唤醒
+        :return: 版本号是否已超过 since
         """
-        return game_id in self.event_queues and len(self.event_queues[game_id]) > 0
+        condition = self.event_conditions.get(game_id)
+        if condition is None:
+            return False
+        deadline = time.monotonic() + timeout
+        with condition:
+            while True:
+                game = self.games.get(game_id)
+                if game is None:
+                    return False
+                if game.version > since:
+                    return True
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                condition.wait(remaining)
+    
+    def has_events(self, game_id: str, cursor: int) -> bool:
+        """
+        检查游标之后是否有新事件
+        """
+        log = self.event_logs.get(game_id)
+        return log is not None and log.last_seq != cursor
     
     def _cleanup_expired_games(self):
         """
         清理过期的已完成游戏
         只清理已完成的游戏，保留进行中的游戏（无论多久）
         """
+        with CLEANUP_SECONDS.time('expired'):
+            self._cleanup_expired_games_timed()
+    
+    def _cleanup_expired_games_timed(self):
         now = datetime.now()
         expired_games = []
         
-        for game_id, timestamp in self.game_timestamps.items():
+        for game_id, timestamp in list(self.game_timestamps.items()):
             if game_id not in self.games:
                 continue
             
@@ -206,10 +901,14 @@ class GameManager:
         """
         主动清理旧的已完成游戏，只保留最近的N个
         """
+        with CLEANUP_SECONDS.time('old_finished'):
+            self._cleanup_old_finished_games_timed(keep_count)
+    
+    def _cleanup_old_finished_games_timed(self, keep_count: int):
         # 获取所有已完成的游戏，按时间排序
         finished_games = [
             (game_id, timestamp)
-            for game_id, timestamp in self.game_timestamps.items()
+            for game_id, timestamp in list(self.game_timestamps.items())
             if game_id in self.games and self.games[game_id].status == GameStatus.FINISHED
         ]
         finished_games.sort(key=lambda x: x[1], reverse=True)
@@ -246,10 +945,86 @@ class GameManager:
         }
         return {"status": "success", "timeline": timeline}
 
+    def _record_finished(self, game_id: str, publish: bool = True):
+        """
+        把刚结束的游戏追加到结束日志并唤醒等待中的流
+        """
+        result = self.get_timeline(game_id)
+        if result.get("status") != "success":
+            return
+        completion = self.completion_events.get(game_id)
+        if completion is not None:
+            completion.set()
+        self._append_finished(game_id, result["timeline"])
+        if publish and self.event_bus is not None:
+            self.event_bus.publish('finished', game_id, result["timeline"])
+    
+    def _append_finished(self, game_id: str, timeline: Dict):
+        with self.finished_condition:
+            self._forget_finished(game_id)
+            self.finished_seq += 1
+            entry = FinishedGameEntry(self.finished_seq, game_id, timeline)
+            self.finished_log.append(entry)
+            self.finished_entries[game_id] = entry
+            self.finished_condition.notify_all()
+    
+    def _forget_finished(self, game_id: str):
+        """
+        从结束日志移除（游戏被重置或删除）
+        """
+        with self.finished_condition:
+            entry = self.finished_entries.pop(game_id, None)
+            if entry is not None:
+                self.finished_log.remove(entry)
+    
+    def wait_for_completion(self, game_id: str, timeout: float) -> bool:
+        """
+        阻塞直到游戏结束、被删除或超时
+        :return: 完成事件是否已置位
+        """
+        completion = self.completion_events.get(game_id)
+        if completion is None:
+            return True
+        return completion.wait(timeout)
+    
+    def finished_since(self, cursor: int) -> List[FinishedGameEntry]:
+        """
+        返回序号大于游标的结束日志记录
+        """
+        with self.finished_condition:
+            start = bisect.bisect_right(self.finished_log, cursor, key=lambda entry: entry.seq)
+            return self.finished_log[start:]
+    
+    def wait_for_finished(self, cursor: int, timeout: float) -> List[FinishedGameEntry]:
+        """
+        阻塞直到有序号大于游标的记录或超时
+        """
+        with self.finished_condition:
+            if not self.finished_since(cursor):
+                self.finished_condition.wait(timeout)
+            return self.finished_since(cursor)
+    
     def get_finished_game_ids(self) -> list:
         """返回所有已结束的游戏ID列表"""
         return [gid for gid, g in self.games.items() if g.status == GameStatus.FINISHED]
 
 
-# 全局游戏管理器实例
-game_manager = GameManager()
+    def games_by_status(self) -> Dict[tuple, int]:
+        """各状态的游戏数（直接读索引）"""
+        return {(status.value,): len(self.indexes.get(('status', status.value), ()))
+                for status in GameStatus}
+    
+    def event_log_depths(self) -> Dict[tuple, int]:
+        """事件日志缓冲的事件数：总数与单局最大值"""
+        depths = [len(log) for log in list(self.event_logs.values())]
+        return {('total',): sum(depths), ('max',): max(depths, default=0)}
+
+
+# 全局游戏管理器实例（存储类型见 config.json 的 storage 段）
+game_manager = GameManager(store=store_from_config())
+# 多进程部署时连接跨进程事件总线（config.json 的 event_bus 段，默认关闭）
+game_manager.event_bus = event_bus_from_config(game_manager.apply_bus_message)
+
+CallbackGauge('arena_games', '游戏数（按状态）', game_manager.games_by_status, ('status',))
+CallbackGauge('arena_event_queue_depth', '事件日志缓冲的事件数（总数 / 单局最大）',
+              game_manager.event_log_depths, ('aggregate',))
@@ -0,0 +1,209 @@
+"""
+游戏存储
+GameManager 通过存储接口持久化游戏：
+    MemoryGameStore  进程内字典即存储（默认，单进程）
+    SQLiteGameStore  SQLite（WAL 模式），多个工作进程共享同一批游戏，落子按版本号乐观并发
+
+每局存一行紧凑记录：玩家类型、版本号和着法列表，局面由重放着法得到（最多9手）。
+写入时 UPDATE ... WHERE version = <读取时的版本>，影响行数为 0 说明其他进程已抢先写入，
+调用方重新读取后再试。
+
+config.json 中的 storage 段：
+    "storage": {
+        "backend": "sqlite",          # memory 或 sqlite
+        "path": "data/arena.db"       # 相对项目根目录
+    }
+"""
+import abc
+import json
+import logging
+import os
+import sqlite3
+import threading
+from typing import Dict, Optional
+
+from game_logic import TicTacToeGame
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_SQLITE_PATH = os.path.join('data', 'arena.db')
+
+
+class GameStore(abc.ABC):
+    """存储接口"""
+
+    # 其他进程是否可能修改存储中的游戏（为 True 时 GameManager 读取前要与存储同步）
+    shared = False
+
+    @abc.abstractmethod
+    def insert(self, game: TicTacToeGame):
+        """保存新建的游戏"""
+
+    @abc.abstractmethod
+    def save(self, game: TicTacToeGame, expected_version: int) -> bool:
+        """
+        保存修改后的游戏
+        :param expected_version: 修改前读到的版本号
+        :return: 存储中的版本号仍是 expected_version 时写入并返回 True，否则不写入返回 False
+        """
+
+    @abc.abstractmethod
+    def load(self, game_id: str) -> Optional[TicTacToeGame]:
+        """读取游戏，不存在时返回 None"""
+
+    @abc.abstractmethod
+    def version(self, game_id: str) -> Optional[int]:
+        """存储中的版本号，游戏不存在时返回 None"""
+
+    @abc.abstractmethod
+    def versions(self) -> Dict[str, int]:
+        """所有游戏的 {game_id: 版本号}"""
+
+    def changed(self) -> bool:
+        """自本线程上次调用以来，存储是否可能被其他连接修改过（无法判断时返回 True）"""
+        return True
+
+    @abc.abstractmethod
+    def delete(self, game_id: str):
+        """删除游戏（不存在时忽略）"""
+
+    def close(self):
+        pass
+
+
+class MemoryGameStore(GameStore):
+    """进程内存储：GameManager 的 games 字典本身就是唯一的数据，这里什么都不用做"""
+
+    def insert(self, game: TicTacToeGame):
+        pass
+
+    def save(self, game: TicTacToeGame, expected_version: int) -> bool:
+        return True
+
+    def load(self, game_id: str) -> Optional[TicTacToeGame]:
+        return None
+
+    def version(self, game_id: str) -> Optional[int]:
+        return None
+
+    def versions(self) -> Dict[str, int]:
+        return {}
+
+    def delete(self, game_id: str):
+        pass
+
+
+class SQLiteGameStore(GameStore):
+    """
+    SQLite 存储（WAL 模式）
+    读不阻塞写，多个进程可以同时打开同一个数据库文件；每个线程一个连接
+    """
+
+    shared = True
+
+    _SCHEMA = """
+        CREATE TABLE IF NOT EXISTS games (
+            game_id TEXT PRIMARY KEY,
+            version INTEGER NOT NULL,
+            status TEXT NOT NULL,
+            player_x_type TEXT NOT NULL,
+            player_o_type TEXT NOT NULL,
+            record TEXT NOT NULL
+        )
+    """
+
+    def __init__(self, path: str, busy_timeout: float = 5.0):
+        self.path = path
+        self.busy_timeout = busy_timeout
+        self._local = threading.local()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        connection = self._connection()
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute(self._SCHEMA)
+        logger.info(f"SQLite 游戏存储: {path}")
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            # 自动提交：每条写入语句自成一个事务，乐观并发由 WHERE version = ? 保证
+            connection = sqlite3.connect(self.path, timeout=self.busy_timeout,
+                                         isolation_level=None, check_same_thread=False)
+            # WAL 下 NORMAL 只在检查点时 fsync，落子写入不必每次刷盘
+            connection.execute('PRAGMA synchronous=NORMAL')
+            self._local.connection = connection
+            self._local.data_version = None
+        return connection
+
+    @staticmethod
+    def _encode(game: TicTacToeGame) -> str:
+        return json.dumps(game.to_record(), separators=(',', ':'))
+
+    def insert(self, game: TicTacToeGame):
+        self._connection().execute(
+            'INSERT INTO games (game_id, version, status, player_x_type, player_o_type, record) '
+            'VALUES (?, ?, ?, ?, ?, ?)',
+            (game.game_id, game.version, game.status.value, game.player_x_type.value,
+             game.player_o_type.value, self._encode(game))
+        )
+
+    def save(self, game: TicTacToeGame, expected_version: int) -> bool:
+        cursor = self._connection().execute(
+            'UPDATE games SET version = ?, status = ?, record = ? WHERE game_id = ? AND version = ?',
+            (game.version, game.status.value, self._encode(game), game.game_id, expected_version)
+        )
+        return cursor.rowcount == 1
+
+    def load(self, game_id: str) -> Optional[TicTacToeGame]:
+        row = self._connection().execute(
+            'SELECT record FROM games WHERE game_id = ?', (game_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        return TicTacToeGame.from_record(json.loads(row[0]))
+
+    def version(self, game_id: str) -> Optional[int]:
+        row = self._connection().execute(
+            'SELECT version FROM games WHERE game_id = ?', (game_id,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def versions(self) -> Dict[str, int]:
+        return dict(self._connection().execute('SELECT game_id, version FROM games'))
+
+    def changed(self) -> bool:
+        # data_version 只在其他连接提交写入后变化，且只能与同一连接上次读到的值比较
+        data_version = self._connection().execute('PRAGMA data_version').fetchone()[0]
+        changed = data_version != self._local.data_version
+        self._local.data_version = data_version
+        return changed
+
+    def delete(self, game_id: str):
+        self._connection().execute('DELETE FROM games WHERE game_id = ?', (game_id,))
+
+    def close(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is not None:
+            connection.close()
+            self._local.connection = None
+
+
+def store_from_config(path: Optional[str] = None) -> GameStore:
+    """按 config.json 的 storage 段创建存储（缺省为进程内存储）"""
+    path = path or os.path.join(BASE_DIR, 'config.json')
+    section = {}
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            section = json.load(f).get('storage', {})
+    except (OSError, ValueError):
+        pass
+    backend = section.get('backend', 'memory')
+    if backend == 'memory':
+        return MemoryGameStore()
+    if backend == 'sqlite':
+        db_path = section.get('path', DEFAULT_SQLITE_PATH)
+        if not os.path.isabs(db_path):
+            db_path = os.path.join(BASE_DIR, db_path)
+        return SQLiteGameStore(db_path)
+    raise ValueError(f"未知的存储类型: {backend}")
@@ -0,0 +1,122 @@
+"""
+m,n,k 棋盘几何工具
+为 m×n 棋盘、k 连珠规则预计算所有连线窗口（位掩码表示），
+供表库生成、威胁搜索、并行搜索等引擎共享
+"""
+from functools import lru_cache
+from typing import List, Optional, Tuple
+
+
+class MNKGeometry:
+    """m×n 棋盘 + k 连珠的几何信息"""
+
+    def __init__(self, rows: int, cols: int, k: int):
+        if rows <= 0 or cols <= 0:
+            raise ValueError("棋盘尺寸必须为正数")
+        if k <= 0 or k > max(rows, cols):
+            raise ValueError(f"k={k} 对 {rows}x{cols} 棋盘无效")
+
+        self.rows = rows
+        self.cols = cols
+        self.k = k
+        self.cells = rows * cols
+        self.full_mask = (1 << self.cells) - 1
+
+        # 所有长度为k的连线窗口（格子编号元组）
+        self.windows: List[Tuple[int, ...]] = []
+        for r in range(rows):
+            for c in range(cols):
+                for dr, dc in ((0, 1), (1, 0), (1, 1), (1, -1)):
+                    end_r = r + dr * (k - 1)
+                    end_c = c + dc * (k - 1)
+                    if 0 <= end_r < rows and 0 <= end_c < cols:
+                        self.windows.append(tuple(
+                            (r + dr * i) * cols + (c + dc * i) for i in range(k)
+                        ))
+
+        self.window_masks: List[int] = [
+            sum(1 << cell for cell in window) for window in self.windows
+        ]
+
+        # 每个格子所在的窗口编号（用于只检查最后一步相关的连线）
+        self.cell_windows: List[List[int]] = [[] for _ in range(self.cells)]
+        for window_id, window in enumerate(self.windows):
+            for cell in window:
+                self.cell_windows[cell].append(window_id)
+
+    def cell(self, row: int, col: int) -> int:
+        """(row, col) -> 格子编号"""
+        return row * self.cols + col
+
+    def position(self, cell: int) -> Tuple[int, int]:
+        """格子编号 -> (row, col)"""
+        return divmod(cell, self.cols)
+
+    def is_win(self, mask: int, last_cell: Optional[int] = None) -> bool:
+        """
+        判断位掩码是否包含k连
+        :param last_cell: 若给出，只检查经过该格子的窗口
+        """
+        if last_cell is None:
+            window_ids = range(len(self.window_masks))
+        else:
+            window_ids = self.cell_windows[last_cell]
+        for window_id in window_ids:
+            window_mask = self.window_masks[window_id]
+            if mask & window_mask == window_mask:
+                return True
+        return False
+
+    def winning_window(self, mask: int) -> Optional[Tuple[int, ...]]:
+        """返回第一个被占满的窗口，没有则返回None"""
+        for window, window_mask in zip(self.windows, self.window_masks):
+            if mask & window_mask == window_mask:
+                return window
+        return None
+
+    def board_to_masks(self, board) -> Tuple[int, int]:
+        """二维棋盘（None/'X'/'O'）-> (X掩码, O掩码)"""
+        x_mask = 0
+        o_mask = 0
+        for row in range(self.rows):
+            for col in range(self.cols):
+                cell = board[row][col]
+                if cell == 'X':
+                    x_mask |= 1 << (row * self.cols + col)
+                elif cell == 'O':
+                    o_mask |= 1 << (row * self.cols + col)
+        return x_mask, o_mask
+
+    def masks_to_board(self, x_mask: int, o_mask: int) -> list:
+        """(X掩码, O掩码) -> 二维棋盘"""
+        board = [[None for _ in range(self.cols)] for _ in range(self.rows)]
+        for cell in range(self.cells):
+            row, col = divmod(cell, self.cols)
+            if x_mask >> cell & 1:
+                board[row][col] = 'X'
+            elif o_mask >> cell & 1:
+                board[row][col] = 'O'
+        return board
+
+    def empty_cells(self, x_mask: int, o_mask: int) -> List[int]:
+        """所有空格子编号"""
+        occupied = x_mask | o_mask
+        return [cell for cell in range(self.cells) if not occupied >> cell & 1]
+
+
+@lru_cache(maxsize=None)
+def get_geometry(rows: int, cols: int, k: int) -> MNKGeometry:
+    """获取（缓存的）几何信息"""
+    return MNKGeometry(rows, cols, k)
+
+
+def geometry_for_board(board, k: Optional[int] = None) -> MNKGeometry:
+    """
+    根据二维棋盘推断几何信息
+    :param k: 连珠数，默认取 min(行数, 列数)，3×3 时即为井字棋
+    """
+    rows = len(board)
+    cols = len(board[0]) if rows else 0
+    if k is None:
+        k = min(rows, cols)
+    return get_geometry(rows, cols, k)
@@ -0,0 +1,166 @@
+"""
+NumPy 策略导出与推理
+把 models/*.zip 中 PPO / MaskablePPO 的策略网络导出为纯 NumPy 权重（.npz），
+推理时只需 numpy：不加载 torch / stable_baselines3，启动和单步推理都快几个数量级。
+
+导出（需要安装 requirements-rl.txt）：
+    python numpy_policy.py                       # 导出 models/ 下全部模型
+    python numpy_policy.py models/rl_agent_v2_ppo.zip
+
+推理：
+    policy = load_policy('models/rl_agent_v2_ppo')   # 优先使用同名 .npz
+    action, _ = policy.predict(obs, action_masks=masks, deterministic=True)
+"""
+import glob
+import os
+import sys
+from typing import Optional
+
+import numpy as np
+
+FORMAT_VERSION = 1
+
+_ACTIVATIONS = {
+    'identity': lambda x: x,
+    'tanh': np.tanh,
+    'relu': lambda x: np.maximum(x, 0.0),
+    'elu': lambda x: np.where(x > 0, x, np.expm1(np.minimum(x, 0.0))),
+    'leakyrelu': lambda x: np.where(x > 0, x, 0.01 * x),
+    'sigmoid': lambda x: 1.0 / (1.0 + np.exp(-x)),
+}
+
+
+def _strip_zip(path: str) -> str:
+    return path[:-4] if path.endswith('.zip') else path
+
+
+def export_policy(model_path: str, out_path: Optional[str] = None) -> str:
+    """
+    导出策略网络（需要 torch）
+    :param model_path: 模型路径（可带或不带 .zip）
+    :param out_path: 输出路径，默认与模型同名的 .npz
+    :return: 输出路径
+    """
+    import torch
+    from stable_baselines3 import PPO
+    try:
+        from sb3_contrib import MaskablePPO
+        model = MaskablePPO.load(_strip_zip(model_path), device='cpu')
+    except Exception:
+        model = PPO.load(_strip_zip(model_path), device='cpu')
+
+    policy = model.policy
+    arrays = {}
+    activations = []
+    layer = 0
+    for module in policy.mlp_extractor.policy_net:
+        if isinstance(module, torch.nn.Linear):
+            arrays[f'w{layer}'] = module.weight.detach().cpu().numpy().astype(np.float32)
+            arrays[f'b{layer}'] = module.bias.detach().cpu().numpy().astype(np.float32)
+            activations.append('identity')
+            layer += 1
+        else:
+            name = type(module).__name__.lower()
+            if name not in _ACTIVATIONS or not activations:
+                raise ValueError(f"不支持的策略网络层: {type(module).__name__}")
+            activations[-1] = name
+
+    arrays['action_w'] = policy.action_net.weight.detach().cpu().numpy().astype(np.float32)
+    arrays['action_b'] = policy.action_net.bias.detach().cpu().numpy().astype(np.float32)
+    arrays['activations'] = np.array(activations)
+    arrays['obs_dim'] = np.array(int(np.prod(policy.observation_space.shape)))
+    arrays['format_version'] = np.array(FORMAT_VERSION)
+
+    out_path = out_path or _strip_zip(model_path) + '.npz'
+    np.savez(out_path, **arrays)
+    return out_path
+
+
+class NumpyPolicy:
+    """纯 NumPy 的策略推理，predict 接口与 stable_baselines3 一致"""
+
+    def __init__(self, layers, activations, action_w, action_b, obs_dim: int):
+        self.layers = layers
+        self.activations = [_ACTIVATIONS[name] for name in activations]
+        self.action_w = action_w
+        self.action_b = action_b
+        self.obs_dim = obs_dim
+        self.rng = np.random.default_rng()
+
+    @classmethod
+    def load(cls, path: str) -> "NumpyPolicy":
+        with np.load(path, allow_pickle=False) as data:
+            if int(data['format_version']) != FORMAT_VERSION:
+                raise ValueError(f"不支持的策略文件版本: {path}")
+            activations = [str(name) for name in data['activations']]
+            # 预先转置，推理时直接 x @ W
+            layers = [
+                (np.ascontiguousarray(data[f'w{i}'].T), data[f'b{i}'].copy())
+                for i in range(len(activations))
+            ]
+            return cls(layers, activations, np.ascontiguousarray(data['action_w'].T),
+                       data['action_b'].copy(), int(data['obs_dim']))
+
+    def logits(self, observation: np.ndarray) -> np.ndarray:
+        x = np.asarray(observation, dtype=np.float32).reshape(-1, self.obs_dim)
+        for (weight, bias), activation in zip(self.layers, self.activations):
+            x = activation(x @ weight + bias)
+        return x @ self.action_w + self.action_b
+
+    def predict(self, observation, action_masks=None, deterministic: bool = True, **_):
+        """
+        :param observation: 单个观察 (obs_dim,) 或一批 (n, obs_dim)
+        :param action_masks: 可选，同形状的布尔掩码（True=合法）
+        :return: (动作, None)；单个观察时返回0维数组
+        """
+        single = np.asarray(observation).ndim == 1
+        logits = self.logits(observation)
+        if action_masks is not None:
+            masks = np.asarray(action_masks, dtype=bool).reshape(logits.shape)
+            logits = np.where(masks, logits, -np.inf)
+
+        if deterministic:
+            actions = np.argmax(logits, axis=1)
+        else:
+            shifted = np.exp(logits - logits.max(axis=1, keepdims=True))
+            probs = shifted / shifted.sum(axis=1, keepdims=True)
+            actions = np.array([self.rng.choice(len(p), p=p) for p in probs])
+
+        if single:
+            return actions[0], None
+        return actions, None
+
+
+def load_policy(model_path: str, algorithm: str = 'maskable_ppo'):
+    """
+    加载策略：存在同名 .npz 时使用 NumpyPolicy，否则回退到 stable_baselines3
+    :param model_path: 模型路径（可带或不带 .zip）
+    :param algorithm: 回退加载时使用的算法（'maskable_ppo' 或 'ppo'）
+    """
+    base = _strip_zip(model_path)
+    if os.path.exists(base + '.npz'):
+        return NumpyPolicy.load(base + '.npz')
+    if algorithm == 'ppo':
+        from stable_baselines3 import PPO
+        return PPO.load(base, device='cpu')
+    from sb3_contrib import MaskablePPO
+    return MaskablePPO.load(base, device='cpu')
+
+
+def main():
+    paths = sys.argv[1:] or sorted(glob.glob(os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), 'models', '*.zip'
+    )))
+    if not paths:
+        print("❌ 没有找到模型文件")
+        sys.exit(1)
+    for path in paths:
+        try:
+            out_path = export_policy(path)
+            print(f"✓ {path} -> {out_path}")
+        except Exception as e:
+            print(f"❌ 导出失败 {path}: {e}")
+
+
+if __name__ == '__main__':
+    main()
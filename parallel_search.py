@@ -0,0 +1,444 @@
+"""
+Lazy-SMP 并行 Alpha-Beta 搜索
+多个工作进程从同一根局面出发，以不同的起始深度和着法顺序做迭代加深搜索，
+通过共享内存中的置换表（Transposition Table）共享彼此的结果，
+主进程取完成深度最深的结果作为最终着法。
+工作进程和置换表常驻（SearchPool），连续走棋时复用。
+
+置换表采用无锁写入：每个槽位存 (key ^ data, data)，读取时校验，
+并发写入造成的撕裂数据会因校验失败而被当作未命中。
+"""
+import atexit
+import multiprocessing
+import queue
+import random
+import threading
+import time
+from multiprocessing import shared_memory
+from typing import Optional, Tuple
+
+import numpy as np
+
+from mnk_board import MNKGeometry
+
+WIN_SCORE = 30000
+MATE_THRESHOLD = WIN_SCORE - 1000
+EVAL_LIMIT = 20000
+
+FLAG_EXACT = 0
+FLAG_LOWER = 1
+FLAG_UPPER = 2
+NO_MOVE = 255
+
+DEFAULT_TT_ENTRIES = 1 << 20  # 16MB
+
+_ZOBRIST_SEED = 20251106
+
+
+class _Aborted(Exception):
+    """收到停止信号"""
+
+
+def _zobrist_table(cells: int):
+    rng = random.Random(_ZOBRIST_SEED)
+    return [[rng.getrandbits(63) for _ in range(cells)] for _ in range(2)]
+
+
+def _pack(score: int, depth: int, flag: int, move: int) -> int:
+    return (score + 32768) | (depth << 16) | (flag << 24) | (move << 26)
+
+
+def _unpack(data: int) -> Tuple[int, int, int, int]:
+    return (data & 0xFFFF) - 32768, (data >> 16) & 0xFF, (data >> 24) & 0x3, (data >> 26) & 0xFF
+
+
+class TranspositionTable:
+    """基于 numpy 数组的置换表，数组可以建立在共享内存之上"""
+
+    def __init__(self, array: np.ndarray):
+        self.array = array
+        self.mask = array.shape[0] - 1
+
+    def probe(self, key: int) -> Optional[Tuple[int, int, int, int]]:
+        slot = key & self.mask
+        check, data = int(self.array[slot, 0]), int(self.array[slot, 1])
+        if check ^ data != key:
+            return None
+        return _unpack(data)
+
+    def store(self, key: int, score: int, depth: int, flag: int, move: int):
+        slot = key & self.mask
+        existing = self.probe(key)
+        if existing is not None and existing[1] > depth:
+            return
+        data = _pack(score, depth, flag, move)
+        self.array[slot, 1] = data
+        self.array[slot, 0] = key ^ data
+
+
+class Searcher:
+    """单个搜索线程：带置换表的负极大值 Alpha-Beta 迭代加深"""
+
+    def __init__(self, geometry: MNKGeometry, table: TranspositionTable,
+                 worker_id: int = 0, stop_event=None):
+        if geometry.cells >= NO_MOVE:
+            raise ValueError(f"置换表着法字段只有8位，棋盘格子数必须小于 {NO_MOVE}")
+        self.geometry = geometry
+        self.table = table
+        self.worker_id = worker_id
+        self.stop_event = stop_event
+        self.zobrist = _zobrist_table(geometry.cells)
+        self.rng = random.Random(worker_id)
+        self.nodes = 0
+        # 大棋盘只考虑已有棋子附近的空位
+        self.neighbourhood = None
+        if geometry.cells > 25:
+            self.neighbourhood = []
+            for cell in range(geometry.cells):
+                row, col = geometry.position(cell)
+                mask = 0
+                for r in range(max(0, row - 2), min(geometry.rows, row + 3)):
+                    for c in range(max(0, col - 2), min(geometry.cols, col + 3)):
+                        mask |= 1 << geometry.cell(r, c)
+                self.neighbourhood.append(mask)
+
+    def hash(self, own: int, opp: int, side: int) -> int:
+        key = 0
+        for cell in range(self.geometry.cells):
+            if own >> cell & 1:
+                key ^= self.zobrist[side][cell]
+            elif opp >> cell & 1:
+                key ^= self.zobrist[1 - side][cell]
+        return key
+
+    def evaluate(self, own: int, opp: int) -> int:
+        """窗口启发式：只含单方棋子的窗口按棋子数指数加权"""
+        score = 0
+        for window_mask in self.geometry.window_masks:
+            own_part = own & window_mask
+            opp_part = opp & window_mask
+            if own_part and not opp_part:
+                score += 4 ** bin(own_part).count("1")
+            elif opp_part and not own_part:
+                score -= 4 ** bin(opp_part).count("1")
+        return max(-EVAL_LIMIT, min(EVAL_LIMIT, score))
+
+    def candidate_moves(self, own: int, opp: int, tt_move: int):
+        occupied = own | opp
+        if self.neighbourhood is not None and occupied:
+            zone = 0
+            for cell in range(self.geometry.cells):
+                if occupied >> cell & 1:
+                    zone |= self.neighbourhood[cell]
+        else:
+            zone = self.geometry.full_mask
+        moves = [cell for cell in range(self.geometry.cells)
+                 if zone >> cell & 1 and not occupied >> cell & 1]
+        if not moves:
+            return moves
+
+        if self.worker_id == 0:
+            # 主线程：中心优先
+            center_row = (self.geometry.rows - 1) / 2
+            center_col = (self.geometry.cols - 1) / 2
+            moves.sort(key=lambda cell: abs(cell // self.geometry.cols - center_row)
+                       + abs(cell % self.geometry.cols - center_col))
+        else:
+            # 辅助线程：打乱顺序，使各进程探索不同的子树
+            self.rng.shuffle(moves)
+        if tt_move in moves:
+            moves.remove(tt_move)
+            moves.insert(0, tt_move)
+        return moves
+
+    def negamax(self, own: int, opp: int, side: int, key: int, depth: int,
+                alpha: int, beta: int, ply: int, last_cell: Optional[int]) -> Tuple[int, int]:
+        """
+        :return: (分值, 最佳着法)，分值以 own 一方为视角
+        """
+        self.nodes += 1
+        if self.stop_event is not None and self.nodes & 1023 == 0 and self.stop_event.is_set():
+            raise _Aborted()
+
+        if last_cell is not None and self.geometry.is_win(opp, last_cell):
+            return -(WIN_SCORE - ply), NO_MOVE
+        if (own | opp) == self.geometry.full_mask:
+            return 0, NO_MOVE
+        if depth == 0:
+            return self.evaluate(own, opp), NO_MOVE
+
+        tt_move = NO_MOVE
+        entry = self.table.probe(key)
+        if entry is not None:
+            tt_score, tt_depth, tt_flag, tt_move = entry
+            if tt_score > MATE_THRESHOLD:
+                tt_score -= ply
+            elif tt_score < -MATE_THRESHOLD:
+                tt_score += ply
+            if tt_depth >= depth and ply > 0:
+                if tt_flag == FLAG_EXACT:
+                    return tt_score, tt_move
+                if tt_flag == FLAG_LOWER and tt_score >= beta:
+                    return tt_score, tt_move
+                if tt_flag == FLAG_UPPER and tt_score <= alpha:
+                    return tt_score, tt_move
+
+        original_alpha = alpha
+        best_score = -WIN_SCORE - 1
+        best_move = NO_MOVE
+        for cell in self.candidate_moves(own, opp, tt_move):
+            bit = 1 << cell
+            score, _ = self.negamax(opp, own | bit, 1 - side, key ^ self.zobrist[side][cell],
+                                    depth - 1, -beta, -alpha, ply + 1, cell)
+            score = -score
+            if score > best_score:
+                best_score = score
+                best_move = cell
+            alpha = max(alpha, score)
+            if alpha >= beta:
+                break
+
+        if best_score <= original_alpha:
+            flag = FLAG_UPPER
+        elif best_score >= beta:
+            flag = FLAG_LOWER
+        else:
+            flag = FLAG_EXACT
+        stored = best_score
+        if stored > MATE_THRESHOLD:
+            stored += ply
+        elif stored < -MATE_THRESHOLD:
+            stored -= ply
+        self.table.store(key, stored, depth, flag, best_move)
+        return best_score, best_move
+
+    def iterate(self, own: int, opp: int, side: int, max_depth: int, start_depth: int = 1):
+        """迭代加深，每完成一层产出 (深度, 分值, 着法)"""
+        key = self.hash(own, opp, side)
+        for depth in range(start_depth, max_depth + 1):
+            score, move = self.negamax(own, opp, side, key, depth,
+                                       -WIN_SCORE - 1, WIN_SCORE + 1, 0, None)
+            yield depth, score, move
+            if abs(score) > MATE_THRESHOLD:
+                return
+
+
+def _worker_main(shm_name: str, entries: int, worker_id: int, tasks, results, stop_event):
+    """
+    常驻工作进程入口：循环接收搜索任务，收到 None 时退出
+    任务为 (搜索编号, rows, cols, k, own, opp, side, max_depth)，
+    每次搜索结束（完成或被停止）都回报一条 (搜索编号, worker_id, None, None, None)
+    """
+    from mnk_board import get_geometry
+
+    shm = shared_memory.SharedMemory(name=shm_name)
+    array = None
+    table = None
+    searchers = {}
+    try:
+        array = np.ndarray((entries, 2), dtype=np.uint64, buffer=shm.buf)
+        table = TranspositionTable(array)
+        while True:
+            task = tasks.get()
+            if task is None:
+                break
+            search_id, rows, cols, k, own, opp, side, max_depth = task
+            # 同一棋盘规格复用搜索器（Zobrist表、邻域表只建一次）
+            searcher = searchers.get((rows, cols, k))
+            if searcher is None:
+                searcher = Searcher(get_geometry(rows, cols, k), table, worker_id, stop_event)
+                searchers[(rows, cols, k)] = searcher
+            # 一半进程从深一层开始，错开搜索节奏
+            start_depth = 1 + worker_id % 2 if max_depth > 1 else 1
+            try:
+                for depth, score, move in searcher.iterate(own, opp, side, max_depth, start_depth):
+                    results.put((search_id, worker_id, depth, score, move))
+            except _Aborted:
+                pass
+            results.put((search_id, worker_id, None, None, None))
+    finally:
+        # 释放对共享内存缓冲区的引用后才能关闭
+        del searchers, table, array
+        shm.close()
+
+
+class SearchPool:
+    """
+    常驻的 Lazy-SMP 搜索进程池
+    置换表所在的共享内存和工作进程在第一次搜索时创建，此后每步棋复用：
+    省去每步建共享内存、启动进程的开销，置换表里上一步的结果也能继续命中。
+    棋盘规格（rows, cols, k）变化时清空置换表。用完调用 shutdown() 释放。
+    """
+
+    def __init__(self, workers: int = 4, tt_entries: int = DEFAULT_TT_ENTRIES):
+        """
+        :param workers: 工作进程数
+        :param tt_entries: 置换表槽位数（必须是2的幂）
+        """
+        self.workers = workers
+        self.tt_entries = tt_entries
+        self._lock = threading.Lock()
+        self._shm = None
+        self._array = None
+        self._processes = []
+        self._tasks = []
+        self._results = None
+        self._stop_event = None
+        self._search_id = 0
+        self._spec = None
+
+    @property
+    def started(self) -> bool:
+        return self._shm is not None
+
+    def _start(self):
+        context = multiprocessing.get_context()
+        self._shm = shared_memory.SharedMemory(create=True, size=self.tt_entries * 16)
+        self._array = np.ndarray((self.tt_entries, 2), dtype=np.uint64, buffer=self._shm.buf)
+        self._array[:] = 0
+        self._results = context.Queue()
+        self._stop_event = context.Event()
+        self._tasks = [context.Queue() for _ in range(self.workers)]
+        self._processes = []
+        for worker_id in range(self.workers):
+            process = context.Process(
+                target=_worker_main,
+                args=(self._shm.name, self.tt_entries, worker_id,
+                      self._tasks[worker_id], self._results, self._stop_event),
+                daemon=True,
+            )
+            process.start()
+            self._processes.append(process)
+        atexit.register(self.shutdown)
+
+    def search(self, geometry: MNKGeometry, own: int, opp: int, side: int = 0,
+               time_limit: float = 1.0,
+               max_depth: Optional[int] = None) -> Tuple[Optional[int], int, int]:
+        """
+        并行搜索一个局面（同一时间只进行一次搜索，并发调用排队）
+        :return: (最佳着法格子编号, 分值, 完成深度)
+        """
+        empty = geometry.cells - bin(own | opp).count("1")
+        max_depth = min(max_depth or empty, empty)
+        if max_depth <= 0:
+            return None, 0, 0
+
+        with self._lock:
+            if not self.started:
+                self._start()
+            spec = (geometry.rows, geometry.cols, geometry.k)
+            if spec != self._spec:
+                # 不同规格的同一位掩码哈希相同但胜负不同，旧结果不能复用
+                self._array[:] = 0
+                self._spec = spec
+
+            self._search_id += 1
+            search_id = self._search_id
+            self._stop_event.clear()
+            for tasks in self._tasks:
+                tasks.put((search_id, geometry.rows, geometry.cols, geometry.k,
+                           own, opp, side, max_depth))
+
+            best = (None, 0, 0)
+            finished = 0
+            deadline = time.perf_counter() + time_limit
+            try:
+                while finished < self.workers:
+                    remaining = deadline - time.perf_counter()
+                    if remaining <= 0:
+                        break
+                    try:
+                        result_id, _, depth, score, move = self._results.get(timeout=remaining)
+                    except queue.Empty:
+                        break
+                    if result_id != search_id:
+                        continue
+                    if depth is None:
+                        finished += 1
+                        continue
+                    # 取完成深度最深的结果
+                    if depth > best[2] and move != NO_MOVE:
+                        best = (move, score, depth)
+                    if depth >= max_depth or abs(score) > MATE_THRESHOLD:
+                        break
+            finally:
+                self._stop_event.set()
+            # 等各进程停下，下一次搜索开始时没有进程还在写上一局面
+            if not self._drain(search_id, self.workers - finished):
+                self._shutdown()
+            return best
+
+    def _drain(self, search_id: int, pending: int) -> bool:
+        deadline = time.perf_counter() + 1.0
+        while pending > 0:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                return False
+            try:
+                result_id, _, depth, _, _ = self._results.get(timeout=remaining)
+            except queue.Empty:
+                return False
+            if result_id == search_id and depth is None:
+                pending -= 1
+        return True
+
+    def shutdown(self):
+        """停止工作进程并释放置换表的共享内存"""
+        with self._lock:
+            self._shutdown()
+
+    def _shutdown(self):
+        if not self.started:
+            return
+        atexit.unregister(self.shutdown)
+        self._stop_event.set()
+        for tasks in self._tasks:
+            tasks.put(None)
+        for process in self._processes:
+            process.join(timeout=1.0)
+            if process.is_alive():
+                process.terminate()
+        self._processes = []
+        self._tasks = []
+        self._array = None
+        self._shm.close()
+        self._shm.unlink()
+        self._shm = None
+        self._spec = None
+
+
+def lazy_smp_search(geometry: MNKGeometry, own: int, opp: int, side: int = 0,
+                    workers: int = 4, time_limit: float = 1.0,
+                    max_depth: Optional[int] = None,
+                    tt_entries: int = DEFAULT_TT_ENTRIES) -> Tuple[Optional[int], int, int]:
+    """
+    一次性的多进程 Lazy-SMP 搜索（临时建池，搜完即关闭；连续走棋请复用 SearchPool）
+    :param own: 走棋方的位掩码
+    :param opp: 对手的位掩码
+    :param side: 走棋方编号（0=X, 1=O），只影响哈希
+    :param time_limit: 搜索时间上限（秒）
+    :param max_depth: 最大深度，默认搜到终局
+    :param tt_entries: 置换表槽位数（必须是2的幂）
+    :return: (最佳着法格子编号, 分值, 完成深度)
+    """
+    pool = SearchPool(workers, tt_entries)
+    try:
+        return pool.search(geometry, own, opp, side, time_limit, max_depth)
+    finally:
+        pool.shutdown()
+
+
+def search(geometry: MNKGeometry, own: int, opp: int, side: int = 0,
+           max_depth: Optional[int] = None,
+           tt_entries: int = 1 << 16) -> Tuple[Optional[int], int, int]:
+    """单进程搜索（不建共享内存），接口与 lazy_smp_search 一致"""
+    empty = geometry.cells - bin(own | opp).count("1")
+    max_depth = min(max_depth or empty, empty)
+    if max_depth <= 0:
+        return None, 0, 0
+    table = TranspositionTable(np.zeros((tt_entries, 2), dtype=np.uint64))
+    best = (None, 0, 0)
+    for depth, score, move in Searcher(geometry, table).iterate(own, opp, side, max_depth):
+        if move != NO_MOVE:
+            best = (move, score, depth)
+    return best
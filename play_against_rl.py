@@ -5,10 +5,12 @@
 import requests
 import numpy as np
 import time
-from sb3_contrib import MaskablePPO
-from sb3_contrib.common.wrappers import ActionMasker
+from numpy_policy import load_policy
 import sys
 
+# 等待对手落子时每次长轮询的最长等待（秒）
+LONG_POLL_WAIT = 25
+
 class RLWebPlayer:
     """RL Agent Web 玩家"""
     
@@ -16,11 +18,13 @@ class RLWebPlayer:
         self.model_path = model_path
         self.base_url = base_url
         self.session = requests.Session()
+        # 条件请求缓存 {game_id: (etag, game_state)}，局面未变化时服务器返回 304
+        self._state_cache = {}
         
-        # 加载模型
-        print(f"🤖 加载 RL Agent: {model_path}.zip")
-        self.model = MaskablePPO.load(f"{model_path}")
-        print("✓ 模型加载成功\n")
+        # 加载模型（存在导出的 .npz 时无需 torch）
+        print(f"🤖 加载 RL Agent: {model_path}")
+        self.model = load_policy(model_path)
+        print(f"✓ 模型加载成功 ({type(self.model).__name__})\n")
     
     def board_to_observation(self, board, player):
         """将棋盘转换为观察向量"""
@@ -43,6 +47,24 @@ class RLWebPlayer:
                 masks.append(cell is None)
         return np.array(masks, dtype=np.bool_)
     
+    def get_game_state(self, game_id, since=None, wait=0):
+        """
+        获取游戏状态（带 If-None-Match，未变化时复用上次的状态）
+        传入 since 时为长轮询：服务器最多等待 wait 秒直到版本号超过 since
+        """
+        etag, cached = self._state_cache.get(game_id, (None, None))
+        headers = {'If-None-Match': etag} if etag else {}
+        params = {'since': since, 'wait': wait} if since is not None else None
+        response = self.session.get(f'{self.base_url}/api/game/{game_id}/state',
+                                    headers=headers, params=params, timeout=wait + 5)
+        if response.status_code == 304:
+            return cached
+        if response.status_code != 200:
+            return None
+        game_state = response.json()['game_state']
+        self._state_cache[game_id] = (response.headers.get('ETag'), game_state)
+        return game_state
+    
     def action_to_position(self, action):
         """将动作转换为位置"""
         return int(action // 3), int(action % 3)
@@ -66,22 +88,22 @@ class RLWebPlayer:
         # 监听游戏状态
         player = agent_player
         
+        version = None
         while True:
-            time.sleep(0.5)
-            
-            # 获取游戏状态
-            response = self.session.get(f'{self.base_url}/api/game/{game_id}/state')
-            if response.status_code != 200:
+            # 获取游戏状态（首次立即返回，之后长轮询等待对手落子）
+            game_state = self.get_game_state(game_id, since=version, wait=LONG_POLL_WAIT)
+            if game_state is None:
                 print("   ❌ 获取游戏状态失败")
                 return None
+            version = game_state['version']
             
-            game_state = response.json()['game_state']
             board = game_state['board']
             status = game_state['status']
             current_player = game_state['current_player']
             
             # 检查游戏是否结束
             if status == 'finished':
+                self._state_cache.pop(game_id, None)
                 winner = game_state.get('winner')
                 if winner == player:
                     print(f"\n   🎉 Agent ({player}) 胜利!")
@@ -143,8 +165,13 @@ class RLWebPlayer:
             while True:
                 time.sleep(1)  # 每秒检查一次
                 
-                # 获取所有进行中的游戏
-                response = self.session.get(f'{self.base_url}/api/games?status=in_progress')
+                # 获取有外部 Agent 参与、进行中的游戏（只取需要的字段）
+                response = self.session.get(f'{self.base_url}/api/games', params={
+                    'status': 'in_progress',
+                    'player_type': 'agent',
+                    'order': 'desc',
+                    'fields': 'game_id,player_x_type,player_o_type'
+                })
                 if response.status_code != 200:
                     continue
                 
@@ -221,7 +248,7 @@ if __name__ == '__main__':
     # 检查模型文件
     import os
     model_path = 'models/rl_agent_v2_ppo'
-    if not os.path.exists(f"{model_path}.zip"):
+    if not os.path.exists(f"{model_path}.zip") and not os.path.exists(f"{model_path}.npz"):
         print(f"❌ 找不到模型文件: {model_path}.zip")
         print("\n请先训练模型:")
         print("  python rl_agent_v2.py --train 5000")
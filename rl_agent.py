@@ -52,6 +52,9 @@ class TicTacToeEnv(gym.Env):
         self.illegal_moves = 0  # 新增：非法移动计数
         self.errors = 0  # 新增：错误计数
         
+        # 当前棋盘（step 直接使用，无需每步再请求状态）
+        self.current_board = None
+        
     def _create_game(self):
         """创建新游戏"""
         url = f'{self.base_url}/api/game/create'
@@ -65,6 +68,7 @@ class TicTacToeEnv(gym.Env):
                 data = response.json()
                 self.game_id = data['game_id']
                 self.player = 'X'  # Agent总是X（先手）
+                self.current_board = data['game_state']['board']
                 return True
             else:
                 print(f"创建游戏失败: {response.status_code}")
@@ -105,6 +109,24 @@ class TicTacToeEnv(gym.Env):
             print(f"移动异常: {e}")
             return False
     
+    def _move_and_reply(self, row, col):
+        """落子并让AI回应，返回最终结果（失败返回None）"""
+        if not self.game_id:
+            return None
+        
+        url = f'{self.base_url}/api/game/{self.game_id}/move-and-reply'
+        try:
+            response = self.session.post(url, json={
+                'row': int(row),
+                'col': int(col)
+            }, timeout=5)
+            if response.status_code == 200:
+                return response.json()
+            return None
+        except Exception as e:
+            print(f"移动异常: {e}")
+            return None
+    
     def _request_ai_move(self):
         """请求AI下棋"""
         if not self.game_id:
@@ -153,29 +175,23 @@ class TicTacToeEnv(gym.Env):
         self.episode_count += 1
         
         # 创建新游戏
+        self.current_board = None
         if not self._create_game():
             # 如果创建失败，返回空棋盘
             return np.zeros(9, dtype=np.float32), {}
         
-        # 获取初始状态
-        game_state = self._get_game_state()
-        if game_state:
-            board = game_state['board']
-            obs = self._board_to_observation(board, self.player)
-            return obs, {}
-        
-        return np.zeros(9, dtype=np.float32), {}
+        # 创建响应已带初始局面，无需再请求状态
+        obs = self._board_to_observation(self.current_board, self.player)
+        return obs, {}
     
     def step(self, action):
-        """执行一步动作"""
-        game_state = self._get_game_state()
-        if not game_state:
+        """执行一步动作（一次请求完成己方落子和AI回应）"""
+        board = self.current_board
+        if board is None:
             self.losses += 1  # 统计错误
             self.errors += 1  # 记录错误
             return np.zeros(9, dtype=np.float32), -10, True, False, {'result': 'error'}
         
-        board = game_state['board']
-        
         # 检查动作是否合法
         if not self._is_valid_action(action, board):
             # 非法移动，给予惩罚并结束
@@ -184,29 +200,21 @@ class TicTacToeEnv(gym.Env):
             obs = self._board_to_observation(board, self.player)
             return obs, -5, True, False, {'illegal_move': True, 'result': 'illegal'}
         
-        # 执行移动
+        # 执行移动，对局继续时服务器让AI直接回应
         row, col = self._action_to_position(action)
-        if not self._make_move(row, col):
+        data = self._move_and_reply(row, col)
+        if not data:
             self.losses += 1  # 统计移动失败
             self.errors += 1  # 记录错误
             return np.zeros(9, dtype=np.float32), -10, True, False, {'result': 'error'}
         
-        time.sleep(0.05)  # 短暂等待服务器更新
-        
-        # 获取移动后的状态
-        game_state = self._get_game_state()
-        if not game_state:
-            self.losses += 1  # 统计错误
-            self.errors += 1  # 记录错误
-            return np.zeros(9, dtype=np.float32), -10, True, False, {'result': 'error'}
-        
-        board = game_state['board']
-        status = game_state['status']
+        board = data['game_state']['board']
+        self.current_board = board
+        obs = self._board_to_observation(board, self.player)
         
         # 检查游戏是否结束
-        if status == 'finished':
-            winner = game_state.get('winner')
-            obs = self._board_to_observation(board, self.player)
+        if data['game_over']:
+            winner = data.get('winner')
             
             if winner == self.player:
                 # 赢了
@@ -221,36 +229,6 @@ class TicTacToeEnv(gym.Env):
                 self.losses += 1
                 return obs, -10, True, False, {'result': 'loss'}
         
-        # 游戏继续，请求对手下棋
-        self._request_ai_move()
-        time.sleep(0.05)
-        
-        # 获取对手下棋后的状态
-        game_state = self._get_game_state()
-        if not game_state:
-            self.losses += 1  # 统计错误
-            self.errors += 1  # 记录错误
-            return np.zeros(9, dtype=np.float32), -10, True, False, {'result': 'error'}
-        
-        board = game_state['board']
-        status = game_state['status']
-        obs = self._board_to_observation(board, self.player)
-        
-        # 再次检查游戏是否结束
-        if status == 'finished':
-            winner = game_state.get('winner')
-            
-            if winner == self.player:
-                self.wins += 1
-                return obs, 10, True, False, {'result': 'win'}
-            elif winner is None:
-                # 平局 - 对于先手,平局是不错的结果
-                self.draws += 1
-                return obs, 5, True, False, {'result': 'draw'}
-            else:
-                self.losses += 1
-                return obs, -10, True, False, {'result': 'loss'}
-        
         # 游戏继续，给予小奖励（活着就好）
         return obs, 0.1, False, False, {}
     
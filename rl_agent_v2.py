@@ -79,6 +79,7 @@ class TicTacToeEnv(gym.Env):
                 data = response.json()
                 self.game_id = data['game_id']
                 self.player = 'X'
+                self.current_board = data['game_state']['board']
                 return True
         except Exception as e:
             pass
@@ -113,6 +114,23 @@ class TicTacToeEnv(gym.Env):
         except Exception as e:
             return False
     
+    def _move_and_reply(self, row, col):
+        """落子并让AI回应，返回最终结果（失败返回None）"""
+        if not self.game_id:
+            return None
+        
+        url = f'{self.base_url}/api/game/{self.game_id}/move-and-reply'
+        try:
+            response = self.session.post(url, json={
+                'row': int(row),
+                'col': int(col)
+            }, timeout=5)
+            if response.status_code == 200:
+                return response.json()
+        except Exception as e:
+            pass
+        return None
+    
     def _request_ai_move(self):
         """请求AI下棋"""
         if not self.game_id:
@@ -152,89 +170,38 @@ class TicTacToeEnv(gym.Env):
             self.current_board = [[None]*3 for _ in range(3)]
             return np.zeros(9, dtype=np.float32), {}
         
-        game_state = self._get_game_state()
-        if game_state:
-            self.current_board = game_state['board']
-            obs = self._board_to_observation(self.current_board, self.player)
-            return obs, {}
-        
-        self.current_board = [[None]*3 for _ in range(3)]
-        return np.zeros(9, dtype=np.float32), {}
+        # 创建响应已带初始局面，无需再请求状态
+        obs = self._board_to_observation(self.current_board, self.player)
+        return obs, {}
     
     def step(self, action):
-        """执行一步动作"""
-        game_state = self._get_game_state()
-        if not game_state:
-            self.losses += 1
-            self.errors += 1
-            return np.zeros(9, dtype=np.float32), -10, True, False, {'result': 'error'}
-        
-        self.current_board = game_state['board']
-        
-        # 执行移动（已通过动作掩码保证合法）
+        """执行一步动作（一次请求完成己方落子和AI回应）"""
         row, col = self._action_to_position(action)
-        if not self._make_move(row, col):
-            self.losses += 1
-            self.errors += 1
-            return np.zeros(9, dtype=np.float32), -10, True, False, {'result': 'error'}
-        
-        time.sleep(0.05)
-        
-        # 获取移动后的状态
-        game_state = self._get_game_state()
-        if not game_state:
+        data = self._move_and_reply(row, col)
+        if not data:
             self.losses += 1
             self.errors += 1
             return np.zeros(9, dtype=np.float32), -10, True, False, {'result': 'error'}
         
+        game_state = data['game_state']
         self.current_board = game_state['board']
-        status = game_state['status']
-        
-        # 检查游戏是否结束
-        if status == 'finished':
-            winner = game_state.get('winner')
-            obs = self._board_to_observation(self.current_board, self.player)
-            
-            if winner == self.player:
-                self.wins += 1
-                return obs, 20, True, False, {'result': 'win'}
-            elif winner is None:
-                # 平局 - 对于先手玩家,平局是不错的结果(对手没犯错)
-                self.draws += 1
-                return obs, 2, True, False, {'result': 'draw'}
-            else:
-                self.losses += 1
-                return obs, -15, True, False, {'result': 'loss'}
-        
-        # 游戏继续，请求对手下棋
-        self._request_ai_move()
-        time.sleep(0.05)
-        
-        # 获取对手下棋后的状态
-        game_state = self._get_game_state()
-        if not game_state:
-            self.losses += 1
-            self.errors += 1
-            return np.zeros(9, dtype=np.float32), -10, True, False, {'result': 'error'}
-        
-        self.current_board = game_state['board']
-        status = game_state['status']
         obs = self._board_to_observation(self.current_board, self.player)
         
-        # 再次检查游戏是否结束
-        if status == 'finished':
-            winner = game_state.get('winner')
+        if data['game_over']:
+            winner = data.get('winner')
+            # 己方这一步直接结束对局，与AI回应后结束的奖励不同
+            ended_on_own_move = data['result'].get('game_over')
             
             if winner == self.player:
                 self.wins += 1
-                return obs, 10, True, False, {'result': 'win'}
+                return obs, 20 if ended_on_own_move else 10, True, False, {'result': 'win'}
             elif winner is None:
-                # 平局 - 对于先手玩家,平局是不错的结果
+                # 平局 - 对于先手玩家,平局是不错的结果(对手没犯错)
                 self.draws += 1
-                return obs, 5, True, False, {'result': 'draw'}
+                return obs, 2 if ended_on_own_move else 5, True, False, {'result': 'draw'}
             else:
                 self.losses += 1
-                return obs, -10, True, False, {'result': 'loss'}
+                return obs, -15 if ended_on_own_move else -10, True, False, {'result': 'loss'}
         
         # 游戏继续
         return obs, 0.1, False, False, {}
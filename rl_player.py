@@ -0,0 +1,226 @@
+"""
+服务端 RL 策略玩家
+在进程内一次性加载 models/ 下的 MaskablePPO 模型（有导出的 .npz 时使用 NumPy 推理），
+把多局游戏中待走的 RL 着法收集起来，在一个微批窗口内用一次 predict 调用完成推理
+"""
+import logging
+import os
+import queue
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from game_logic import GameStatus, PlayerType
+from game_manager import game_manager
+from arena_metrics import AI_DECISION_SECONDS
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+MODELS_DIR = os.path.join(BASE_DIR, 'models')
+DEFAULT_MODEL = 'rl_agent_v2_ppo'
+
+
+def board_to_observation(board, player) -> List[float]:
+    """将棋盘转换为观察向量（1=己方, -1=对方, 0=空），与训练环境一致"""
+    obs = []
+    for row in board:
+        for cell in row:
+            if cell is None:
+                obs.append(0.0)
+            elif cell == player:
+                obs.append(1.0)
+            else:
+                obs.append(-1.0)
+    return obs
+
+
+def board_to_action_masks(board) -> List[bool]:
+    """动作掩码（True=可以落子）"""
+    return [cell is None for row in board for cell in row]
+
+
+class RLPolicyPool:
+    """按名称缓存已加载的模型，每个模型只加载一次"""
+
+    def __init__(self, models_dir: str = MODELS_DIR):
+        self.models_dir = models_dir
+        self._models: Dict[str, object] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def sb3_available() -> bool:
+        """stable_baselines3 / sb3-contrib 是否已安装"""
+        try:
+            import sb3_contrib  # noqa: F401
+            return True
+        except ImportError:
+            return False
+
+    def available(self, name: str) -> bool:
+        """模型能否在本进程加载：有导出的 .npz，或安装了 RL 依赖"""
+        if os.path.exists(os.path.join(self.models_dir, f"{name}.npz")):
+            return True
+        return self.sb3_available()
+
+    def resolve(self, name: Optional[str]) -> Optional[str]:
+        """
+        校验模型名称（models/ 下不带扩展名的文件名）
+        :return: 规范化的模型名称，不存在返回None
+        """
+        name = name or DEFAULT_MODEL
+        if name.endswith('.zip') or name.endswith('.npz'):
+            name = name[:-4]
+        if os.path.basename(name) != name:
+            return None
+        for ext in ('.npz', '.zip'):
+            if os.path.exists(os.path.join(self.models_dir, f"{name}{ext}")):
+                return name
+        return None
+
+    def get(self, name: str):
+        """获取（必要时加载）模型，优先使用导出的 NumPy 策略"""
+        model = self._models.get(name)
+        if model is not None:
+            return model
+        with self._lock:
+            if name not in self._models:
+                from numpy_policy import load_policy
+                path = os.path.join(self.models_dir, name)
+                started = time.perf_counter()
+                self._models[name] = load_policy(path)
+                logger.info(f"加载RL模型: {name} ({(time.perf_counter() - started) * 1000:.0f}ms)")
+            return self._models[name]
+
+
+class RLMoveBatcher:
+    """
+    RL 着法微批处理器
+    submit() 只把游戏放入队列；后台线程在 window_ms 内尽量多收集请求，
+    按模型分组后每组只调用一次 predict，再把着法应用到各局游戏
+    """
+
+    def __init__(self, game_manager, policy_pool: RLPolicyPool,
+                 window_ms: float = 5.0, max_batch: int = 64):
+        self.game_manager = game_manager
+        self.policy_pool = policy_pool
+        self.window = window_ms / 1000.0
+        self.max_batch = max_batch
+        self._queue: "queue.Queue[str]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._thread_lock = threading.Lock()
+
+    def submit(self, game_id: str):
+        """请求为该局游戏走一步 RL 着法"""
+        self._ensure_started()
+        self._queue.put(game_id)
+
+    def schedule_if_needed(self, game) -> bool:
+        """如果轮到 RL 玩家走棋则提交请求"""
+        if game is None or game.status != GameStatus.IN_PROGRESS:
+            return False
+        player_type = game.player_x_type if game.current_player == 'X' else game.player_o_type
+        if player_type != PlayerType.RL:
+            return False
+        self.submit(game.game_id)
+        return True
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._thread_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='rl-batcher', daemon=True)
+                self._thread.start()
+
+    def _collect_batch(self) -> List[str]:
+        batch = [self._queue.get()]
+        deadline = time.perf_counter() + self.window
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect_batch()
+            try:
+                self._process(batch)
+            except Exception as e:
+                logger.error(f"RL批量推理失败: {e}")
+
+    def _process(self, batch: List[str]):
+        import numpy as np
+
+        # 去重并按模型分组
+        groups: Dict[str, list] = {}
+        for game_id in dict.fromkeys(batch):
+            game = self.game_manager.get_game(game_id)
+            if game is None or game.status != GameStatus.IN_PROGRESS:
+                continue
+            player = game.current_player
+            player_type = game.player_x_type if player == 'X' else game.player_o_type
+            if player_type != PlayerType.RL:
+                continue
+            # 模型名称随游戏保存：重置后沿用，其他进程载入的游戏也一样
+            model_name = game.rl_model or DEFAULT_MODEL
+            groups.setdefault(model_name, []).append((game_id, player, game.move_count, game.board))
+
+        for model_name, entries in groups.items():
+            model = self.policy_pool.get(model_name)
+            observations = np.array(
+                [board_to_observation(board, player) for _, player, _, board in entries],
+                dtype=np.float32
+            )
+            masks = np.array([board_to_action_masks(board) for *_, board in entries], dtype=np.bool_)
+            started = time.perf_counter()
+            actions, _ = model.predict(observations, action_masks=masks, deterministic=True)
+            elapsed = time.perf_counter() - started
+            # 一批只记一次：批内每局的决策都等了这么久
+            AI_DECISION_SECONDS.observe(elapsed, 'rl')
+            logger.debug(
+                f"RL批量推理: 模型={model_name}, 批大小={len(entries)}, "
+                f"{elapsed * 1000:.1f}ms"
+            )
+
+            for (game_id, player, move_count, _), action in zip(entries, actions):
+                game = self.game_manager.get_game(game_id)
+                # 推理期间局面被改变（重置/已被其他请求走棋）则重新排队
+                if game is None or game.move_count != move_count or game.current_player != player:
+                    if game is not None:
+                        self.schedule_if_needed(game)
+                    continue
+                row, col = divmod(int(action), 3)
+                result = self.game_manager.make_move(game_id, row, col, player)
+                if result["status"] != "success":
+                    logger.warning(f"RL着法被拒绝 [{game_id}]: ({row}, {col}) {result.get('message')}")
+                    continue
+                if not result["result"].get("game_over"):
+                    # RL vs RL 时继续排队
+                    self.schedule_if_needed(game)
+
+
+def validate_rl_request(player_x_type: str, player_o_type: str,
+                        rl_model: Optional[str]) -> Tuple[Optional[str], Optional[str]]:
+    """
+    校验创建游戏请求中的 RL 玩家配置
+    :return: (模型名称, 错误信息)；没有 rl 玩家时返回 (None, None)
+    """
+    if 'rl' not in (player_x_type, player_o_type):
+        return None, None
+    model_name = rl_policy_pool.resolve(rl_model)
+    if model_name is None:
+        return None, "RL模型不存在"
+    if not rl_policy_pool.available(model_name):
+        return None, "服务器未安装RL依赖（sb3-contrib），且该模型没有导出的 .npz"
+    return model_name, None
+
+
+# 全局实例：模型只加载一次，各局游戏的RL着法合并成批推理
+rl_policy_pool = RLPolicyPool()
+rl_batcher = RLMoveBatcher(game_manager, rl_policy_pool)
@@ -0,0 +1,550 @@
+"""
+分片多进程模式
+启动 N 个 ASGI 工作进程，每个进程独占按游戏ID划分的一个分片（ID 第一段对 N 取模），
+游戏状态全部留在该进程内存中，热路径不需要跨进程同步；前端进程只负责路由：
+
+    /api/game/<id>/...          按ID所属分片转发（含 SSE 事件流、时间线流、长轮询）
+    POST /api/game/create       轮流分给各分片
+    POST /api/moves             按分片拆分后并发转发，结果按原顺序合并
+    GET  /api/games             合并各分片的分页结果，游标为各分片游标以 '.' 连接
+    GET  /api/timelines-stream  合并各分片的全局时间线流，事件ID同样是各分片序号以 '.' 连接
+    GET  /api/health, /metrics  汇总各分片（指标带 shard 标签）
+    GET  /, /static/...         页面与静态资源由前端进程直接提供
+
+工作进程通过 Unix 域套接字与前端通信，不占用端口。
+
+运行：
+    pip install -r requirements-asgi.txt
+    python sharded_arena.py --workers 4 --port 5000
+
+/ws/agent 的一条连接可能订阅不同分片的游戏，分片模式下不经前端转发（连接以 4400 关闭），
+需要 WebSocket 时请使用单进程 ASGI 模式。
+"""
+import argparse
+import asyncio
+import heapq
+import itertools
+import json
+import logging
+import multiprocessing
+import os
+import re
+import shutil
+import socket
+import tempfile
+import time
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs
+
+import httpx
+
+from arena_logging import setup_logging_from_config
+from game_manager import MAX_BULK_MOVES, MAX_LIST_LIMIT, shard_of
+from static_assets import IMMUTABLE_CACHE_CONTROL, REVALIDATE_CACHE_CONTROL, etag_matches, static_assets
+
+logger = logging.getLogger(__name__)
+
+GAME_PATH = re.compile(r'^/api/game/(?P<game_id>[^/]+)(/.*)?$')
+
+# 不转发的逐跳请求头 / 响应头
+_HOP_BY_HOP = {
+    'connection', 'keep-alive', 'transfer-encoding', 'te', 'trailer', 'upgrade',
+    'proxy-authenticate', 'proxy-authorization', 'host', 'content-length'
+}
+
+# 工作进程启动的最长等待（秒）
+WORKER_START_TIMEOUT = 30
+
+
+async def _read_body(receive) -> bytes:
+    chunks = []
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            break
+        chunks.append(message.get('body', b''))
+        if not message.get('more_body'):
+            break
+    return b''.join(chunks)
+
+
+async def _until_disconnect(receive, work):
+    """运行 work 直到完成或客户端断开"""
+    async def watch_disconnect():
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                return
+
+    work_task = asyncio.ensure_future(work)
+    watch_task = asyncio.ensure_future(watch_disconnect())
+    try:
+        await asyncio.wait({work_task, watch_task}, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for task in (work_task, watch_task):
+            task.cancel()
+        await asyncio.gather(work_task, watch_task, return_exceptions=True)
+    return work_task.done() and not work_task.cancelled() and work_task.exception() is None
+
+
+async def _send_json(send, status: int, payload: Dict):
+    body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(b'content-type', b'application/json'),
+                    (b'content-length', str(len(body)).encode()),
+                    (b'access-control-allow-origin', b'*')],
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+
+def _request_headers(scope) -> Dict[str, str]:
+    headers = {}
+    for name, value in scope.get('headers', []):
+        name = name.decode('latin-1').lower()
+        if name not in _HOP_BY_HOP:
+            headers[name] = value.decode('latin-1')
+    return headers
+
+
+def _forwarded_headers(scope) -> Dict[str, str]:
+    """
+    转发给分片的请求头：分片只看到来自 Unix 域套接字的连接，
+    真实客户端地址放在 X-Real-IP（覆盖客户端自带的值）并追加到 X-Forwarded-For，分片按它做准入控制
+    """
+    headers = _request_headers(scope)
+    client = scope.get('client')
+    address = client[0] if client else 'unknown'
+    previous = headers.get('x-forwarded-for')
+    headers['x-forwarded-for'] = f'{previous}, {address}' if previous else address
+    headers['x-real-ip'] = address
+    return headers
+
+
+def _event_type(message: str) -> Optional[str]:
+    """SSE 消息 data 字段中的事件类型（无法解析时为 None）"""
+    data = '\n'.join(line[5:].lstrip() for line in message.split('\n') if line.startswith('data:'))
+    try:
+        payload = json.loads(data)
+    except ValueError:
+        return None
+    return payload.get('type') if isinstance(payload, dict) else None
+
+
+def _response_headers(response: httpx.Response) -> List[Tuple[bytes, bytes]]:
+    return [(name.encode('latin-1'), value.encode('latin-1'))
+            for name, value in response.headers.multi_items()
+            if name.lower() not in _HOP_BY_HOP - {'content-length'}]
+
+
+def _split_cursor(raw: Optional[str], count: int) -> List[Optional[str]]:
+    """'.' 连接的各分片游标；'-' 表示该分片已没有更多"""
+    parts = raw.split('.') if raw else []
+    if len(parts) != count:
+        parts = ['0'] * count
+    return [None if part == '-' else part for part in parts]
+
+
+class ShardRouter:
+    """分片前端（ASGI 应用）"""
+
+    def __init__(self, socket_paths: List[str]):
+        self.socket_paths = socket_paths
+        self.clients: Optional[List[httpx.AsyncClient]] = None
+        self._next_shard = itertools.count()
+
+    @property
+    def count(self) -> int:
+        return len(self.socket_paths)
+
+    def client(self, shard: int) -> httpx.AsyncClient:
+        if self.clients is None:
+            # 每个分片一个连接池；SSE / 长轮询不设读超时
+            self.clients = [
+                httpx.AsyncClient(transport=httpx.AsyncHTTPTransport(uds=path),
+                                  base_url='http://arena-shard',
+                                  timeout=httpx.Timeout(None, connect=5.0))
+                for path in self.socket_paths
+            ]
+        return self.clients[shard]
+
+    async def aclose(self):
+        if self.clients is not None:
+            await asyncio.gather(*(client.aclose() for client in self.clients), return_exceptions=True)
+            self.clients = None
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            while True:
+                message = await receive()
+                if message['type'] == 'lifespan.startup':
+                    await send({'type': 'lifespan.startup.complete'})
+                elif message['type'] == 'lifespan.shutdown':
+                    await self.aclose()
+                    await send({'type': 'lifespan.shutdown.complete'})
+                    return
+        if scope['type'] == 'websocket':
+            await send({'type': 'websocket.close', 'code': 4400})
+            return
+        if scope['type'] != 'http':
+            return
+
+        path, method = scope['path'], scope['method']
+        try:
+            if path == '/api/game/create':
+                await self.forward(next(self._next_shard) % self.count, scope, receive, send)
+            elif path == '/api/moves' and method == 'POST':
+                await self.bulk_moves(receive, send)
+            elif path == '/api/games' and method == 'GET':
+                await self.list_games(scope, send)
+            elif path == '/api/timelines-stream':
+                await self.timelines_stream(scope, receive, send)
+            elif path == '/api/health':
+                await self.health(send)
+            elif path == '/metrics':
+                await self.metrics(send)
+            elif method == 'GET' and (path == '/' or path.startswith('/static/')):
+                await self.static(scope, send)
+            else:
+                match = GAME_PATH.match(path)
+                shard = shard_of(match.group('game_id'), self.count) if match else None
+                if shard is None:
+                    # OPTIONS 预检等与具体游戏无关的请求交给第一个分片
+                    shard = 0
+                await self.forward(shard, scope, receive, send)
+        except httpx.TransportError as e:
+            logger.error(f"分片不可用 {method} {path}: {e}")
+            await _send_json(send, 502, {"status": "error", "message": "分片不可用"})
+
+    async def forward(self, shard: int, scope, receive, send):
+        """原样转发到分片，响应体（包括 SSE）边收边发"""
+        body = await _read_body(receive)
+        query = scope.get('query_string', b'').decode('latin-1')
+        url = scope['path'] + (f'?{query}' if query else '')
+        client = self.client(shard)
+        request = client.build_request(scope['method'], url, headers=_forwarded_headers(scope), content=body)
+        response = await client.send(request, stream=True)
+        try:
+            await send({'type': 'http.response.start', 'status': response.status_code,
+                        'headers': _response_headers(response)})
+
+            async def pump():
+                async for chunk in response.aiter_raw():
+                    await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+
+            if await _until_disconnect(receive, pump()):
+                await send({'type': 'http.response.body', 'body': b''})
+        finally:
+            await response.aclose()
+
+    async def static(self, scope, send):
+        """页面与静态资源：与 asgi_app.py 相同的内存资源表，不经分片转发"""
+        path = scope['path']
+        asset, fingerprinted = (static_assets.index, False) if path == '/' else static_assets.get(path)
+        if asset is None:
+            await _send_json(send, 404, {"status": "error", "message": "文件不存在"})
+            return
+        request_headers = _request_headers(scope)
+        body, encoding = asset.select(request_headers.get('accept-encoding'))
+        etag = asset.etag(encoding)
+        cache_control = IMMUTABLE_CACHE_CONTROL if fingerprinted else REVALIDATE_CACHE_CONTROL
+        headers = [(b'etag', etag.encode('latin-1')),
+                   (b'cache-control', cache_control.encode('latin-1')),
+                   (b'vary', b'Accept-Encoding')]
+        if etag_matches(request_headers.get('if-none-match'), etag):
+            await send({'type': 'http.response.start', 'status': 304, 'headers': headers})
+            await send({'type': 'http.response.body', 'body': b''})
+            return
+        headers.append((b'content-type', asset.content_type.encode('latin-1')))
+        headers.append((b'content-length', str(len(body)).encode()))
+        if encoding:
+            headers.append((b'content-encoding', encoding.encode('latin-1')))
+        await send({'type': 'http.response.start', 'status': 200, 'headers': headers})
+        await send({'type': 'http.response.body', 'body': body})
+
+    async def _request(self, shard: int, method: str, url: str, **kwargs) -> Tuple[int, Dict]:
+        response = await self.client(shard).request(method, url, **kwargs)
+        return response.status_code, response.json()
+
+    async def bulk_moves(self, receive, send):
+        try:
+            data = json.loads(await _read_body(receive) or b'null')
+        except ValueError:
+            data = None
+        moves = data.get('moves') if isinstance(data, dict) else data
+        if not isinstance(moves, list):
+            await _send_json(send, 400, {"status": "error", "message": "缺少moves列表"})
+            return
+        if len(moves) > MAX_BULK_MOVES:
+            await _send_json(send, 400, {"status": "error", "message": f"单次最多提交 {MAX_BULK_MOVES} 步"})
+            return
+
+        # 按分片拆分，记住每条的原始位置；格式不对的条目交给第一个分片返回错误
+        groups: Dict[int, List[int]] = {}
+        for position, entry in enumerate(moves):
+            game_id = entry.get('game_id') if isinstance(entry, dict) else None
+            shard = shard_of(game_id, self.count) if isinstance(game_id, str) else None
+            groups.setdefault(shard or 0, []).append(position)
+
+        replies = await asyncio.gather(*(
+            self._request(shard, 'POST', '/api/moves', json={'moves': [moves[i] for i in positions]})
+            for shard, positions in groups.items()
+        ))
+        results: List[Optional[Dict]] = [None] * len(moves)
+        for positions, (status, payload) in zip(groups.values(), replies):
+            shard_results = payload.get('results') or [
+                {"status": "error", "message": payload.get('message', '分片处理失败')}
+            ] * len(positions)
+            for position, item in zip(positions, shard_results):
+                results[position] = item
+        await _send_json(send, 200, {
+            "status": "success",
+            "results": results,
+            "count": len(results),
+            "succeeded": sum(1 for item in results if item["status"] == "success")
+        })
+
+    async def list_games(self, scope, send):
+        """
+        合并各分片的分页结果：每个分片都取 limit 条（带每局的游标），按创建时间归并后截取前 limit 条，
+        每个分片的下一页游标取其最后一条被采用的游戏，未被采用的留到下一页，翻页不重不漏
+        """
+        params = {k: v[-1] for k, v in parse_qs(scope.get('query_string', b'').decode()).items()}
+        cursors = _split_cursor(params.pop('cursor', None), self.count)
+        try:
+            limit = int(params.get('limit') or 100)
+        except ValueError:
+            await _send_json(send, 400, {"status": "error", "message": "cursor / limit 必须是整数"})
+            return
+        limit = max(1, min(limit, MAX_LIST_LIMIT))
+        newest_first = params.get('order') == 'desc'
+        # 归并需要创建时间；调用方没要这个字段时合并后再去掉
+        fields = [field.strip() for field in params['fields'].split(',')] if params.get('fields') else None
+        if fields is not None and 'created_at' not in fields:
+            params['fields'] = ','.join(fields + ['created_at'])
+        params['cursors'] = '1'
+
+        shards = [shard for shard, cursor in enumerate(cursors) if cursor is not None]
+        replies = await asyncio.gather(*(
+            self._request(shard, 'GET', '/api/games', params=dict(params, cursor=cursors[shard]))
+            for shard in shards
+        ))
+        pages: Dict[int, Dict] = {}
+        total_games = 0
+        for shard, (status, payload) in zip(shards, replies):
+            if status != 200:
+                await _send_json(send, status, payload)
+                return
+            pages[shard] = payload
+            total_games += payload.get('total_games', 0)
+
+        # 各分片结果已按创建顺序排列，按 (创建时间, 分片) 归并
+        def entries(shard: int):
+            for position, (game_id, summary) in enumerate(pages[shard]['games'].items()):
+                yield datetime.fromisoformat(summary['created_at']), shard, position, game_id, summary
+
+        merged = heapq.merge(*(entries(shard) for shard in pages), reverse=newest_first)
+        games: Dict[str, Dict] = {}
+        taken: Dict[int, int] = {}
+        for _, shard, position, game_id, summary in itertools.islice(merged, limit):
+            if fields is not None and 'created_at' not in fields:
+                summary = {key: value for key, value in summary.items() if key != 'created_at'}
+            games[game_id] = summary
+            taken[shard] = position + 1
+
+        next_cursors: List[Optional[str]] = [None] * self.count
+        for shard, payload in pages.items():
+            used = taken.get(shard, 0)
+            if used == len(payload['games']):
+                # 本页全部采用，沿用分片自己的下一页游标（None 表示已翻完）
+                cursor = payload.get('next_cursor')
+            else:
+                # 取不到游标（刚被删除）时从原位置重翻，宁可重复也不漏
+                cursor = (payload['cursors'][used - 1] if used else None) or cursors[shard]
+            next_cursors[shard] = str(cursor) if cursor is not None else None
+        # 已翻完的分片不再查询列表，游戏总数从健康检查取
+        skipped = [shard for shard in range(self.count) if shard not in shards]
+        for _, payload in await asyncio.gather(*(self._request(shard, 'GET', '/api/health')
+                                                 for shard in skipped)):
+            total_games += payload.get('active_games', 0)
+        await _send_json(send, 200, {
+            "status": "success",
+            "games": games,
+            "count": len(games),
+            "total_games": total_games,
+            "next_cursor": ('.'.join(cursor or '-' for cursor in next_cursors)
+                            if any(next_cursors) else None)
+        })
+
+    async def health(self, send):
+        replies = await asyncio.gather(*(self._request(shard, 'GET', '/api/health')
+                                         for shard in range(self.count)), return_exceptions=True)
+        shards = [reply[1] if not isinstance(reply, Exception) else {"status": "unavailable"}
+                  for reply in replies]
+        healthy = all(shard.get('status') == 'healthy' for shard in shards)
+        await _send_json(send, 200 if healthy else 503, {
+            "status": "healthy" if healthy else "degraded",
+            "service": "Tic-Tac-Toe Arena",
+            "version": "1.0.0",
+            "active_games": sum(shard.get('active_games', 0) for shard in shards),
+            "shards": shards
+        })
+
+    async def metrics(self, send):
+        """合并各分片的指标：同名指标的 HELP/TYPE 只输出一次，样本加 shard 标签"""
+        responses = await asyncio.gather(*(self.client(shard).get('/metrics') for shard in range(self.count)))
+        families: Dict[str, List[str]] = {}
+        headers: Dict[str, List[str]] = {}
+        for shard, response in enumerate(responses):
+            name = None
+            for line in response.text.splitlines():
+                if line.startswith('# HELP ') or line.startswith('# TYPE '):
+                    name = line.split()[2]
+                    if shard == 0:
+                        headers.setdefault(name, []).append(line)
+                    families.setdefault(name, [])
+                elif line and name is not None:
+                    families[name].append(_with_shard_label(line, shard))
+        lines = []
+        for name, samples in families.items():
+            lines.extend(headers.get(name, []))
+            lines.extend(samples)
+        body = ('\n'.join(lines) + '\n').encode('utf-8')
+        await send({'type': 'http.response.start', 'status': 200, 'headers': [
+            (b'content-type', responses[0].headers.get('content-type', 'text/plain').encode('latin-1')),
+            (b'content-length', str(len(body)).encode())]})
+        await send({'type': 'http.response.body', 'body': body})
+
+    async def timelines_stream(self, scope, receive, send):
+        """合并各分片的全局时间线流"""
+        headers = _forwarded_headers(scope)
+        query = scope.get('query_string', b'').decode('latin-1')
+        last_event_id = headers.pop('last-event-id', None)
+        cursors = [cursor or '0' for cursor in _split_cursor(last_event_id, self.count)]
+        send_lock = asyncio.Lock()
+
+        await send({'type': 'http.response.start', 'status': 200, 'headers': [
+            (b'content-type', b'text/event-stream'), (b'cache-control', b'no-cache'),
+            (b'x-accel-buffering', b'no'), (b'access-control-allow-origin', b'*')]})
+
+        async def relay(shard: int):
+            url = '/api/timelines-stream' + (f'?{query}' if query else '')
+            async with self.client(shard).stream(
+                    'GET', url, headers=dict(headers, **{'last-event-id': cursors[shard]})) as response:
+                buffer = ''
+                async for text in response.aiter_text():
+                    buffer += text
+                    while '\n\n' in buffer:
+                        message, buffer = buffer.split('\n\n', 1)
+                        lines = []
+                        for line in message.split('\n'):
+                            if line.startswith('id:'):
+                                # 事件ID改写为所有分片的游标，断线重连时各分片从各自位置续传
+                                cursors[shard] = line[3:].strip()
+                                line = 'id: ' + '.'.join(cursors)
+                            lines.append(line)
+                        # 连接确认只转发第一个分片的一条
+                        if shard != 0 and _event_type(message) == 'connected':
+                            continue
+                        async with send_lock:
+                            await send({'type': 'http.response.body',
+                                        'body': ('\n'.join(lines) + '\n\n').encode('utf-8'),
+                                        'more_body': True})
+
+        async def relay_all():
+            await asyncio.gather(*(relay(shard) for shard in range(self.count)))
+
+        if await _until_disconnect(receive, relay_all()):
+            await send({'type': 'http.response.body', 'body': b''})
+
+
+def _with_shard_label(sample: str, shard: int) -> str:
+    name, _, value = sample.rpartition(' ')
+    if name.endswith('}'):
+        return f'{name[:-1]},shard="{shard}"}} {value}'
+    return f'{name}{{shard="{shard}"}} {value}'
+
+
+def run_worker(index: int, count: int, socket_path: str):
+    """工作进程：只负责第 index 个分片的游戏"""
+    import uvicorn
+    import asgi_app
+
+    setup_logging_from_config()
+    asgi_app.game_manager.configure_shard(index, count)
+    # 只在 Unix 域套接字上监听，来源地址取前端设置的 X-Real-IP
+    asgi_app.trust_forwarded_client = True
+    uvicorn.run(asgi_app.app, uds=socket_path, log_level='warning')
+
+
+def _wait_for_socket(path: str, process: multiprocessing.Process, timeout: float):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if not process.is_alive():
+            raise RuntimeError(f"工作进程启动失败: {path}")
+        if os.path.exists(path):
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(path)
+                return
+            except OSError:
+                pass
+            finally:
+                probe.close()
+        time.sleep(0.05)
+    raise RuntimeError(f"等待工作进程超时: {path}")
+
+
+def start_workers(count: int, socket_dir: str) -> Tuple[List[multiprocessing.Process], List[str]]:
+    """启动 count 个工作进程并等待它们开始监听"""
+    # spawn：子进程不继承前端进程的状态
+    context = multiprocessing.get_context('spawn')
+    os.makedirs(socket_dir, exist_ok=True)
+    paths = [os.path.join(socket_dir, f'shard-{index}.sock') for index in range(count)]
+    processes = []
+    for index, path in enumerate(paths):
+        if os.path.exists(path):
+            os.unlink(path)
+        process = context.Process(target=run_worker, args=(index, count, path),
+                                  name=f'arena-shard-{index}', daemon=True)
+        process.start()
+        processes.append(process)
+    for process, path in zip(processes, paths):
+        _wait_for_socket(path, process, WORKER_START_TIMEOUT)
+    return processes, paths
+
+
+def stop_workers(processes: List[multiprocessing.Process]):
+    for process in processes:
+        if process.is_alive():
+            process.terminate()
+    for process in processes:
+        process.join(timeout=5)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='井字棋决斗场 - 分片多进程模式')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='工作进程（分片）数')
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=5000)
+    parser.add_argument('--socket-dir', default=None, help='Unix 域套接字目录（默认临时目录）')
+    args = parser.parse_args()
+
+    import uvicorn
+
+    setup_logging_from_config()
+    socket_dir = args.socket_dir or tempfile.mkdtemp(prefix='arena-shards-')
+    processes, paths = start_workers(args.workers, socket_dir)
+    logger.info(f"已启动 {args.workers} 个分片工作进程，前端监听 {args.host}:{args.port}")
+    try:
+        uvicorn.run(ShardRouter(paths), host=args.host, port=args.port, log_level='info')
+    finally:
+        stop_workers(processes)
+        if not args.socket_dir:
+            shutil.rmtree(socket_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
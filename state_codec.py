@@ -0,0 +1,159 @@
+"""
+紧凑二进制状态编码
+/state 与 /timeline 通过 format=binary 或 Accept 头协商使用，训练客户端只需要棋盘和状态，
+不必每步下载、解析带 ISO 时间戳的完整 JSON。
+
+状态（大端序，固定 13 字节 + 着法）：
+    B  格式版本
+    B  类型（0=状态, 1=时间线）
+    H  局面编码：9格按行展开的三进制数（0=空, 1=X, 2=O），第一格为最低位
+    B  行棋方（0=X, 1=O）
+    B  对局状态（0=未开始, 1=进行中, 2=已结束）
+    B  获胜方（0=无, 1=X, 2=O）
+    B  连线编码（0=无, 1-3=行, 4-6=列, 7=主对角线, 8=副对角线）
+    I  版本号
+    B  着法数 n，随后 ceil(n/2) 字节，每字节两手（高4位在前），格子序号 row*3+col
+
+时间线在状态之后追加：
+    B  X 玩家类型, B  O 玩家类型
+    I  对局时长（毫秒）
+    n × I  每手相对开局的时间（毫秒）
+"""
+import struct
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from game_logic import GameStatus, PlayerType
+
+FORMAT_VERSION = 1
+MIME_TYPE = 'application/vnd.tictactoe.state'
+
+KIND_STATE = 0
+KIND_TIMELINE = 1
+
+_HEADER = struct.Struct('>BBHBBBBIB')
+_TIMELINE_HEADER = struct.Struct('>BBI')
+
+_PLAYERS = [None, 'X', 'O']
+_STATUSES = [GameStatus.NOT_STARTED.value, GameStatus.IN_PROGRESS.value, GameStatus.FINISHED.value]
+_PLAYER_TYPES = [player_type.value for player_type in PlayerType]
+
+# 与 TicTacToeGame.get_winning_line 返回的端点一一对应
+_LINES = (
+    [[[row, 0], [row, 2]] for row in range(3)]
+    + [[[0, col], [2, col]] for col in range(3)]
+    + [[[0, 0], [2, 2]], [[0, 2], [2, 0]]]
+)
+
+
+def wants_binary(format_param: Optional[str], accept: Optional[str]) -> bool:
+    """
+    是否协商为二进制格式
+    :param format_param: format 查询参数（binary / json）
+    :param accept: Accept 请求头
+    """
+    if format_param:
+        return format_param.lower() in ('binary', 'bin')
+    if not accept:
+        return False
+    media_types = [part.split(';')[0].strip().lower() for part in accept.split(',')]
+    return MIME_TYPE in media_types or 'application/octet-stream' in media_types
+
+
+def _position_code(board) -> int:
+    code = 0
+    for index, cell in enumerate(cell for row in board for cell in row):
+        code += _PLAYERS.index(cell) * 3 ** index
+    return code
+
+
+def _pack_moves(cells: List[int]) -> bytes:
+    padded = cells + [0] * (len(cells) % 2)
+    return bytes((padded[i] << 4) | padded[i + 1] for i in range(0, len(padded), 2))
+
+
+def _pack(game, kind: int) -> bytes:
+    cells = [move['row'] * 3 + move['col'] for move in game.move_history]
+    line = _LINES.index(game.winning_line) + 1 if game.winning_line else 0
+    return _HEADER.pack(
+        FORMAT_VERSION,
+        kind,
+        _position_code(game.board),
+        _PLAYERS.index(game.current_player) - 1,
+        _STATUSES.index(game.status.value),
+        _PLAYERS.index(game.winner),
+        line,
+        game.version & 0xFFFFFFFF,
+        len(cells)
+    ) + _pack_moves(cells)
+
+
+def pack_state(game) -> bytes:
+    """编码游戏状态"""
+    return _pack(game, KIND_STATE)
+
+
+def pack_timeline(game) -> bytes:
+    """编码已结束游戏的时间线"""
+    started = game.created_at
+    offsets = [
+        max(0, int((datetime.fromisoformat(move['timestamp']) - started).total_seconds() * 1000))
+        for move in game.move_history
+    ]
+    ended = game.ended_at or game.updated_at
+    duration_ms = max(0, int((ended - started).total_seconds() * 1000))
+    return (
+        _pack(game, KIND_TIMELINE)
+        + _TIMELINE_HEADER.pack(
+            _PLAYER_TYPES.index(game.player_x_type.value),
+            _PLAYER_TYPES.index(game.player_o_type.value),
+            duration_ms
+        )
+        + struct.pack(f'>{len(offsets)}I', *offsets)
+    )
+
+
+def unpack(data: bytes) -> Dict:
+    """
+    解码状态或时间线
+    :return: 与JSON接口字段一致的字典，着法为 [[row, col], ...]
+    """
+    (format_version, kind, code, side, status, winner, line,
+     version, move_count) = _HEADER.unpack_from(data, 0)
+    if format_version != FORMAT_VERSION:
+        raise ValueError(f"不支持的编码版本: {format_version}")
+
+    board = []
+    for _ in range(3):
+        row = []
+        for _ in range(3):
+            code, value = divmod(code, 3)
+            row.append(_PLAYERS[value])
+        board.append(row)
+
+    offset = _HEADER.size
+    packed = data[offset:offset + (move_count + 1) // 2]
+    offset += len(packed)
+    cells = [nibble for byte in packed for nibble in (byte >> 4, byte & 0x0F)][:move_count]
+
+    result = {
+        "board": board,
+        "current_player": _PLAYERS[side + 1],
+        "status": _STATUSES[status],
+        "winner": _PLAYERS[winner],
+        "winning_line": _LINES[line - 1] if line else None,
+        "is_draw": _STATUSES[status] == GameStatus.FINISHED.value and winner == 0,
+        "version": version,
+        "move_count": move_count,
+        "moves": [list(divmod(cell, 3)) for cell in cells],
+    }
+    if kind == KIND_TIMELINE:
+        x_type, o_type, duration_ms = _TIMELINE_HEADER.unpack_from(data, offset)
+        offset += _TIMELINE_HEADER.size
+        result.update({
+            "player_x_type": _PLAYER_TYPES[x_type],
+            "player_o_type": _PLAYER_TYPES[o_type],
+            "duration_ms": duration_ms,
+            "move_offsets_ms": list(struct.unpack_from(f'>{move_count}I', data, offset)),
+        })
+    return result
@@ -136,7 +136,8 @@ export class UIManager {
         const typeText = {
             'human': '人类',
             'ai': 'AI',
-            'agent': 'Agent'
+            'agent': 'Agent',
+            'rl': 'RL'
         };
         
         const playerEmoji = player === 'X' ? '❌' : '⭕';
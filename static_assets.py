@@ -0,0 +1,251 @@
+"""
+静态资源
+启动时把 static/ 下的文件和 index.html 一次性读入内存：
+    - MIME 类型、内容哈希（指纹）、ETag 只算一次
+    - 文本类资源预先压缩（gzip；装了 brotli 时再加一份 br），请求时按 Accept-Encoding 直接取
+    - 页面和脚本里对其他资源的引用改写为带指纹的地址（main.js -> main.1a2b3c4d5e.js），
+      带指纹的地址内容永不变化，返回 Cache-Control: immutable；原地址仍可访问，但每次都要用 ETag 验证
+
+引用改写按依赖顺序进行，被引用文件的内容变化会传递到引用它的文件的指纹上。
+"""
+import gzip
+import hashlib
+import logging
+import mimetypes
+import os
+import re
+from typing import Dict, Optional, Tuple
+
+try:
+    import brotli  # 可选依赖：pip install brotli
+except ImportError:
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+REVALIDATE_CACHE_CONTROL = 'no-cache'
+
+# 小于该大小的文件压缩收益不值得一次 Content-Encoding 协商
+MIN_COMPRESS_SIZE = 256
+
+_COMPRESSIBLE_TYPES = ('text/', 'application/javascript', 'application/json', 'image/svg+xml')
+_REWRITE_TYPES = ('text/html', 'text/css', 'application/javascript', 'text/javascript')
+
+# 页面与脚本中的资源引用：引号内的 ./x、../x、/static/x、static/x，以及 CSS 的 url(x)
+_REFERENCE = re.compile(r'''(?P<quote>['"])(?P<path>(?:\.{1,2}/|/?static/)[\w\-./]+)(?P=quote)'''
+                        r'''|url\((?P<url>[^)'"]+)\)''')
+
+_FINGERPRINT_LENGTH = 10
+
+
+class Asset:
+    """内存中的单个资源"""
+
+    __slots__ = ('path', 'url', 'content_type', 'body', 'gzip', 'br', 'fingerprint')
+
+    def __init__(self, path: str, url: str, content_type: str, body: bytes):
+        self.path = path
+        self.url = url
+        self.content_type = content_type
+        self.body = body
+        self.fingerprint = hashlib.sha256(body).hexdigest()[:_FINGERPRINT_LENGTH]
+        self.gzip: Optional[bytes] = None
+        self.br: Optional[bytes] = None
+        if len(body) >= MIN_COMPRESS_SIZE and content_type.startswith(_COMPRESSIBLE_TYPES):
+            compressed = gzip.compress(body, compresslevel=9, mtime=0)
+            if len(compressed) < len(body):
+                self.gzip = compressed
+            if brotli is not None:
+                compressed = brotli.compress(body)
+                if len(compressed) < len(body):
+                    self.br = compressed
+
+    @property
+    def fingerprinted_url(self) -> str:
+        """/static/js/main.js -> /static/js/main.<指纹>.js"""
+        stem, ext = os.path.splitext(self.url)
+        return f'{stem}.{self.fingerprint}{ext}'
+
+    def etag(self, encoding: Optional[str]) -> str:
+        # 不同编码的响应体不同，ETag 也要区分
+        return f'"{self.fingerprint}-{encoding}"' if encoding else f'"{self.fingerprint}"'
+
+    def select(self, accept_encoding: Optional[str]) -> Tuple[bytes, Optional[str]]:
+        """
+        按 Accept-Encoding 选择响应体
+        :return: (响应体, Content-Encoding；未压缩为 None)
+        """
+        accepted = _accepted_encodings(accept_encoding)
+        if self.br is not None and 'br' in accepted:
+            return self.br, 'br'
+        if self.gzip is not None and 'gzip' in accepted:
+            return self.gzip, 'gzip'
+        return self.body, None
+
+
+def _accepted_encodings(header: Optional[str]) -> set:
+    accepted = set()
+    for part in (header or '').split(','):
+        name, _, params = part.strip().partition(';')
+        if not name:
+            continue
+        quality = params.strip()
+        if quality.startswith('q='):
+            try:
+                if float(quality[2:]) <= 0:
+                    continue
+            except ValueError:
+                continue
+        accepted.add(name.strip().lower())
+    return accepted
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match 弱比较（etag 带引号）：逗号分隔的列表，可带 W/ 前缀或为 *"""
+    if not if_none_match:
+        return False
+    for tag in if_none_match.split(','):
+        tag = tag.strip()
+        if tag == '*':
+            return True
+        if tag.startswith('W/'):
+            tag = tag[2:]
+        if tag == etag:
+            return True
+    return False
+
+
+class AssetStore:
+    """静态资源表：{URL: Asset}，原地址和带指纹的地址都能查到"""
+
+    def __init__(self, static_dir: str, index_path: Optional[str] = None):
+        self.static_dir = static_dir
+        self.index_path = index_path
+        self.assets: Dict[str, Asset] = {}
+        self.fingerprinted: Dict[str, Asset] = {}
+        self.index: Optional[Asset] = None
+        self._mtimes: Dict[str, float] = {}
+        self.load()
+
+    def load(self):
+        """读取全部文件，改写引用并计算指纹、预压缩"""
+        sources: Dict[str, Tuple[str, bytes]] = {}
+        mtimes: Dict[str, float] = {}
+        for directory, _, filenames in os.walk(self.static_dir):
+            for filename in filenames:
+                path = os.path.join(directory, filename)
+                relative = os.path.relpath(path, self.static_dir).replace(os.sep, '/')
+                with open(path, 'rb') as f:
+                    sources['/static/' + relative] = (path, f.read())
+                mtimes[path] = os.path.getmtime(path)
+
+        assets: Dict[str, Asset] = {}
+        resolving = set()
+
+        def build(url: str) -> Optional[Asset]:
+            if url in assets:
+                return assets[url]
+            if url not in sources or url in resolving:
+                # 不存在或循环引用：保留原地址
+                return None
+            resolving.add(url)
+            path, body = sources[url]
+            content_type = _content_type(path)
+            if content_type.startswith(_REWRITE_TYPES):
+                body = self._rewrite(body, url, build)
+            assets[url] = Asset(path, url, content_type, body)
+            resolving.discard(url)
+            return assets[url]
+
+        for url in sources:
+            build(url)
+
+        index = None
+        if self.index_path and os.path.exists(self.index_path):
+            with open(self.index_path, 'rb') as f:
+                body = self._rewrite(f.read(), '/index.html', build)
+            index = Asset(self.index_path, '/', 'text/html; charset=utf-8', body)
+            mtimes[self.index_path] = os.path.getmtime(self.index_path)
+
+        self.assets = assets
+        self.fingerprinted = {asset.fingerprinted_url: asset for asset in assets.values()}
+        self.index = index
+        self._mtimes = mtimes
+        total = sum(len(asset.body) for asset in assets.values())
+        compressed = sum(len(asset.br or asset.gzip or asset.body) for asset in assets.values())
+        logger.info(f"静态资源已载入内存: {len(assets)} 个文件, {total} 字节（压缩后 {compressed} 字节）")
+
+    @staticmethod
+    def _rewrite(body: bytes, url: str, build) -> bytes:
+        """把对其他资源的引用改写为带指纹的地址，保持原来的相对/绝对写法"""
+        text = body.decode('utf-8')
+        base = url.rsplit('/', 1)[0] + '/'
+
+        def replace(match: re.Match) -> str:
+            reference = match.group('path') or match.group('url').strip()
+            target = _resolve(base, reference)
+            asset = build(target) if target else None
+            if asset is None:
+                return match.group(0)
+            stem, ext = os.path.splitext(reference)
+            fingerprinted = f'{stem}.{asset.fingerprint}{ext}'
+            if match.group('path'):
+                quote = match.group('quote')
+                return f'{quote}{fingerprinted}{quote}'
+            return f'url({fingerprinted})'
+
+        return _REFERENCE.sub(replace, text).encode('utf-8')
+
+    def get(self, url: str) -> Tuple[Optional[Asset], bool]:
+        """
+        查找资源
+        :return: (资源, 是否为带指纹的地址)
+        """
+        asset = self.fingerprinted.get(url)
+        if asset is not None:
+            return asset, True
+        return self.assets.get(url), False
+
+    def reload_if_changed(self) -> bool:
+        """开发模式：文件有修改时重新载入（只比较修改时间）"""
+        for path, mtime in self._mtimes.items():
+            try:
+                changed = os.path.getmtime(path) != mtime
+            except OSError:
+                changed = True
+            if changed:
+                self.load()
+                return True
+        return False
+
+
+def _content_type(path: str) -> str:
+    content_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+    if content_type.startswith('text/') or content_type == 'application/javascript':
+        content_type += '; charset=utf-8'
+    return content_type
+
+
+def _resolve(base: str, reference: str) -> Optional[str]:
+    """把引用解析为 /static/... 形式的地址"""
+    if reference.startswith('/'):
+        return reference
+    if reference.startswith('static/'):
+        return '/' + reference
+    parts = [part for part in base.split('/') if part]
+    for segment in reference.split('/'):
+        if segment == '..':
+            if not parts:
+                return None
+            parts.pop()
+        elif segment and segment != '.':
+            parts.append(segment)
+    return '/' + '/'.join(parts)
+
+
+# 全局静态资源表（启动时载入）
+mimetypes.add_type('application/javascript', '.js')
+static_assets = AssetStore(os.path.join(BASE_DIR, 'static'), os.path.join(BASE_DIR, 'index.html'))
@@ -0,0 +1,321 @@
+"""
+m,n,k 残局表库（Tablebase）
+通过逆向分析（按棋子数从满盘向空盘逐层回推）求解小棋盘的完整博弈值，
+每层的计算按先手棋子组合切分给多个进程并行完成，
+结果写入内存映射文件，引擎可零搜索成本地查询完美着法。
+
+表库格式：
+    16字节头（魔数、格式版本、行数、列数、k）
+    + 3^(行*列) 个 int8 分值，按三进制局面编号索引（空=0, X=1, O=2）
+
+分值（以轮到走棋的一方为视角）：
+    SCORE_BASE - d  ：d 步后获胜
+    0               ：和棋
+    -(SCORE_BASE - d)：d 步后落败
+    UNREACHABLE     ：非法/不可达局面
+
+用法：
+    python tablebase.py --rows 4 --cols 4 --k 3 --workers 8
+"""
+import argparse
+import logging
+import math
+import os
+import struct
+import time
+from itertools import combinations
+from multiprocessing import Pool
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from mnk_board import MNKGeometry, get_geometry
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"TTTB"
+FORMAT_VERSION = 1
+HEADER_FORMAT = "<4sBBBB"
+HEADER_SIZE = 16
+
+SCORE_BASE = 100
+UNREACHABLE = -128
+
+# 单个表库文件的上限（字节）。3^20 ≈ 3.5GB，再大就不现实了
+MAX_TABLE_SIZE = 3 ** 20
+
+DEFAULT_TABLEBASE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "tablebases")
+
+
+def default_path(rows: int, cols: int, k: int) -> str:
+    """表库默认存放路径"""
+    return os.path.join(DEFAULT_TABLEBASE_DIR, f"{rows}x{cols}k{k}.tb")
+
+
+def _powers_of_three(cells: int) -> List[int]:
+    return [3 ** i for i in range(cells)]
+
+
+# ---------------------------------------------------------------------------
+# 生成（工作进程）
+# ---------------------------------------------------------------------------
+
+_worker_state = {}
+
+
+def _init_worker(path: str, rows: int, cols: int, k: int):
+    """工作进程初始化：打开共享的内存映射表"""
+    geometry = get_geometry(rows, cols, k)
+    _worker_state["geometry"] = geometry
+    _worker_state["pow3"] = _powers_of_three(geometry.cells)
+    _worker_state["table"] = np.memmap(
+        path, dtype=np.int8, mode="r+", offset=HEADER_SIZE, shape=(3 ** geometry.cells,)
+    )
+
+
+def _solve_chunk(args: Tuple[int, List[Tuple[int, ...]]]) -> int:
+    """
+    求解一层中的一部分局面
+    :param args: (棋子数, 先手棋子位置组合列表)
+    :return: 本块写入的局面数
+    """
+    pieces, x_combos = args
+    geometry: MNKGeometry = _worker_state["geometry"]
+    pow3 = _worker_state["pow3"]
+    table = _worker_state["table"]
+    cells = geometry.cells
+
+    x_count = (pieces + 1) // 2
+    o_count = pieces // 2
+    x_to_move = x_count == o_count
+    move_digit = 1 if x_to_move else 2
+
+    terminal_idx: List[int] = []
+    terminal_val: List[int] = []
+    parent_idx: List[int] = []
+    child_idx: List[int] = []
+    segment_starts: List[int] = []
+
+    for x_cells in x_combos:
+        x_mask = 0
+        x_index = 0
+        for cell in x_cells:
+            x_mask |= 1 << cell
+            x_index += pow3[cell]
+        x_wins = geometry.is_win(x_mask)
+        remaining = [cell for cell in range(cells) if not x_mask >> cell & 1]
+
+        for o_cells in combinations(remaining, o_count):
+            o_mask = 0
+            index = x_index
+            for cell in o_cells:
+                o_mask |= 1 << cell
+                index += 2 * pow3[cell]
+
+            o_wins = geometry.is_win(o_mask)
+            # 刚走完的一方连成k子：当前走棋方已输；另一方连成则局面不可达
+            last_mover_wins, other_wins = (o_wins, x_wins) if x_to_move else (x_wins, o_wins)
+            if other_wins:
+                terminal_idx.append(index)
+                terminal_val.append(UNREACHABLE)
+                continue
+            if last_mover_wins:
+                terminal_idx.append(index)
+                terminal_val.append(-SCORE_BASE)
+                continue
+            if pieces == cells:
+                terminal_idx.append(index)
+                terminal_val.append(0)
+                continue
+
+            parent_idx.append(index)
+            segment_starts.append(len(child_idx))
+            occupied = x_mask | o_mask
+            for cell in range(cells):
+                if not occupied >> cell & 1:
+                    child_idx.append(index + move_digit * pow3[cell])
+
+    if terminal_idx:
+        table[np.asarray(terminal_idx, dtype=np.int64)] = np.asarray(terminal_val, dtype=np.int8)
+
+    if parent_idx:
+        # 子局面分值取反后取最大，再向"更远"方向修正一步
+        child_scores = -table[np.asarray(child_idx, dtype=np.int64)].astype(np.int16)
+        best = np.maximum.reduceat(child_scores, np.asarray(segment_starts, dtype=np.int64))
+        scores = np.where(best > 0, best - 1, np.where(best < 0, best + 1, 0))
+        table[np.asarray(parent_idx, dtype=np.int64)] = scores.astype(np.int8)
+
+    table.flush()
+    return len(terminal_idx) + len(parent_idx)
+
+
+# ---------------------------------------------------------------------------
+# 生成（主进程）
+# ---------------------------------------------------------------------------
+
+def _write_header(path: str, rows: int, cols: int, k: int):
+    header = struct.pack(HEADER_FORMAT, MAGIC, FORMAT_VERSION, rows, cols, k)
+    with open(path, "wb") as f:
+        f.write(header.ljust(HEADER_SIZE, b"\0"))
+        f.truncate(HEADER_SIZE + 3 ** (rows * cols))
+
+
+def _chunked(items: list, chunk_count: int) -> List[list]:
+    size = max(1, math.ceil(len(items) / chunk_count))
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+def generate(rows: int, cols: int, k: int, path: Optional[str] = None,
+             workers: Optional[int] = None) -> str:
+    """
+    生成表库
+    :param workers: 工作进程数，默认使用全部CPU
+    :return: 表库文件路径
+    """
+    geometry = get_geometry(rows, cols, k)
+    size = 3 ** geometry.cells
+    if size > MAX_TABLE_SIZE:
+        raise ValueError(
+            f"{rows}x{cols} 棋盘需要 {size} 字节的局面索引，超出上限 {MAX_TABLE_SIZE}"
+        )
+
+    path = path or default_path(rows, cols, k)
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    workers = workers or os.cpu_count() or 1
+
+    tmp_path = path + ".tmp"
+    _write_header(tmp_path, rows, cols, k)
+    # 未被任何层覆盖的编号（棋子数不合法）统一标记为不可达
+    table = np.memmap(tmp_path, dtype=np.int8, mode="r+", offset=HEADER_SIZE, shape=(size,))
+    table[:] = UNREACHABLE
+    table.flush()
+    del table
+
+    logger.info(f"生成表库 {rows}x{cols} k={k}: {size} 个编号, {workers} 个进程")
+    started = time.perf_counter()
+    with Pool(workers, initializer=_init_worker, initargs=(tmp_path, rows, cols, k)) as pool:
+        # 从满盘向空盘逐层回推：第p层只依赖第p+1层
+        for pieces in range(geometry.cells, -1, -1):
+            layer_started = time.perf_counter()
+            x_combos = list(combinations(range(geometry.cells), (pieces + 1) // 2))
+            chunks = _chunked(x_combos, workers * 4)
+            solved = sum(pool.map(_solve_chunk, [(pieces, chunk) for chunk in chunks]))
+            logger.info(
+                f"  第 {pieces:2d} 层: {solved} 个局面, "
+                f"{time.perf_counter() - layer_started:.2f}s"
+            )
+
+    os.replace(tmp_path, path)
+    logger.info(f"表库已写入 {path}，总耗时 {time.perf_counter() - started:.1f}s")
+    return path
+
+
+# ---------------------------------------------------------------------------
+# 查询
+# ---------------------------------------------------------------------------
+
+class Tablebase:
+    """只读的内存映射表库"""
+
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            magic, version, rows, cols, k = struct.unpack(
+                HEADER_FORMAT, f.read(struct.calcsize(HEADER_FORMAT))
+            )
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise ValueError(f"不是有效的表库文件: {path}")
+
+        self.path = path
+        self.geometry = get_geometry(rows, cols, k)
+        self.rows, self.cols, self.k = rows, cols, k
+        self._pow3 = _powers_of_three(self.geometry.cells)
+        self._table = np.memmap(
+            path, dtype=np.int8, mode="r", offset=HEADER_SIZE, shape=(3 ** self.geometry.cells,)
+        )
+
+    def supports(self, board, k: Optional[int] = None) -> bool:
+        """表库是否覆盖该棋盘尺寸"""
+        if len(board) != self.rows or (board and len(board[0]) != self.cols):
+            return False
+        return k is None or k == self.k
+
+    def index(self, board) -> int:
+        """二维棋盘 -> 三进制局面编号"""
+        index = 0
+        for row in range(self.rows):
+            for col in range(self.cols):
+                cell = board[row][col]
+                if cell == 'X':
+                    index += self._pow3[row * self.cols + col]
+                elif cell == 'O':
+                    index += 2 * self._pow3[row * self.cols + col]
+        return index
+
+    def probe(self, board) -> Optional[int]:
+        """
+        查询局面分值（以轮到走棋的一方为视角）
+        :return: 分值，不可达局面返回None
+        """
+        score = int(self._table[self.index(board)])
+        return None if score == UNREACHABLE else score
+
+    def best_move(self, board) -> Optional[Tuple[int, int]]:
+        """
+        返回完美着法：尽快获胜、尽量拖延失败
+        :return: (row, col)，终局或不可达局面返回None
+        """
+        index = self.index(board)
+        if self._table[index] == UNREACHABLE:
+            return None
+        x_count = sum(row.count('X') for row in board)
+        o_count = sum(row.count('O') for row in board)
+        digit = 1 if x_count == o_count else 2
+
+        best_move = None
+        best_score = None
+        for row in range(self.rows):
+            for col in range(self.cols):
+                if board[row][col] is not None:
+                    continue
+                child = int(self._table[index + digit * self._pow3[row * self.cols + col]])
+                if child == UNREACHABLE:
+                    continue
+                score = -child
+                if best_score is None or score > best_score:
+                    best_score = score
+                    best_move = (row, col)
+        return best_move
+
+
+def describe_score(score: Optional[int]) -> str:
+    """把分值转换为可读描述"""
+    if score is None:
+        return "不可达"
+    if score > 0:
+        return f"{SCORE_BASE - score} 步内获胜"
+    if score < 0:
+        return f"{SCORE_BASE + score} 步后落败"
+    return "和棋"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="生成 m,n,k 残局表库")
+    parser.add_argument("--rows", type=int, default=4)
+    parser.add_argument("--cols", type=int, default=4)
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--workers", type=int, default=None, help="工作进程数（默认全部CPU）")
+    parser.add_argument("--out", default=None, help="输出路径（默认 tablebases/<rows>x<cols>k<k>.tb）")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    path = generate(args.rows, args.cols, args.k, args.out, args.workers)
+
+    tablebase = Tablebase(path)
+    empty = [[None] * args.cols for _ in range(args.rows)]
+    score = tablebase.probe(empty)
+    print(f"✓ {args.rows}x{args.cols} k={args.k} 开局: 先手 {describe_score(score)}")
+    print(f"  最佳首着: {tablebase.best_move(empty)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,7 +2,7 @@
 测试脚本 - 测试游戏逻辑和AI
 """
 from game_logic import TicTacToeGame
-from ai_strategy import SimpleAI, TicTacToeAI
+from ai_strategy import SimpleAI, TicTacToeAI, ThreatSpaceAI
 
 
 def test_game_logic():
@@ -45,6 +45,17 @@ def test_game_logic():
             print(f"最后一步: {result}")
     print(game)
     
+    # 测试版本号
+    print("\n5. 测试版本号")
+    version = game.version
+    game.make_move(0, 0)  # 已结束，非法
+    assert game.version == version
+    game.reset()
+    assert game.version == version + 1
+    game.make_move(1, 1)
+    assert game.get_state()['version'] == version + 2
+    print(f"版本号: {game.version}")
+    
     print("\n✓ 游戏逻辑测试完成")
 
 
@@ -154,6 +165,1806 @@ def test_minimax_ai():
     print("\n✓ Minimax AI测试完成")
 
 
+def test_tablebase():
+    """测试3x3表库生成与查询"""
+    import os
+    import tempfile
+    from tablebase import generate, Tablebase, describe_score
+    
+    print("\n" + "="*50)
+    print("测试残局表库")
+    print("="*50)
+    
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = generate(3, 3, 3, os.path.join(tmp_dir, "3x3k3.tb"), workers=1)
+        tablebase = Tablebase(path)
+        
+        game = TicTacToeGame()
+        print(f"\n1. 空棋盘: {describe_score(tablebase.probe(game.board))}")
+        assert tablebase.probe(game.board) == 0
+        
+        print("\n2. 表库AI应立即获胜")
+        game.make_move(0, 0)  # X
+        game.make_move(1, 0)  # O
+        game.make_move(0, 1)  # X
+        game.make_move(1, 1)  # O
+        ai = TicTacToeAI(difficulty='hard', tablebase=tablebase)
+        move = ai.get_best_move(game)
+        print(f"表库AI选择: {move}")
+        print(f"预期: (0, 2)")
+        assert move == (0, 2)
+        
+        print("\n3. 连珠数与表库不一致时不查表")
+        assert not tablebase.supports(game.board, 2)
+        
+        def unexpected_probe(board):
+            raise AssertionError("连珠数不一致时不应查询表库")
+        
+        tablebase.best_move = unexpected_probe
+        move = TicTacToeAI(difficulty='hard', tablebase=tablebase, k=2).get_best_move(game)
+        assert move is not None
+        print(f"k=2 AI选择: {move}（未使用 k=3 表库）")
+        
+        print("\n4. config.json 的 game.tablebase_path：对局AI加载并查询表库")
+        import json
+        from ai_strategy import SimpleAI, create_ai_from_config
+        config_path = os.path.join(tmp_dir, 'config.json')
+        probes = []
+        for engine, tablebase_path in [('simple', path), ('minimax', path), ('simple', os.path.join(tmp_dir, 'missing.tb'))]:
+            with open(config_path, 'w', encoding='utf-8') as f:
+                json.dump({'game': {'ai_engine': engine, 'tablebase_path': tablebase_path}}, f)
+            ai = create_ai_from_config(config_path)
+            if ai.tablebase is None:
+                probes.append(None)
+                continue
+            best_move = ai.tablebase.best_move
+            ai.tablebase.best_move = lambda board: probes.append(engine) or best_move(board)
+            game = TicTacToeGame()
+            for row, col in [(0, 0), (1, 1), (2, 2)]:
+                game.make_move(row, col)
+            # X 占两个对角、O 居中：规则AI会占角而落败，表库给出的不败着法是边
+            move = ai.get_best_move(game)
+            assert move in [(0, 1), (1, 0), (1, 2), (2, 1)] and probes[-1] == engine, (engine, move)
+        assert probes == ['simple', 'minimax', None]
+        assert create_ai_from_config(config_path).__class__ is SimpleAI
+        print("simple / minimax 引擎都查询了表库，文件缺失时退回不查表")
+    
+    print("\n✓ 表库测试完成")
+
+
+def test_threat_space_ai():
+    """测试威胁空间搜索AI"""
+    print("\n" + "="*50)
+    print("测试威胁空间搜索AI")
+    print("="*50)
+    
+    print("\n1. 3x3 局面应立即获胜")
+    game = TicTacToeGame('ai', 'human')
+    game.make_move(0, 0)  # X
+    game.make_move(1, 0)  # O
+    game.make_move(2, 2)  # X
+    game.make_move(1, 1)  # O
+    game.make_move(0, 2)  # X
+    move = ThreatSpaceAI().get_best_move(game)
+    print(f"AI选择: {move}")
+    print(f"预期: (1, 2)")
+    assert move == (1, 2)
+    
+    print("\n2. 15x15 五连：一步形成双冲四")
+    
+    class BigBoardGame:
+        def __init__(self, size):
+            self.board = [[None] * size for _ in range(size)]
+            self.current_player = 'X'
+        
+        def get_available_moves(self):
+            return [(r, c) for r, row in enumerate(self.board) for c, cell in enumerate(row) if cell is None]
+    
+    game = BigBoardGame(15)
+    for row, col in [(7, 7), (7, 8), (7, 9), (8, 10), (9, 10), (10, 10)]:
+        game.board[row][col] = 'X'
+    for row, col in [(7, 6), (11, 10), (0, 0), (0, 1), (14, 14), (13, 13)]:
+        game.board[row][col] = 'O'
+    move = ThreatSpaceAI(k=5).get_best_move(game)
+    print(f"AI选择: {move}")
+    print(f"预期: (7, 10)")
+    assert move == (7, 10)
+
+    print("\n3. 15x15 五连：VCF 连续冲四强制获胜")
+    from mnk_board import get_geometry
+    from threat_search import ThreatBoard, VCFSolver
+    game = BigBoardGame(15)
+    for row, col in [(7, 7), (7, 8), (7, 9), (8, 10), (9, 10)]:
+        game.board[row][col] = 'X'
+    for row, col in [(7, 6), (11, 10), (0, 0), (0, 1), (14, 14)]:
+        game.board[row][col] = 'O'
+    geometry = get_geometry(15, 15, 5)
+    board = ThreatBoard(geometry, game.board)
+    # 一步成不了双冲四，只能先冲四逼对方封堵
+    for cell in board.four_moves('X'):
+        board.place(cell, 'X')
+        assert len(board.winning_cells('X', around=cell)) < 2
+        board.undo(cell)
+    line = VCFSolver().solve(board, 'X')
+    assert line is not None and len(line) >= 3
+    print(f"VCF序列: {[geometry.position(cell) for cell in line]}")
+    # 按序列走完：防守方每步都是唯一封堵点，最后一步进攻形成两处成五点
+    for index, cell in enumerate(line):
+        player = 'X' if index % 2 == 0 else 'O'
+        if player == 'O':
+            assert board.winning_cells('X') == {cell}
+        board.place(cell, player)
+    assert len(board.winning_cells('X')) >= 2
+    assert not board.winning_cells('O')
+    move = ThreatSpaceAI(k=5).get_best_move(game)
+    print(f"AI选择: {move}")
+    assert move == geometry.position(line[0])
+
+    print("\n4. 由 config.json 的 game.ai_engine 选择引擎")
+    import json
+    import os
+    import tempfile
+    from ai_strategy import SimpleAI, create_ai_from_config
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'config.json')
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({'game': {'ai_engine': 'threat', 'ai_difficulty': 'hard'}}, f)
+        ai = create_ai_from_config(path)
+        assert isinstance(ai, ThreatSpaceAI)
+        assert isinstance(create_ai_from_config(os.path.join(directory, 'missing.json')), SimpleAI)
+    game = TicTacToeGame('ai', 'human')
+    game.make_move(0, 0)  # X
+    game.make_move(1, 1)  # O
+    assert ai.get_best_move(game) in game.get_available_moves()
+
+    print("\n✓ 威胁空间搜索AI测试完成")
+
+
+def test_parallel_search():
+    """测试 Lazy-SMP 并行搜索"""
+    print("\n" + "="*50)
+    print("测试并行搜索")
+    print("="*50)
+    
+    game = TicTacToeGame('human', 'ai')
+    game.make_move(0, 0)  # X
+    game.make_move(1, 1)  # O
+    game.make_move(0, 1)  # X
+    print(game)
+    
+    ai = TicTacToeAI(difficulty='hard', workers=2, time_limit=2.0)
+    move = ai.get_best_move(game)
+    print(f"并行AI应该阻止X获胜，选择: {move}")
+    print(f"预期: (0, 2)")
+    assert move == (0, 2)
+
+    print("\n2. 进程池常驻：下一步复用同一批进程")
+    pool = ai._search_pool
+    pids = [process.pid for process in pool._processes]
+    game.make_move(0, 2)  # O
+    game.make_move(2, 0)  # X
+    assert ai.get_best_move(game) == (1, 0)
+    assert ai._search_pool is pool
+    assert [process.pid for process in pool._processes] == pids
+    ai.close()
+    assert not pool.started
+
+    print("\n3. 并行与单进程搜索分值一致")
+    from mnk_board import get_geometry
+    from parallel_search import SearchPool, search
+    geometry = get_geometry(3, 3, 3)
+    pool = SearchPool(workers=2)
+    try:
+        for moves in ([], [(1, 1)], [(0, 0), (1, 1)], [(0, 0), (1, 1), (0, 1)], [(0, 0), (0, 1), (1, 1)]):
+            game = TicTacToeGame()
+            for row, col in moves:
+                game.make_move(row, col)
+            x_mask, o_mask = geometry.board_to_masks(game.board)
+            own, opp, side = (x_mask, o_mask, 0) if game.current_player == 'X' else (o_mask, x_mask, 1)
+            _, serial_score, _ = search(geometry, own, opp, side)
+            _, parallel_score, _ = pool.search(geometry, own, opp, side, time_limit=5.0)
+            print(f"{moves}: 单进程 {serial_score}, 并行 {parallel_score}")
+            assert parallel_score == serial_score
+    finally:
+        pool.shutdown()
+
+    print("\n✓ 并行搜索测试完成")
+
+
+def test_move_and_reply():
+    """测试下棋并让AI回应"""
+    from game_manager import GameManager
+    
+    print("\n" + "=" * 50)
+    print("测试下棋+AI回应")
+    print("=" * 50)
+    
+    manager = GameManager()
+    ai = SimpleAI()
+    
+    game = manager.create_game('agent', 'ai')
+    result = manager.make_move_and_reply(game.game_id, 0, 0, ai)
+    assert result['status'] == 'success'
+    assert result['ai_move'] is not None
+    assert result['ai_move']['player'] == 'O'
+    assert result['game_state']['move_count'] == 2
+    assert result['game_state']['current_player'] == 'X'
+    print(f"AI回应: ({result['ai_move']['row']}, {result['ai_move']['col']})")
+    
+    # 对手不是内置AI时只走己方一步
+    game = manager.create_game('agent', 'human')
+    result = manager.make_move_and_reply(game.game_id, 1, 1, ai)
+    assert result['ai_move'] is None
+    assert result['game_state']['move_count'] == 1
+    
+    # 非法移动不会触发AI
+    result = manager.make_move_and_reply(game.game_id, 1, 1, ai, 'O')
+    assert result['status'] == 'error'
+    assert game.move_count == 1
+    
+    print("\n✓ 下棋+AI回应测试完成")
+
+
+def test_bulk_moves():
+    """测试批量下棋"""
+    from game_manager import GameManager
+    
+    print("\n" + "=" * 50)
+    print("测试批量下棋")
+    print("=" * 50)
+    
+    manager = GameManager()
+    games = [manager.create_game('agent', 'ai') for _ in range(3)]
+    results = manager.make_moves([
+        {'game_id': games[0].game_id, 'row': 0, 'col': 0},
+        {'game_id': games[1].game_id, 'row': 1, 'col': 1, 'reply': True},
+        {'game_id': games[2].game_id, 'row': 3, 'col': 0},
+        {'game_id': 'missing', 'row': 0, 'col': 0},
+    ], SimpleAI())
+    
+    assert [item['status'] for item in results] == ['success', 'success', 'error', 'error']
+    assert results[0]['state']['board'] == 'X........'
+    assert results[1]['state']['move_count'] == 2
+    assert results[2]['state']['move_count'] == 0
+    assert 'state' not in results[3]
+    print(f"精简状态: {results[0]['state']}")
+    
+    print("\n✓ 批量下棋测试完成")
+
+
+def test_state_codec():
+    """测试二进制状态编码"""
+    import state_codec
+    
+    print("\n" + "=" * 50)
+    print("测试二进制状态编码")
+    print("=" * 50)
+    
+    game = TicTacToeGame('agent', 'ai')
+    for row, col in [(0, 2), (0, 0), (1, 1), (1, 0), (2, 0)]:
+        game.make_move(row, col)
+    
+    data = state_codec.pack_state(game)
+    decoded = state_codec.unpack(data)
+    print(f"编码长度: {len(data)} 字节")
+    assert decoded['board'] == game.board
+    assert decoded['winner'] == 'X'
+    assert decoded['winning_line'] == game.winning_line
+    assert decoded['status'] == 'finished'
+    assert decoded['version'] == game.version
+    assert decoded['moves'] == [[0, 2], [0, 0], [1, 1], [1, 0], [2, 0]]
+    
+    timeline = state_codec.unpack(state_codec.pack_timeline(game))
+    assert timeline['player_x_type'] == 'agent'
+    assert timeline['player_o_type'] == 'ai'
+    assert len(timeline['move_offsets_ms']) == 5
+    
+    assert state_codec.wants_binary('binary', None)
+    assert state_codec.wants_binary(None, state_codec.MIME_TYPE)
+    assert not state_codec.wants_binary(None, 'application/json')
+    
+    print("\n✓ 二进制状态编码测试完成")
+
+
+def test_list_games():
+    """测试游戏列表索引与分页"""
+    from game_manager import GameManager
+    
+    print("\n" + "=" * 50)
+    print("测试游戏列表索引与分页")
+    print("=" * 50)
+    
+    manager = GameManager()
+    games = [manager.create_game(x, o) for x, o in
+             [('agent', 'ai'), ('human', 'agent'), ('agent', 'human'), ('human', 'ai')]]
+    manager.make_move(games[0].game_id, 0, 0)
+    
+    found, _ = manager.list_games({'player_x_type': 'agent', 'move_count': '0'})
+    assert found == [games[2]]
+    found, _ = manager.list_games({'player_type': 'agent'})
+    assert found == games[:3]
+    
+    # 重置后重新回到“等待第一手”索引
+    manager.reset_game(games[0].game_id)
+    found, _ = manager.list_games({'move_count': '0'})
+    assert found == games
+    
+    # 游标分页
+    page, cursor = manager.list_games(limit=3)
+    assert page == games[:3] and cursor is not None
+    page, cursor = manager.list_games(cursor=cursor, limit=3)
+    assert page == games[3:] and cursor is None
+    
+    manager.delete_game(games[1].game_id)
+    result = manager.query_games({'status': 'in_progress', 'fields': 'game_id,move_count'})
+    assert result['count'] == 3
+    assert set(result['games'][games[0].game_id]) == {'game_id', 'move_count'}
+    print(f"查询结果: {result['count']} 局")
+    
+    # 超过一页（默认100）：按游标翻页不重不漏；倒序时新游戏在第一页
+    manager = GameManager()
+    stale = [manager.create_game('agent', 'human').game_id for _ in range(150)]
+    result = manager.query_games({'player_type': 'agent'})
+    assert result['count'] == 100 and list(result['games']) == stale[:100]
+    second = manager.query_games({'player_type': 'agent', 'cursor': str(result['next_cursor'])})
+    assert list(second['games']) == stale[100:] and second['next_cursor'] is None
+    fresh = manager.create_game('human', 'agent').game_id
+    newest = manager.query_games({'status': 'in_progress', 'player_type': 'agent', 'order': 'desc', 'limit': '10'})
+    assert list(newest['games'])[:2] == [fresh, stale[-1]]
+    older = manager.query_games({'player_type': 'agent', 'order': 'desc', 'cursor': str(newest['next_cursor'])})
+    assert list(older['games']) == stale[::-1][9:109]
+    pages = []
+    params = {'player_type': 'agent', 'order': 'desc', 'limit': '40'}
+    while True:
+        page = manager.query_games(params)
+        pages.extend(page['games'])
+        if page['next_cursor'] is None:
+            break
+        params['cursor'] = str(page['next_cursor'])
+    assert pages == [fresh] + stale[::-1]
+    try:
+        manager.query_games({'order': 'newest'})
+        raise AssertionError("非法 order 应报错")
+    except ValueError:
+        pass
+    print(f"151 局分页: 正序 100+{second['count']}，倒序首页 {newest['count']}")
+    
+    print("\n✓ 游戏列表测试完成")
+
+
+def test_logging():
+    """测试日志队列、分类采样与丢弃计数"""
+    import io
+    import json
+    import logging
+    import threading
+    import arena_logging
+    import arena_metrics
+    
+    print("\n" + "=" * 50)
+    print("测试结构化日志")
+    print("=" * 50)
+    
+    move_logger = arena_logging.get_logger('moves')
+    event_logger = arena_logging.get_logger('events')
+    stream = io.StringIO()
+    try:
+        # 1. 请求线程只入队，由后台线程格式化输出
+        arena_logging.setup_logging(level='INFO', categories={'events': 'WARNING'},
+                                    sample={'moves': 0.25}, json_lines=True, stream=stream)
+        handlers = logging.getLogger().handlers
+        assert len(handlers) == 1 and isinstance(handlers[0], arena_logging.DroppingQueueHandler)
+        emitted = []
+        output = arena_logging._listener.handlers[0]
+        original_emit = output.emit
+        output.emit = lambda record: emitted.append(threading.current_thread()) or original_emit(record)
+        
+        # 2. moves 每4条 INFO 保留1条，WARNING 不采样；events 的 INFO 被级别过滤
+        for index in range(8):
+            move_logger.info("落子", extra=arena_logging.fields(game_id='g1', index=index))
+        move_logger.warning("非法落子", extra=arena_logging.fields(game_id='g1'))
+        event_logger.info("事件入队")
+        event_logger.warning("事件队列已满")
+        arena_logging.shutdown_logging()
+        
+        lines = [json.loads(line) for line in stream.getvalue().splitlines()]
+        moves = [line for line in lines if line['logger'] == 'arena.moves']
+        assert [line.get('index') for line in moves] == [0, 4, None]
+        assert moves[0]['game_id'] == 'g1' and moves[-1]['level'] == 'WARNING'
+        assert [line['message'] for line in lines if line['logger'] == 'arena.events'] == ["事件队列已满"]
+        assert emitted and threading.current_thread() not in emitted
+        print(f"采样后输出: {len(lines)} 行（落子 {len(moves)} 行）")
+        
+        # 3. 队列满时丢弃并计数，不阻塞调用方；计数通过指标导出
+        arena_logging.setup_logging(level='INFO', queue_size=2, stream=stream)
+        # 先停掉后台线程让队列不再被消费（之后不再重复 stop，哨兵已无处可放）
+        arena_logging.shutdown_logging()
+        for index in range(5):
+            logging.getLogger('test.logging').info(f"记录 {index}")
+        assert arena_logging.dropped_records() == 3
+        assert 'arena_log_records_dropped 3' in arena_metrics.render()
+        print(f"队列已满丢弃: {arena_logging.dropped_records()} 条")
+    finally:
+        arena_logging.shutdown_logging()
+        for logger in (move_logger, event_logger):
+            logger.setLevel(logging.NOTSET)
+            for existing in list(logger.filters):
+                logger.removeFilter(existing)
+        arena_logging.setup_logging_from_config()
+    
+    print("\n✓ 结构化日志测试完成")
+
+
+def test_metrics():
+    """测试分片指标汇总与文本输出"""
+    import threading
+    import arena_metrics
+    
+    print("\n" + "=" * 50)
+    print("测试运行指标")
+    print("=" * 50)
+    
+    counter = arena_metrics.Counter('test_counter_total', '测试计数器', ('kind',))
+    histogram = arena_metrics.Histogram('test_latency_seconds', '测试直方图', buckets=(0.1, 1.0))
+    
+    def work():
+        for _ in range(1000):
+            counter.inc('a')
+        histogram.observe(0.5)
+    
+    # 多个线程各写各的分片，退出后并入归档，总数不丢
+    threads = [threading.Thread(target=work) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    counter.inc('b', amount=2)
+    histogram.observe(0.05)
+    
+    assert counter.values() == {('a',): 4000, ('b',): 2}
+    text = arena_metrics.render()
+    assert 'test_counter_total{kind="a"} 4000' in text
+    assert 'test_latency_seconds_bucket{le="0.1"} 1' in text
+    assert 'test_latency_seconds_bucket{le="1"} 5' in text
+    assert 'test_latency_seconds_count 5' in text
+    print(f"指标输出: {len(text.splitlines())} 行")
+    
+    # 基类是抽象类，未实现 samples() 的指标不能实例化
+    try:
+        arena_metrics._Metric('test_abstract', '抽象指标')
+        raise AssertionError("_Metric 应为抽象类")
+    except TypeError:
+        pass
+    
+    print("\n✓ 运行指标测试完成")
+
+
+def test_admission():
+    """测试有界事件队列与推送连接名额"""
+    from game_manager import GameManager
+    from admission import AdmissionRejected, StreamBudget
+    
+    print("\n" + "=" * 50)
+    print("测试准入控制")
+    print("=" * 50)
+    
+    # 没人订阅时事件队列不会无限增长，丢弃最旧的
+    manager = GameManager(max_queued_events=4)
+    game = manager.create_game('human', 'human')
+    for row, col in [(0, 0), (1, 1), (0, 1), (2, 2)]:
+        manager.make_move(game.game_id, row, col)
+    events, missed = manager.read_events(game.game_id, 0)
+    assert len(events) == 4 and manager.dropped_events == 1 and missed
+    assert events[0].type == 'move'
+    
+    # 事件日志按给定序号追加：迟到的丢弃，中间有缺口时清空，游标在缺口之前的订阅者重新同步
+    from game_manager import GameEventLog
+    log = GameEventLog(4, last_seq=10)
+    assert not log.append({'type': 'move'}, seq=10) and len(log) == 0
+    log.append({'type': 'move'}, seq=11)
+    log.append({'type': 'move'}, seq=13)
+    assert [event.seq for event in log.events] == [13]
+    events, missed = log.since(12)
+    assert [event.seq for event in events] == [13] and not missed
+    assert log.since(11)[1]
+    print(f"事件队列: 保留 {len(events)} 条, 丢弃 {manager.dropped_events} 条")
+    
+    budget = StreamBudget(max_streams=3, max_per_client=2, retry_after=7)
+    budget.acquire('a')
+    budget.acquire('a')
+    try:
+        budget.acquire('a')
+        assert False, "单客户端应被限制"
+    except AdmissionRejected as e:
+        assert e.status == 429 and e.headers() == {'Retry-After': '7'}
+    budget.acquire('b')
+    try:
+        budget.acquire('c')
+        assert False, "全局应被限制"
+    except AdmissionRejected as e:
+        assert e.status == 503
+    budget.release('a')
+    with budget.slot('c'):
+        assert budget.stats()['active_streams'] == 3
+    assert budget.stats() == {'active_streams': 2, 'clients': 2, 'max_streams': 3, 'max_streams_per_client': 2}
+    
+    print("\n✓ 准入控制测试完成")
+
+
+def test_sqlite_store():
+    """测试SQLite共享存储：两个管理器（模拟两个进程）读写同一批游戏"""
+    import os
+    import tempfile
+    from game_manager import GameManager
+    from game_store import SQLiteGameStore
+    
+    print("\n" + "=" * 50)
+    print("测试SQLite游戏存储")
+    print("=" * 50)
+    
+    path = os.path.join(tempfile.mkdtemp(), 'arena.db')
+    # 存储接口是抽象类，缺少方法的实现不能实例化
+    from game_store import GameStore
+    try:
+        type('PartialStore', (GameStore,), {'insert': lambda self, game: None})()
+        raise AssertionError("GameStore 应为抽象类")
+    except TypeError:
+        pass
+    
+    worker_a = GameManager(store=SQLiteGameStore(path))
+    worker_b = GameManager(store=SQLiteGameStore(path))
+    
+    game_id = worker_a.create_game('human', 'ai').game_id
+    assert worker_b.make_move(game_id, 0, 0)['status'] == 'success'
+    # A 读取时发现版本号变化，重新载入
+    game = worker_a.get_game(game_id)
+    assert game.board[0][0] == 'X' and game.version == 1
+    assert worker_a.make_move(game_id, 1, 1)['status'] == 'success'
+    assert worker_b.get_game(game_id).move_history[-1]['player'] == 'O'
+    
+    # 过期版本写入被拒绝
+    stale = worker_b.get_game(game_id).clone()
+    stale.game_id = game_id
+    stale.version += 1
+    assert not worker_b.store.save(stale, 0)
+    
+    found, _ = worker_b.list_games({'player_o_type': 'ai'})
+    assert [g.game_id for g in found] == [game_id]
+    
+    # 列表查询只在其他连接写入后才全量同步
+    scans = []
+    versions = worker_b.store.versions
+    worker_b.store.versions = lambda: scans.append(1) or versions()
+    worker_b.list_games()
+    assert scans == []
+    other_id = worker_a.create_game('agent', 'human').game_id
+    found, _ = worker_b.list_games({'player_x_type': 'agent'})
+    assert [g.game_id for g in found] == [other_id] and scans == [1]
+    worker_b.list_games()
+    assert scans == [1]
+    worker_b.store.versions = versions
+    worker_a.delete_game(other_id)
+    
+    assert worker_b.delete_game(game_id)
+    assert worker_a.get_game(game_id) is None and game_id not in worker_a.games
+    print("两个管理器共享同一数据库 ✓")
+    
+    print("\n✓ SQLite存储测试完成")
+
+
+def test_shard_ids():
+    """测试分片游戏ID"""
+    import uuid
+    from game_manager import GameManager, new_shard_game_id, shard_of
+    
+    print("\n" + "=" * 50)
+    print("测试分片游戏ID")
+    print("=" * 50)
+    
+    for count in (1, 3, 8):
+        for shard in range(count):
+            game_id = new_shard_game_id(shard, count)
+            uuid.UUID(game_id)
+            assert shard_of(game_id, count) == shard
+    assert shard_of('not-a-game', 4) is None
+    
+    manager = GameManager()
+    manager.configure_shard(2, 4)
+    game = manager.create_game('human', 'ai')
+    assert shard_of(game.game_id, 4) == 2
+    print(f"分片 2/4 的游戏ID: {game.game_id}")
+    
+    print("\n✓ 分片游戏ID测试完成")
+
+
+def test_event_bus():
+    """测试跨进程事件总线：两个管理器经代理互相转发事件与结束的 timeline"""
+    import asyncio
+    import os
+    import tempfile
+    import threading
+    import time
+    from event_bus import EventBroker, EventBus
+    from game_manager import GameManager
+    from game_store import SQLiteGameStore
+    
+    print("\n" + "=" * 50)
+    print("测试跨进程事件总线")
+    print("=" * 50)
+    
+    directory = tempfile.mkdtemp()
+    socket_path = os.path.join(directory, 'bus.sock')
+    broker = EventBroker(socket_path)
+    threading.Thread(target=lambda: asyncio.run(broker.serve()), daemon=True).start()
+    
+    db_path = os.path.join(directory, 'arena.db')
+    worker_a = GameManager(store=SQLiteGameStore(db_path))
+    worker_b = GameManager(store=SQLiteGameStore(db_path))
+    worker_a.event_bus = EventBus(socket_path, worker_a.apply_bus_message)
+    worker_b.event_bus = EventBus(socket_path, worker_b.apply_bus_message)
+    deadline = time.time() + 5
+    while len(broker.clients) < 2 and time.time() < deadline:
+        time.sleep(0.01)
+    
+    game_id = worker_a.create_game('human', 'human').game_id
+    # B 上的观战者先订阅（游标为该局当前的事件序号），再由 A 落子
+    _, cursor = worker_b.subscribe_events(game_id)
+    worker_a.make_move(game_id, 0, 0)
+    received = []
+    while 'move' not in received and time.time() < deadline:
+        events, _ = worker_b.wait_for_events(game_id, cursor, 0.1)
+        received += [event.type for event in events]
+        cursor = events[-1].seq if events else cursor
+    assert 'move' in received
+    
+    # 两个进程轮流落子：事件序号随游戏保存，同一条事件在两边的 SSE id 相同
+    for worker, (row, col) in zip([worker_b, worker_a, worker_b, worker_a], [(1, 1), (0, 1), (2, 2), (0, 2)]):
+        other = worker_a if worker is worker_b else worker_b
+        seq = worker.make_move(game_id, row, col) and worker.event_logs[game_id].last_seq
+        while other.event_logs[game_id].last_seq < seq and time.time() < deadline:
+            other.wait_for_events(game_id, other.event_logs[game_id].last_seq, 0.1)
+    entries = worker_b.wait_for_finished(0, 2)
+    assert [entry.game_id for entry in entries] == [game_id]
+    print(f"B 收到事件: {received}，结束日志 {len(entries)} 条")
+    
+    logs = [[(event.seq, event.type) for event in worker.read_events(game_id, 0)[0]] for worker in (worker_a, worker_b)]
+    # B 的日志从它第一次载入该局时的序号开始（game_created 可能早于载入），之后与 A 完全一致
+    assert [seq for seq, _ in logs[0]] == list(range(1, 8)) and len(logs[1]) >= 6
+    assert logs[1] == logs[0][-len(logs[1]):]
+    assert logs[0][-2:] == [(6, 'move'), (7, 'game_over')]
+    # 在 A 上读到第 3 条的客户端重连到 B，从第 4 条继续，不需要重新同步
+    events, missed = worker_b.read_events(game_id, 3)
+    assert not missed and [event.seq for event in events] == [4, 5, 6, 7]
+    assert events[0].frame.startswith('id: 4\n')
+    print(f"两个进程的事件ID一致: {[seq for seq, _ in logs[0]]}")
+    
+    worker_a.event_bus.close()
+    worker_b.event_bus.close()
+    print("\n✓ 事件总线测试完成")
+
+
+def test_static_assets():
+    """测试静态资源：指纹改写、预压缩与缓存头"""
+    import gzip
+    import os
+    import tempfile
+    from static_assets import AssetStore
+    
+    print("\n" + "=" * 50)
+    print("测试静态资源")
+    print("=" * 50)
+    
+    directory = tempfile.mkdtemp()
+    os.makedirs(os.path.join(directory, 'static', 'js'))
+    with open(os.path.join(directory, 'static', 'js', 'util.js'), 'w') as f:
+        f.write("export const answer = 42;\n" * 20)
+    with open(os.path.join(directory, 'static', 'js', 'main.js'), 'w') as f:
+        f.write("import { answer } from './util.js';\n" + "console.log(answer);\n" * 20)
+    index_path = os.path.join(directory, 'index.html')
+    with open(index_path, 'w') as f:
+        f.write('<script type="module" src="static/js/main.js"></script>')
+    
+    store = AssetStore(os.path.join(directory, 'static'), index_path)
+    util = store.assets['/static/js/util.js']
+    main = store.assets['/static/js/main.js']
+    assert f"./util.{util.fingerprint}.js" in main.body.decode()
+    assert f'src="{main.fingerprinted_url[1:]}"'.encode() in store.index.body
+    assert gzip.decompress(main.gzip) == main.body
+    assert store.get(main.fingerprinted_url) == (main, True)
+    assert store.get('/static/js/main.js') == (main, False)
+    assert main.select('gzip;q=0, identity') == (main.body, None)
+    assert main.select('gzip, deflate')[1] == 'gzip'
+    
+    # 被引用文件变化，引用方的指纹随之变化
+    old = main.fingerprint
+    with open(os.path.join(directory, 'static', 'js', 'util.js'), 'a') as f:
+        f.write("export const other = 1;\n")
+    os.utime(os.path.join(directory, 'static', 'js', 'util.js'), (0, 0))
+    assert store.reload_if_changed()
+    assert store.assets['/static/js/main.js'].fingerprint != old
+    
+    from app import create_app
+    client = create_app().test_client()
+    response = client.get('/', headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert response.headers['Cache-Control'] == 'no-cache'
+    html = gzip.decompress(response.data).decode()
+    src = html.split('src="')[1].split('"')[0]
+    response = client.get('/' + src)
+    assert response.status_code == 200
+    assert 'immutable' in response.headers['Cache-Control']
+    etag = response.headers['ETag']
+    response = client.get('/' + src, headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    # If-None-Match 是逗号分隔的列表，可带 W/ 前缀或为 *；只有标签完全相同才算命中
+    for header, status in [(f'"stale", W/{etag}', 304), ('*', 304), (f'"x{etag[1:]}', 200),
+                           (etag[:-1] + '-br"', 200), ('"stale", "older"', 200)]:
+        assert client.get('/' + src, headers={'If-None-Match': header}).status_code == status, header
+    
+    # ASGI 模式提供同样的页面与静态资源
+    async def asgi_assets():
+        asgi = _ASGIClient()
+        status, headers, body = await asgi.request('GET', '/', headers={'Accept-Encoding': 'gzip'})
+        assert status == 200 and headers['content-encoding'] == 'gzip' and headers['cache-control'] == 'no-cache'
+        assert gzip.decompress(body).decode() == html
+        status, headers, body = await asgi.request('GET', '/' + src)
+        assert status == 200 and 'immutable' in headers['cache-control'] and headers['etag'] == etag
+        assert 'javascript' in headers['content-type']
+        status, _, body = await asgi.request('GET', '/' + src, headers={'If-None-Match': f'"stale", W/{etag}'})
+        assert status == 304 and body == b''
+        status, _, _ = await asgi.request('GET', '/static/js/missing.js')
+        assert status == 404
+    
+    _run_asgi(asgi_assets())
+    print(f"入口脚本: {src}")
+    print("\n✓ 静态资源测试完成")
+
+
+def test_server_launcher():
+    """测试应用工厂与生产启动器的配置、预热"""
+    from app import create_app
+    from arena_server import DEFAULT_SERVER_CONFIG, load_server_config, warm_up
+    
+    print("\n" + "=" * 50)
+    print("测试应用工厂与启动器")
+    print("=" * 50)
+    
+    server = load_server_config()
+    assert set(DEFAULT_SERVER_CONFIG) <= set(server)
+    assert server['port'] == 5000
+    assert load_server_config('/nonexistent/config.json') == DEFAULT_SERVER_CONFIG
+    
+    # 每次调用得到独立的应用，配置互不影响
+    first = create_app({'TESTING': True})
+    second = create_app()
+    assert first is not second
+    assert first.config['TESTING'] and not second.config['TESTING']
+    assert second.test_client().get('/api/health').status_code == 200
+    
+    report = warm_up(0.05)
+    assert report['moves_per_second'] > 0
+    print(f"首局 {report['first_game'] * 1000:.1f}ms, 稳态吞吐 {report['moves_per_second']:.0f} 着法/秒")
+    print("\n✓ 应用工厂与启动器测试完成")
+
+
+def test_event_log():
+    """测试事件日志：多个订阅者各自的游标、共享编码、Last-Event-ID 续传"""
+    from app import create_app
+    from game_manager import GameManager, game_manager
+    
+    print("\n" + "=" * 50)
+    print("测试事件日志")
+    print("=" * 50)
+    
+    manager = GameManager(max_queued_events=8)
+    game_id = manager.create_game('human', 'human').game_id
+    state, cursor = manager.subscribe_events(game_id)
+    assert cursor == 1 and state['move_count'] == 0
+    manager.make_move(game_id, 0, 0)
+    manager.make_move(game_id, 1, 1)
+    
+    # 两个观战者读到同样的事件，读取不会移除，编码只做一次
+    first, _ = manager.read_events(game_id, cursor)
+    second, missed = manager.read_events(game_id, cursor)
+    assert [event.type for event in first] == ['move', 'move'] and not missed
+    assert first[0].frame is second[0].frame
+    assert first[0].frame.startswith(f"id: {first[0].seq}\n")
+    created, _ = manager.read_events(game_id, 0)
+    assert created[0].event['game_state']['board'][0][0] is None  # 事件保存的是当时的局面
+    assert manager.read_events(game_id, first[-1].seq) == ([], False)
+    assert manager.wait_for_events(game_id, first[-1].seq, 0.01) == ([], False)
+    
+    # 游标落后于环形缓冲或超出最新序号：提示重新同步
+    for _ in range(7):
+        manager.reset_game(game_id)
+    events, missed = manager.read_events(game_id, 1)
+    assert missed and len(events) == 8
+    assert manager.read_events(game_id, 100)[1]
+    
+    # SSE：带 Last-Event-ID 重连只推送之后的事件
+    game_id = game_manager.create_game('human', 'human').game_id
+    game_manager.make_move(game_id, 0, 0)
+    game_manager.make_move(game_id, 1, 1)
+    client = create_app().test_client()
+    response = client.get(f'/api/game/{game_id}/events', headers={'Last-Event-ID': '2'}, buffered=False)
+    chunks = iter(response.response)
+    assert b'"connected"' in next(chunks)
+    resumed = next(chunks).decode()
+    assert resumed.startswith('id: 3\n') and '"row": 1' in resumed
+    response.close()
+    game_manager.delete_game(game_id)
+    print(f"续传首条: {resumed.splitlines()[0]}")
+    print("\n✓ 事件日志测试完成")
+
+
+def test_rl_batcher():
+    """测试RL微批处理：并发请求合并推理，各局得到自己的着法"""
+    import threading
+    import time
+    from game_manager import GameManager
+    from rl_player import RLMoveBatcher, board_to_action_masks
+    
+    print("\n" + "=" * 50)
+    print("测试RL微批处理")
+    print("=" * 50)
+    
+    class FakeModel:
+        """first 选第一个空位，last 选最后一个空位"""
+        def __init__(self, pick_last):
+            self.pick_last = pick_last
+            self.batch_sizes = []
+        
+        def predict(self, observations, action_masks=None, deterministic=True):
+            self.batch_sizes.append(len(observations))
+            actions = []
+            for mask in action_masks:
+                legal = [index for index, allowed in enumerate(mask) if allowed]
+                actions.append(legal[-1] if self.pick_last else legal[0])
+            return actions, None
+    
+    class FakePool:
+        def __init__(self):
+            self.models = {'first': FakeModel(False), 'last': FakeModel(True)}
+        
+        def get(self, name):
+            return self.models[name]
+    
+    manager = GameManager()
+    pool = FakePool()
+    batcher = RLMoveBatcher(manager, pool, window_ms=50)
+    
+    print("\n1. 并发提交，按模型分组批量推理")
+    games = []
+    for index in range(8):
+        games.append(manager.create_game('human', 'rl', 'first' if index % 2 == 0 else 'last'))
+    opening = [(index // 3, index % 3) for index in range(8)]
+    
+    def human_move(game, move):
+        manager.make_move(game.game_id, *move)
+        batcher.schedule_if_needed(manager.get_game(game.game_id))
+    
+    threads = [threading.Thread(target=human_move, args=(game, move)) for game, move in zip(games, opening)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    deadline = time.time() + 5
+    for game in games:
+        cursor = 0
+        while manager.get_game(game.game_id).move_count < 2 and time.time() < deadline:
+            events, _ = manager.wait_for_events(game.game_id, cursor, 0.5)
+            if events:
+                cursor = events[-1].seq
+    
+    for index, (game, (row, col)) in enumerate(zip(games, opening)):
+        board = [[None] * 3 for _ in range(3)]
+        board[row][col] = 'X'
+        legal = [cell for cell, allowed in enumerate(board_to_action_masks(board)) if allowed]
+        expected = legal[0] if index % 2 == 0 else legal[-1]
+        last_move = manager.get_game(game.game_id).move_history[-1]
+        assert last_move['player'] == 'O'
+        assert (last_move['row'], last_move['col']) == divmod(expected, 3)
+    calls = sum(len(model.batch_sizes) for model in pool.models.values())
+    print(f"8局请求, predict 调用 {calls} 次, 批大小 {[model.batch_sizes for model in pool.models.values()]}")
+    assert calls < len(games)
+    
+    print("\n2. 模型随游戏保存：终局并重置后、以及其他进程载入的游戏都用创建时的模型")
+    import os
+    import tempfile
+    from game_store import SQLiteGameStore
+    path = os.path.join(tempfile.mkdtemp(), 'arena.db')
+    worker_a = GameManager(store=SQLiteGameStore(path))
+    worker_b = GameManager(store=SQLiteGameStore(path))
+    batcher_b = RLMoveBatcher(worker_b, pool, window_ms=5)
+    game_id = worker_a.create_game('human', 'rl', 'last').game_id
+    for row, col in [(1, 1), (0, 1), (2, 2), (0, 2), (0, 0)]:
+        worker_a.make_move(game_id, row, col)
+    assert worker_a.get_game(game_id).status.value == 'finished'
+    worker_a.reset_game(game_id)
+    
+    calls = len(pool.models['last'].batch_sizes)
+    worker_b.make_move(game_id, 1, 1)
+    assert batcher_b.schedule_if_needed(worker_b.get_game(game_id))
+    deadline = time.time() + 5
+    while worker_b.get_game(game_id).move_count < 2 and time.time() < deadline:
+        time.sleep(0.01)
+    last_move = worker_b.get_game(game_id).move_history[-1]
+    assert worker_b.get_game(game_id).rl_model == 'last'
+    assert (last_move['player'], last_move['row'], last_move['col']) == ('O', 2, 2)
+    assert len(pool.models['last'].batch_sizes) == calls + 1
+    print(f"重置后另一进程的RL着法: ({last_move['row']}, {last_move['col']})，模型 last")
+    
+    print("\n✓ RL微批处理测试完成")
+
+
+def test_numpy_policy():
+    """测试NumPy策略：与逐层手算/SB3模型给出相同动作"""
+    import os
+    import tempfile
+    import numpy as np
+    from numpy_policy import FORMAT_VERSION, NumpyPolicy, export_policy, load_policy
+    from rl_player import MODELS_DIR, RLPolicyPool, board_to_action_masks, board_to_observation
+    
+    print("\n" + "=" * 50)
+    print("测试NumPy策略推理")
+    print("=" * 50)
+    
+    # 样本局面：若干随机对局的中间局面
+    boards = []
+    rng = np.random.default_rng(0)
+    for _ in range(20):
+        game = TicTacToeGame()
+        for _ in range(int(rng.integers(0, 6))):
+            moves = game.get_available_moves()
+            if game.status.value != 'in_progress' or not moves:
+                break
+            game.make_move(*moves[int(rng.integers(len(moves)))])
+        if game.status.value == 'in_progress':
+            boards.append((game.board, game.current_player))
+    observations = np.array([board_to_observation(board, player) for board, player in boards], dtype=np.float32)
+    masks = np.array([board_to_action_masks(board) for board, _ in boards], dtype=np.bool_)
+    
+    print("\n1. 导出格式：批量、单个推理与逐层手算一致，且只选合法动作")
+    weights = {
+        'w0': rng.standard_normal((16, 9)).astype(np.float32), 'b0': rng.standard_normal(16).astype(np.float32),
+        'w1': rng.standard_normal((16, 16)).astype(np.float32), 'b1': rng.standard_normal(16).astype(np.float32),
+        'action_w': rng.standard_normal((9, 16)).astype(np.float32), 'action_b': rng.standard_normal(9).astype(np.float32),
+    }
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'policy.npz')
+        np.savez(path, activations=np.array(['tanh', 'relu']), obs_dim=np.array(9),
+                 format_version=np.array(FORMAT_VERSION), **weights)
+        policy = NumpyPolicy.load(path)
+    hidden = np.maximum(np.tanh(observations @ weights['w0'].T + weights['b0']) @ weights['w1'].T + weights['b1'], 0)
+    logits = np.where(masks, hidden @ weights['action_w'].T + weights['action_b'], -np.inf)
+    actions, _ = policy.predict(observations, action_masks=masks, deterministic=True)
+    assert list(actions) == list(np.argmax(logits, axis=1))
+    assert all(masks[index, action] for index, action in enumerate(actions))
+    for observation, mask, action in zip(observations, masks, actions):
+        single, _ = policy.predict(observation, action_masks=mask, deterministic=True)
+        assert int(single) == int(action)
+    print(f"{len(boards)} 个局面动作一致")
+    
+    print("\n2. 导出的 .npz 与 SB3 模型动作一致")
+    if not RLPolicyPool.sb3_available():
+        print("未安装 RL 依赖（requirements-rl.txt），跳过")
+    else:
+        model_path = os.path.join(MODELS_DIR, 'rl_agent_v2_ppo.zip')
+        with tempfile.TemporaryDirectory() as directory:
+            exported = load_policy(export_policy(model_path, os.path.join(directory, 'policy.npz')))
+        from sb3_contrib import MaskablePPO
+        reference = MaskablePPO.load(model_path[:-4], device='cpu')
+        expected, _ = reference.predict(observations, action_masks=masks, deterministic=True)
+        actions, _ = exported.predict(observations, action_masks=masks, deterministic=True)
+        assert list(actions) == list(expected)
+        print(f"{len(boards)} 个局面动作一致")
+    
+    print("\n✓ NumPy策略测试完成")
+
+
+# ---------------------------------------------------------------------------
+# ASGI 测试工具：直接驱动 asgi_app.app（不需要启动服务器）
+# ---------------------------------------------------------------------------
+
+_ASGI_LOOP = None
+
+
+def _run_asgi(coroutine):
+    """所有 ASGI 测试共用一个事件循环（asgi_app 的通知器绑定到第一个事件循环）"""
+    import asyncio
+    global _ASGI_LOOP
+    if _ASGI_LOOP is None:
+        _ASGI_LOOP = asyncio.new_event_loop()
+    return _ASGI_LOOP.run_until_complete(coroutine)
+
+
+def _sse_payload(chunk: str):
+    """取出 SSE 文本块中 data: 行的 JSON（心跳等注释行返回 None）"""
+    import json
+    for line in chunk.splitlines():
+        if line.startswith('data: '):
+            return json.loads(line[6:])
+    return None
+
+
+class _ASGIStream:
+    """流式响应：逐块读取响应体，close() 模拟客户端断开"""
+    
+    def __init__(self, app, scope):
+        import asyncio
+        self.messages = asyncio.Queue()
+        self.disconnected = asyncio.Event()
+        self._requested = False
+        self.task = asyncio.ensure_future(app(scope, self._receive, self.messages.put))
+        self.status = None
+        self.headers = {}
+    
+    async def _receive(self):
+        if not self._requested:
+            self._requested = True
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+        await self.disconnected.wait()
+        return {'type': 'http.disconnect'}
+    
+    async def start(self):
+        import asyncio
+        message = await asyncio.wait_for(self.messages.get(), 2)
+        self.status = message['status']
+        self.headers = {name.decode(): value.decode() for name, value in message['headers']}
+        return self
+    
+    async def next_chunk(self, timeout: float = 2.0):
+        """下一块非心跳的响应体；流结束返回 None"""
+        import asyncio
+        while True:
+            message = await asyncio.wait_for(self.messages.get(), timeout)
+            if not message.get('more_body') and not message.get('body'):
+                return None
+            chunk = message['body'].decode('utf-8')
+            if not chunk.startswith(':'):
+                return chunk
+    
+    async def close(self):
+        import asyncio
+        self.disconnected.set()
+        await asyncio.wait_for(self.task, 2)
+
+
+class _ASGIWebSocket:
+    """WebSocket 连接：send_json / receive_json"""
+    
+    def __init__(self, app, scope):
+        import asyncio
+        self.inbound = asyncio.Queue()
+        self.outbound = asyncio.Queue()
+        self.inbound.put_nowait({'type': 'websocket.connect'})
+        self.task = asyncio.ensure_future(app(scope, self.inbound.get, self.outbound.put))
+    
+    async def accept(self):
+        import asyncio
+        return await asyncio.wait_for(self.outbound.get(), 2)
+    
+    async def send_json(self, payload):
+        import json
+        await self.inbound.put({'type': 'websocket.receive', 'text': json.dumps(payload)})
+    
+    async def receive_json(self, timeout: float = 2.0):
+        import asyncio
+        import json
+        message = await asyncio.wait_for(self.outbound.get(), timeout)
+        return json.loads(message['text'])
+    
+    async def close(self):
+        import asyncio
+        await self.inbound.put({'type': 'websocket.disconnect', 'code': 1000})
+        await asyncio.wait_for(self.task, 2)
+
+
+class _ASGIClient:
+    """最小化的 ASGI 测试客户端"""
+    
+    def __init__(self, client_host: str = '127.0.0.1'):
+        from asgi_app import app
+        self.app = app
+        self.client = (client_host, 50000)
+    
+    def _scope(self, scope_type: str, method: str, path: str, headers=None):
+        path, _, query = path.partition('?')
+        return {
+            'type': scope_type, 'method': method, 'path': path,
+            'query_string': query.encode(), 'client': self.client,
+            'headers': [(name.lower().encode('latin-1'), value.encode('latin-1'))
+                        for name, value in (headers or {}).items()],
+        }
+    
+    async def request(self, method: str, path: str, body=None, headers=None):
+        """普通请求，返回 (状态码, 响应头, 响应体 bytes)"""
+        import asyncio
+        import json
+        data = json.dumps(body).encode('utf-8') if body is not None else b''
+        messages = []
+        requested = False
+        
+        async def receive():
+            nonlocal requested
+            if not requested:
+                requested = True
+                return {'type': 'http.request', 'body': data, 'more_body': False}
+            await asyncio.Event().wait()
+        
+        async def send(message):
+            messages.append(message)
+        
+        await self.app(self._scope('http', method, path, headers), receive, send)
+        response_headers = {name.decode(): value.decode() for name, value in messages[0]['headers']}
+        return messages[0]['status'], response_headers, b''.join(m.get('body', b'') for m in messages[1:])
+    
+    async def json(self, method: str, path: str, body=None, headers=None):
+        import json
+        status, _, content = await self.request(method, path, body, headers)
+        return status, json.loads(content) if content else None
+    
+    async def stream(self, path: str, headers=None) -> _ASGIStream:
+        return await _ASGIStream(self.app, self._scope('http', 'GET', path, headers)).start()
+    
+    async def websocket(self, path: str) -> _ASGIWebSocket:
+        connection = _ASGIWebSocket(self.app, self._scope('websocket', 'GET', path))
+        await connection.accept()
+        return connection
+
+
+def test_sse_delivery():
+    """测试SSE推送：落子后立即送达（Flask 线程模式和 ASGI 模式）"""
+    import threading
+    import time
+    from app import create_app
+    from game_manager import game_manager
+    
+    print("\n" + "=" * 50)
+    print("测试SSE推送")
+    print("=" * 50)
+    
+    print("\n1. Flask：阻塞等待的连接在落子后被唤醒")
+    game_id = game_manager.create_game('human', 'human').game_id
+    response = create_app().test_client().get(f'/api/game/{game_id}/events', buffered=False)
+    chunks = iter(response.response)
+    assert _sse_payload(next(chunks).decode())['type'] == 'connected'
+    assert _sse_payload(next(chunks).decode())['type'] == 'state_update'
+    timer = threading.Timer(0.2, game_manager.make_move, (game_id, 1, 1))
+    started = time.perf_counter()
+    timer.start()
+    event = _sse_payload(next(chunks).decode())
+    latency = time.perf_counter() - started - 0.2
+    timer.join()
+    response.close()
+    assert event['type'] == 'move' and (event['row'], event['col'], event['player']) == (1, 1, 'X')
+    print(f"落子后 {latency * 1000:.1f}ms 送达")
+    assert latency < 0.25
+    
+    print("\n2. ASGI：两个观战者都收到同一步，游戏删除时流结束")
+    
+    async def scenario():
+        client = _ASGIClient()
+        status, created = await client.json('POST', '/api/game/create', {})
+        game_id = created['game_id']
+        viewers = [await client.stream(f'/api/game/{game_id}/events') for _ in range(2)]
+        for viewer in viewers:
+            assert viewer.status == 200 and viewer.headers['content-type'] == 'text/event-stream'
+            assert _sse_payload(await viewer.next_chunk())['type'] == 'connected'
+            assert _sse_payload(await viewer.next_chunk())['type'] == 'state_update'
+        status, _ = await client.json('POST', f'/api/game/{game_id}/move', {'row': 0, 'col': 2})
+        assert status == 200
+        for viewer in viewers:
+            chunk = await viewer.next_chunk(0.5)
+            event = _sse_payload(chunk)
+            assert event['type'] == 'move' and (event['row'], event['col']) == (0, 2)
+            assert chunk.startswith('id: ')
+        await client.request('DELETE', f'/api/game/{game_id}')
+        for viewer in viewers:
+            assert _sse_payload(await viewer.next_chunk())['type'] == 'game_deleted'
+            assert await viewer.next_chunk() is None
+            await viewer.close()
+    
+    _run_asgi(scenario())
+    print("两个观战者均收到落子事件")
+    print("\n✓ SSE推送测试完成")
+
+
+def test_asgi_offload():
+    """测试ASGI模式：慢的同步调用在线程池执行，不阻塞事件循环"""
+    import asyncio
+    import time
+    import asgi_app
+    
+    print("\n" + "=" * 50)
+    print("测试ASGI线程池卸载")
+    print("=" * 50)
+    
+    class SlowAI:
+        def get_best_move(self, game):
+            time.sleep(0.3)
+            return game.get_available_moves()[0]
+    
+    async def scenario():
+        client = _ASGIClient()
+        _, created = await client.json('POST', '/api/game/create', {})
+        game_id = created['game_id']
+        started = time.perf_counter()
+        ai_request = asyncio.ensure_future(client.json('POST', f'/api/game/{game_id}/ai-move'))
+        await asyncio.sleep(0.05)
+        status, health = await client.json('GET', '/api/health')
+        health_elapsed = time.perf_counter() - started
+        status_ai, result = await ai_request
+        ai_elapsed = time.perf_counter() - started
+        await client.request('DELETE', f'/api/game/{game_id}')
+        return status, health_elapsed, status_ai, result, ai_elapsed
+    
+    original = asgi_app.arena_ai
+    asgi_app.arena_ai = SlowAI()
+    try:
+        status, health_elapsed, status_ai, result, ai_elapsed = _run_asgi(scenario())
+    finally:
+        asgi_app.arena_ai = original
+    print(f"AI思考期间 /api/health 用时 {health_elapsed * 1000:.0f}ms, AI落子 {ai_elapsed * 1000:.0f}ms")
+    assert status == 200 and status_ai == 200 and result['status'] == 'success'
+    assert health_elapsed < 0.25 < ai_elapsed
+    
+    print("\n✓ ASGI线程池卸载测试完成")
+
+
+def _finish_game(manager, player_x_type='human', player_o_type='human'):
+    """创建一局并让 X 在第一行获胜，返回 game_id"""
+    game_id = manager.create_game(player_x_type, player_o_type).game_id
+    for row, col in [(0, 0), (1, 0), (0, 1), (1, 1), (0, 2)]:
+        manager.make_move(game_id, row, col)
+    return game_id
+
+
+def test_global_timelines_stream():
+    """测试全局timeline流：结束日志游标、Last-Event-ID 续传（Flask 和 ASGI）"""
+    from app import create_app
+    from game_manager import GameManager, game_manager
+    
+    print("\n" + "=" * 50)
+    print("测试全局timeline流")
+    print("=" * 50)
+    
+    print("\n1. 结束日志：按序号追加，重置的游戏移出日志")
+    manager = GameManager()
+    finished = [_finish_game(manager) for _ in range(3)]
+    entries = manager.finished_since(0)
+    assert [entry.game_id for entry in entries] == finished
+    assert [entry.seq for entry in entries] == [1, 2, 3]
+    assert [entry.game_id for entry in manager.finished_since(1)] == finished[1:]
+    manager.reset_game(finished[1])
+    assert [entry.game_id for entry in manager.finished_since(1)] == finished[2:]
+    manager.make_move(finished[1], 2, 2)
+    assert manager.wait_for_finished(3, 0.01) == []
+    again = _finish_game(manager)
+    assert [entry.seq for entry in manager.wait_for_finished(3, 0.01)] == [4]
+    assert manager.finished_since(3)[0].game_id == again
+    
+    print("\n2. Flask：带 Last-Event-ID 重连只推送之后结束的游戏")
+    cursor = game_manager.finished_seq
+    finished = [_finish_game(game_manager) for _ in range(3)]
+    response = create_app().test_client().get(
+        '/api/timelines-stream', headers={'Last-Event-ID': str(cursor + 1)}, buffered=False)
+    chunks = iter(response.response)
+    assert _sse_payload(next(chunks).decode())['type'] == 'connected'
+    received = [next(chunks).decode() for _ in range(2)]
+    response.close()
+    assert [_sse_payload(chunk)['game_id'] for chunk in received] == finished[1:]
+    assert [chunk.splitlines()[0] for chunk in received] == [f'id: {cursor + 2}', f'id: {cursor + 3}']
+    
+    print("\n3. ASGI：?last_event_id 续传，之后结束的游戏实时推送")
+    
+    async def scenario():
+        client = _ASGIClient()
+        stream = await client.stream(f'/api/timelines-stream?last_event_id={cursor + 2}&replay_speed=2')
+        assert _sse_payload(await stream.next_chunk())['type'] == 'connected'
+        chunk = await stream.next_chunk()
+        payload = _sse_payload(chunk)
+        assert chunk.startswith(f'id: {cursor + 3}\n') and payload['game_id'] == finished[2]
+        assert payload['timeline']['replay_speed'] == 2.0
+        live = _finish_game(game_manager)
+        chunk = await stream.next_chunk(1.0)
+        assert _sse_payload(chunk)['game_id'] == live
+        assert chunk.startswith(f'id: {game_manager.finished_entries[live].seq}\n')
+        await stream.close()
+        return live
+    
+    live = _run_asgi(scenario())
+    for game_id in finished + [live]:
+        game_manager.delete_game(game_id)
+    print("\n✓ 全局timeline流测试完成")
+
+
+def test_timeline_stream():
+    """测试单局timeline流：游戏结束时立即推送并关闭（Flask 和 ASGI）"""
+    import asyncio
+    import threading
+    import time
+    from app import create_app
+    from game_manager import game_manager
+    
+    print("\n" + "=" * 50)
+    print("测试单局timeline流")
+    print("=" * 50)
+    
+    def finish(game_id):
+        for row, col in [(1, 0), (0, 1), (1, 1), (0, 2)]:
+            game_manager.make_move(game_id, row, col)
+    
+    print("\n1. Flask：等待中的连接在最后一步后收到timeline，流随即结束")
+    game_id = game_manager.create_game('human', 'human').game_id
+    game_manager.make_move(game_id, 0, 0)
+    client = create_app().test_client()
+    # 测试客户端发起请求时就会取第一块响应体，所以先启动计时器
+    timer = threading.Timer(0.2, finish, (game_id,))
+    started = time.perf_counter()
+    timer.start()
+    response = client.get(f'/api/game/{game_id}/timeline-stream?replay_speed=3', buffered=False)
+    chunks = iter(response.response)
+    payload = _sse_payload(next(chunks).decode())
+    latency = time.perf_counter() - started - 0.2
+    timer.join()
+    assert payload['type'] == 'timeline'
+    assert payload['timeline']['winner'] == 'X' and payload['timeline']['total_moves'] == 5
+    assert payload['timeline']['replay_speed'] == 3.0
+    assert next(chunks, None) is None
+    response.close()
+    print(f"结束后 {latency * 1000:.1f}ms 推送")
+    assert latency < 0.25
+    
+    # 已结束的游戏直接推送；不存在的游戏返回错误
+    response = client.get(f'/api/game/{game_id}/timeline-stream', buffered=False)
+    assert _sse_payload(next(iter(response.response)).decode())['type'] == 'timeline'
+    response.close()
+    response = client.get('/api/game/missing/timeline-stream', buffered=False)
+    assert _sse_payload(next(iter(response.response)).decode())['type'] == 'error'
+    response.close()
+    game_manager.delete_game(game_id)
+    
+    print("\n2. ASGI：对局中的落子不推送，结束后推送timeline；等待中被删除返回错误")
+    
+    async def scenario():
+        client = _ASGIClient()
+        game_id = game_manager.create_game('human', 'human').game_id
+        stream = await client.stream(f'/api/game/{game_id}/timeline-stream')
+        game_manager.make_move(game_id, 0, 0)
+        try:
+            await stream.next_chunk(0.2)
+            raise AssertionError("对局未结束时不应推送")
+        except asyncio.TimeoutError:
+            pass
+        finish(game_id)
+        payload = _sse_payload(await stream.next_chunk(1.0))
+        assert payload['type'] == 'timeline' and payload['timeline']['game_id'] == game_id
+        assert await stream.next_chunk() is None
+        await stream.close()
+        game_manager.delete_game(game_id)
+        
+        game_id = game_manager.create_game('human', 'human').game_id
+        stream = await client.stream(f'/api/game/{game_id}/timeline-stream')
+        game_manager.delete_game(game_id)
+        assert _sse_payload(await stream.next_chunk(1.0))['type'] == 'error'
+        assert await stream.next_chunk() is None
+        await stream.close()
+    
+    _run_asgi(scenario())
+    print("\n✓ 单局timeline流测试完成")
+
+
+def test_agent_websocket():
+    """测试WebSocket Agent协议：订阅、your_turn 推送、回传着法、game_over"""
+    from game_manager import game_manager
+    
+    print("\n" + "=" * 50)
+    print("测试WebSocket Agent协议")
+    print("=" * 50)
+    
+    async def scenario():
+        client = _ASGIClient()
+        
+        print("\n1. 创建对局并让内置AI回应")
+        ws = await client.websocket('/ws/agent')
+        await ws.send_json({'type': 'ping', 'id': 1})
+        assert await ws.receive_json() == {'type': 'pong', 'id': 1}
+        await ws.send_json({'type': 'create', 'id': 2, 'player_x_type': 'agent', 'player_o_type': 'ai'})
+        created = await ws.receive_json()
+        assert created['type'] == 'created' and created['id'] == 2
+        game_id = created['game_id']
+        assert (await ws.receive_json())['type'] == 'subscribed'
+        turn = await ws.receive_json()
+        assert turn['type'] == 'your_turn' and turn['player'] == 'X' and turn['move_count'] == 0
+        await ws.send_json({'type': 'move', 'id': 3, 'game_id': game_id, 'row': 1, 'col': 1, 'reply': True})
+        messages = [await ws.receive_json(), await ws.receive_json()]
+        result = next(message for message in messages if message['type'] == 'move_result')
+        assert result['status'] == 'success' and result['ai_move']['player'] == 'O'
+        turn = next(message for message in messages if message['type'] == 'your_turn')
+        assert turn['move_count'] == 2
+        assert turn['last_move'] == [result['ai_move']['row'], result['ai_move']['col']]
+        await ws.send_json({'type': 'move', 'id': 4, 'game_id': game_id, 'row': 1, 'col': 1})
+        rejected = await ws.receive_json()
+        assert rejected['type'] == 'move_result' and rejected['status'] == 'error'
+        await ws.close()
+        game_manager.delete_game(game_id)
+        
+        print("2. 两个Agent各自订阅一方：对方落子后推送 your_turn，结束时双方收到 game_over")
+        game_id = game_manager.create_game('agent', 'agent').game_id
+        agents = {'X': await client.websocket('/ws/agent'), 'O': await client.websocket('/ws/agent')}
+        for player, ws in agents.items():
+            await ws.send_json({'type': 'subscribe', 'game_id': game_id, 'player': player})
+            assert (await ws.receive_json())['type'] == 'subscribed'
+        assert (await agents['X'].receive_json())['type'] == 'your_turn'
+        for index, (row, col) in enumerate([(0, 0), (1, 0), (0, 1), (1, 1), (0, 2)]):
+            mover = agents['X' if index % 2 == 0 else 'O']
+            other = agents['O' if index % 2 == 0 else 'X']
+            await mover.send_json({'type': 'move', 'game_id': game_id, 'row': row, 'col': col})
+            if index < 4:
+                assert (await mover.receive_json())['status'] == 'success'
+                pushed = await other.receive_json()
+                assert pushed['type'] == 'your_turn' and pushed['last_move'] == [row, col]
+        # 最后一步：落子结果和 game_over 推送的先后不确定
+        final = {message['type']: message for message in [await agents['X'].receive_json(),
+                                                          await agents['X'].receive_json()]}
+        assert final['move_result']['status'] == 'success' and final['game_over']['winner'] == 'X'
+        pushed = await agents['O'].receive_json()
+        assert pushed['type'] == 'game_over' and pushed['winning_line'] == [[0, 0], [0, 2]]
+        for ws in agents.values():
+            await ws.close()
+        game_manager.delete_game(game_id)
+    
+    _run_asgi(scenario())
+    print("\n✓ WebSocket Agent协议测试完成")
+
+
+def test_state_etag():
+    """测试状态读取的 ETag / If-None-Match：304、落子后失效（Flask 和 ASGI）"""
+    import json
+    from werkzeug.datastructures import Headers
+    from app import create_app
+    from game_manager import game_manager
+    
+    print("\n" + "=" * 50)
+    print("测试状态 ETag")
+    print("=" * 50)
+    
+    def check(request, move):
+        """request(headers, query) -> (状态码, 响应头, 响应体)；move() 落一子"""
+        status, headers, body = request({}, '')
+        assert status == 200 and json.loads(body)['status'] == 'success'
+        etag = headers['ETag']
+        assert headers['Cache-Control'] == 'no-cache'
+        
+        # 同一版本：精确、列表、弱比较都命中，304 不带响应体
+        for value in (etag, f'"other", {etag}', f'W/{etag}', '*'):
+            status, headers, body = request({'If-None-Match': value}, '')
+            assert status == 304 and body == b'' and headers['ETag'] == etag, value
+        status, _, _ = request({'If-None-Match': '"other"'}, '')
+        assert status == 200
+        # 二进制编码的 ETag 与 JSON 不同
+        status, headers, _ = request({'If-None-Match': etag}, 'format=bin')
+        assert status == 200 and headers['ETag'] != etag
+        
+        # 落子后旧 ETag 失效
+        move()
+        status, headers, body = request({'If-None-Match': etag}, '')
+        assert status == 200 and headers['ETag'] != etag
+        assert json.loads(body)['game_state']['move_count'] == 1
+        status, _, _ = request({'If-None-Match': headers['ETag']}, '')
+        assert status == 304
+        return etag, headers['ETag']
+    
+    print("\n1. Flask")
+    game_id = game_manager.create_game('human', 'human').game_id
+    client = create_app().test_client()
+    
+    def flask_request(headers, query):
+        response = client.get(f'/api/game/{game_id}/state?{query}', headers=headers)
+        return response.status_code, response.headers, response.get_data()
+    
+    before, after = check(flask_request, lambda: client.post(f'/api/game/{game_id}/move', json={'row': 0, 'col': 0}))
+    print(f"ETag: {before} -> {after}")
+    game_manager.delete_game(game_id)
+    
+    print("\n2. ASGI")
+    asgi = _ASGIClient()
+    game_id = game_manager.create_game('human', 'human').game_id
+    
+    def asgi_request(headers, query):
+        status, response_headers, body = _run_asgi(asgi.request('GET', f'/api/game/{game_id}/state?{query}',
+                                                                 headers=headers))
+        return status, Headers(list(response_headers.items())), body
+    
+    before, after = check(asgi_request, lambda: _run_asgi(
+        asgi.request('POST', f'/api/game/{game_id}/move', {'row': 1, 'col': 1})))
+    print(f"ETag: {before} -> {after}")
+    game_manager.delete_game(game_id)
+    print("\n✓ 状态 ETag 测试完成")
+
+
+def test_state_long_poll():
+    """测试长轮询 ?since=&wait=：落子后立即返回，超时返回 304（Flask 和 ASGI）"""
+    import asyncio
+    import threading
+    import time
+    from app import create_app
+    from game_manager import game_manager
+    
+    print("\n" + "=" * 50)
+    print("测试状态长轮询")
+    print("=" * 50)
+    
+    print("\n1. Flask")
+    client = create_app().test_client()
+    game_id = game_manager.create_game('human', 'human').game_id
+    version = game_manager.get_game(game_id).version
+    
+    started = time.perf_counter()
+    response = client.get(f'/api/game/{game_id}/state?since={version}&wait=0.2')
+    elapsed = time.perf_counter() - started
+    assert response.status_code == 304 and 0.15 < elapsed < 1.0
+    
+    timer = threading.Timer(0.2, game_manager.make_move, (game_id, 1, 1))
+    started = time.perf_counter()
+    timer.start()
+    response = client.get(f'/api/game/{game_id}/state?since={version}&wait=5')
+    elapsed = time.perf_counter() - started
+    timer.join()
+    state = response.get_json()['game_state']
+    print(f"落子后返回: {elapsed * 1000:.0f}ms（等待上限 5s）")
+    assert response.status_code == 200 and state['version'] > version and state['move_count'] == 1
+    assert elapsed < 1.0
+    
+    # 已有更新的版本：不等待直接返回
+    started = time.perf_counter()
+    response = client.get(f'/api/game/{game_id}/state?since={version}&wait=5')
+    assert response.status_code == 200 and time.perf_counter() - started < 0.5
+    game_manager.delete_game(game_id)
+    
+    print("\n2. ASGI")
+    
+    async def scenario():
+        asgi = _ASGIClient()
+        game_id = game_manager.create_game('human', 'human').game_id
+        version = game_manager.get_game(game_id).version
+        
+        started = time.perf_counter()
+        status, _, body = await asgi.request('GET', f'/api/game/{game_id}/state?since={version}&wait=0.2')
+        elapsed = time.perf_counter() - started
+        assert status == 304 and body == b'' and 0.15 < elapsed < 1.0
+        
+        asyncio.get_running_loop().call_later(0.2, game_manager.make_move, game_id, 2, 2)
+        started = time.perf_counter()
+        status, body = await asgi.json('GET', f'/api/game/{game_id}/state?since={version}&wait=5')
+        elapsed = time.perf_counter() - started
+        assert status == 200 and body['game_state']['move_count'] == 1 and elapsed < 1.0
+        print(f"落子后返回: {elapsed * 1000:.0f}ms（等待上限 5s）")
+        
+        # 等待中游戏被删除：返回 404
+        asyncio.get_running_loop().call_later(0.1, game_manager.delete_game, game_id)
+        status, _ = await asgi.json('GET', f'/api/game/{game_id}/state?since={version + 1}&wait=5')
+        assert status == 404
+    
+    _run_asgi(scenario())
+    print("\n✓ 状态长轮询测试完成")
+
+
+def test_admission_http():
+    """测试推送连接超限时的HTTP响应：单客户端 429、全局 503，都带 Retry-After（Flask 和 ASGI）"""
+    import asyncio
+    from admission import stream_budget
+    from app import create_app
+    from game_manager import game_manager
+    
+    print("\n" + "=" * 50)
+    print("测试准入控制HTTP响应")
+    print("=" * 50)
+    
+    limits = (stream_budget.max_streams, stream_budget.max_per_client, stream_budget.retry_after)
+    stream_budget.max_streams, stream_budget.max_per_client, stream_budget.retry_after = 2, 1, 3
+    game_id = game_manager.create_game('human', 'human').game_id
+    version = game_manager.get_game(game_id).version
+    try:
+        print("\n1. Flask")
+        client = create_app().test_client()
+        
+        def open_stream(address):
+            return client.get(f'/api/game/{game_id}/events', buffered=False,
+                              environ_base={'REMOTE_ADDR': address})
+        
+        first = open_stream('10.0.0.1')
+        assert first.status_code == 200
+        for address, status in [('10.0.0.1', 429), ('10.0.0.3', None)]:
+            if status is None:
+                second = open_stream('10.0.0.2')
+                assert second.status_code == 200
+                status = 503
+            response = open_stream(address)
+            assert response.status_code == status and response.headers['Retry-After'] == '3'
+            assert response.get_json()['retry_after'] == 3
+        # 长轮询同样计入名额
+        response = client.get(f'/api/game/{game_id}/state?since={version}&wait=5',
+                              environ_base={'REMOTE_ADDR': '10.0.0.3'})
+        assert response.status_code == 503 and response.headers['Retry-After'] == '3'
+        # 同一线程里的两个流各自压入了请求上下文，按后进先出关闭
+        second.close()
+        first.close()
+        assert stream_budget.stats()['active_streams'] == 0
+        response = open_stream('10.0.0.3')
+        assert response.status_code == 200
+        response.close()
+        print("429 / 503 均带 Retry-After: 3，连接关闭后名额归还")
+        
+        print("\n2. ASGI")
+        
+        async def scenario():
+            first = await _ASGIClient('10.0.0.1').stream(f'/api/game/{game_id}/events')
+            assert first.status == 200
+            status, headers, body = await _ASGIClient('10.0.0.1').request('GET', f'/api/game/{game_id}/events')
+            assert status == 429 and headers['retry-after'] == '3' and b'retry_after' in body
+            second = await _ASGIClient('10.0.0.2').stream('/api/timelines-stream')
+            assert second.status == 200
+            third = _ASGIClient('10.0.0.3')
+            status, headers, _ = await third.request('GET', f'/api/game/{game_id}/events')
+            assert status == 503 and headers['retry-after'] == '3'
+            status, headers, _ = await third.request('GET', f'/api/game/{game_id}/state?since={version}&wait=5')
+            assert status == 503 and headers['retry-after'] == '3'
+            await first.close()
+            await second.close()
+            for _ in range(50):
+                if stream_budget.stats()['active_streams'] == 0:
+                    break
+                await asyncio.sleep(0.01)
+            assert stream_budget.stats()['active_streams'] == 0
+            status, body = await third.json('GET', f'/api/game/{game_id}/state?since={version}&wait=0.05')
+            assert status == 304
+        
+        _run_asgi(scenario())
+        print("429 / 503 均带 Retry-After: 3，连接关闭后名额归还")
+    finally:
+        stream_budget.max_streams, stream_budget.max_per_client, stream_budget.retry_after = limits
+        game_manager.delete_game(game_id)
+    
+    print("\n✓ 准入控制HTTP响应测试完成")
+
+
+def test_sharded_router():
+    """测试分片前端：列表按创建时间归并分页、转发客户端地址、时间线流只保留一条连接确认、提供页面"""
+    import gzip
+    import json
+    import httpx
+    import asgi_app
+    from admission import stream_budget
+    from game_manager import GameManager
+    from sharded_arena import ShardRouter
+    from static_assets import static_assets
+    
+    print("\n" + "=" * 50)
+    print("测试分片前端")
+    print("=" * 50)
+    
+    # 两个分片各用一个独立的 GameManager，经 MockTransport 接到前端
+    managers = [GameManager(), GameManager()]
+    for index, manager in enumerate(managers):
+        manager.configure_shard(index, 2)
+    
+    def respond(payload, content_type='application/json'):
+        # 与真实传输一样返回未读取的流，前端才能边收边转发
+        body = payload.encode('utf-8') if isinstance(payload, str) else json.dumps(payload).encode('utf-8')
+        return httpx.Response(200, headers={'content-type': content_type}, stream=httpx.ByteStream(body))
+    
+    def shard_handler(index):
+        def handle(request):
+            path = request.url.path
+            if path == '/api/games':
+                return respond(managers[index].query_games(dict(request.url.params)))
+            if path == '/api/health':
+                return respond({"status": "healthy", "active_games": len(managers[index].games)})
+            if path == '/api/timelines-stream':
+                frames = [{"type": "connected"},
+                          {"type": "game_finished", "game_id": f"g{index}", "note": "connected"}]
+                return respond(''.join(f'id: {seq}\ndata: {json.dumps(frame)}\n\n'
+                                       for seq, frame in enumerate(frames, 1)), 'text/event-stream')
+            return respond({"headers": dict(request.headers)})
+        return handle
+    
+    router = ShardRouter(['shard-0', 'shard-1'])
+    router.clients = [httpx.AsyncClient(transport=httpx.MockTransport(shard_handler(index)),
+                                        base_url='http://arena-shard') for index in range(2)]
+    client = _ASGIClient('203.0.113.7')
+    client.app = router
+    
+    # 分片0 先有10局，之后两个分片交替创建
+    created = [(managers[0].create_game('agent', 'human'), 0) for _ in range(10)]
+    for index in range(30):
+        created.append((managers[index % 2].create_game('agent', 'human'), index % 2))
+    expected = [game.game_id for game, shard in sorted(created, key=lambda item: (item[0].created_at, item[1]))]
+    
+    async def list_all(order):
+        pages, cursor = [], None
+        while True:
+            query = f'/api/games?limit=7&order={order}&fields=game_id,status' + (f'&cursor={cursor}' if cursor else '')
+            status, body = await client.json('GET', query)
+            assert status == 200 and body['count'] <= 7 and body['total_games'] == 40
+            assert all(set(summary) == {'game_id', 'status'} for summary in body['games'].values())
+            pages.append(list(body['games']))
+            cursor = body['next_cursor']
+            if cursor is None:
+                return pages
+    
+    async def scenario():
+        print("\n1. /api/games 归并分页")
+        pages = await list_all('asc')
+        assert [len(page) for page in pages] == [7] * 5 + [5]
+        assert sum(pages, []) == expected
+        pages = await list_all('desc')
+        assert sum(pages, []) == expected[::-1]
+        print(f"40 局（两个分片）按每页 7 条正序、倒序翻页均不重不漏")
+        
+        print("\n2. 转发客户端地址")
+        status, body = await client.json('GET', f'/api/game/{expected[0]}/state',
+                                         headers={'X-Real-IP': '10.9.9.9', 'X-Forwarded-For': '198.51.100.1'})
+        assert body['headers']['x-real-ip'] == '203.0.113.7'
+        assert body['headers']['x-forwarded-for'] == '198.51.100.1, 203.0.113.7'
+        
+        print("\n3. 全局时间线流：只转发第一个分片的连接确认，按解析出的类型判断")
+        status, _, content = await client.request('GET', '/api/timelines-stream')
+        frames = [message for message in content.decode().split('\n\n') if message.strip()]
+        types = [_sse_payload(message)['type'] for message in frames]
+        assert status == 200 and types.count('connected') == 1 and types.count('game_finished') == 2
+        assert frames[-1].startswith('id: ') and set(frames[-1].split('\n')[0][4:].split('.')) == {'2'}
+        
+        print("\n4. 页面与静态资源由前端直接提供，不转发到分片")
+        status, headers, content = await client.request('GET', '/', headers={'Accept-Encoding': 'gzip'})
+        assert status == 200 and headers['content-encoding'] == 'gzip' and 'text/html' in headers['content-type']
+        html = gzip.decompress(content).decode()
+        assert html == static_assets.index.body.decode()
+        src = html.split('src="')[1].split('"')[0]
+        status, headers, content = await client.request('GET', '/' + src)
+        assert status == 200 and 'immutable' in headers['cache-control'] and 'javascript' in headers['content-type']
+        status, _, content = await client.request('GET', '/' + src, headers={'If-None-Match': f'"stale", W/{headers["etag"]}'})
+        assert status == 304 and content == b''
+        status, _, _ = await client.request('GET', '/static/js/missing.js')
+        assert status == 404
+        print(f"首页与 {src} 正常返回，带指纹的地址永久缓存")
+    
+    _run_asgi(scenario())
+    _run_asgi(router.aclose())
+    
+    print("\n5. 工作进程按 X-Real-IP 做准入控制（只信任没有来源地址的 Unix 域套接字连接）")
+    game_id = asgi_app.game_manager.create_game('human', 'human').game_id
+    limit = stream_budget.max_per_client
+    stream_budget.max_per_client = 1
+    
+    async def admission():
+        worker = _ASGIClient()
+        worker.client = None
+        first = await worker.stream(f'/api/game/{game_id}/events', headers={'X-Real-IP': '203.0.113.7'})
+        assert first.status == 200
+        status, _, _ = await worker.request('GET', f'/api/game/{game_id}/events', headers={'X-Real-IP': '203.0.113.7'})
+        assert status == 429
+        other = await worker.stream(f'/api/game/{game_id}/events', headers={'X-Real-IP': '203.0.113.8'})
+        assert other.status == 200
+        await first.close()
+        await other.close()
+        # 直接对外的连接带来源地址，伪造的请求头被忽略
+        assert asgi_app._client_address({'client': ('192.0.2.1', 1), 'headers': [(b'x-real-ip', b'1.2.3.4')]}) == '192.0.2.1'
+    
+    asgi_app.trust_forwarded_client = True
+    try:
+        _run_asgi(admission())
+    finally:
+        asgi_app.trust_forwarded_client = False
+        stream_budget.max_per_client = limit
+        asgi_app.game_manager.delete_game(game_id)
+    assert asgi_app._client_address({'client': None, 'headers': [(b'x-real-ip', b'1.2.3.4')]}) == 'unknown'
+    print("同一转发地址第二条连接 429，不同地址互不影响")
+    
+    print("\n✓ 分片前端测试完成")
+
+
 if __name__ == '__main__':
     print("井字棋决斗场 - 测试套件\n")
     
@@ -161,6 +1972,33 @@ if __name__ == '__main__':
     test_ai()
     test_minimax_ai()
     test_ai_vs_ai()
+    test_tablebase()
+    test_threat_space_ai()
+    test_parallel_search()
+    test_move_and_reply()
+    test_bulk_moves()
+    test_state_codec()
+    test_list_games()
+    test_logging()
+    test_metrics()
+    test_admission()
+    test_sqlite_store()
+    test_shard_ids()
+    test_event_bus()
+    test_static_assets()
+    test_server_launcher()
+    test_event_log()
+    test_rl_batcher()
+    test_numpy_policy()
+    test_sse_delivery()
+    test_asgi_offload()
+    test_global_timelines_stream()
+    test_timeline_stream()
+    test_agent_websocket()
+    test_state_etag()
+    test_state_long_poll()
+    test_admission_http()
+    test_sharded_router()
     
     print("\n" + "="*50)
     print("所有测试完成！")
@@ -0,0 +1,181 @@
+"""
+威胁空间搜索（VCF：连续冲四取胜）
+面向大棋盘的k连珠：进攻方每一步都制造"再下一子即成k连"的威胁，
+防守方只能被动封堵，从而在极小的搜索空间内找出强制获胜序列。
+
+威胁检测是增量式的：棋盘维护每个k窗口内双方的棋子计数，
+落子/悔棋只更新经过该格子的窗口；一步棋新产生的威胁只需检查经过这一步的窗口。
+"""
+import random
+import time
+from typing import Dict, List, Optional, Set
+
+from mnk_board import MNKGeometry
+
+# Zobrist随机数固定种子，保证同一棋盘的哈希在各处一致
+_ZOBRIST_SEED = 20251106
+
+
+class ThreatBoard:
+    """支持增量威胁检测的棋盘"""
+
+    def __init__(self, geometry: MNKGeometry, board=None):
+        self.geometry = geometry
+        self.k = geometry.k
+        self.cells: List[Optional[str]] = [None] * geometry.cells
+        window_count = len(geometry.windows)
+        self.counts: Dict[str, List[int]] = {'X': [0] * window_count, 'O': [0] * window_count}
+
+        rng = random.Random(_ZOBRIST_SEED)
+        self._zobrist = {
+            player: [rng.getrandbits(64) for _ in range(geometry.cells)]
+            for player in ('X', 'O')
+        }
+        self.hash = 0
+
+        if board is not None:
+            for row in range(geometry.rows):
+                for col in range(geometry.cols):
+                    if board[row][col] is not None:
+                        self.place(geometry.cell(row, col), board[row][col])
+
+    def place(self, cell: int, player: str):
+        """落子"""
+        self.cells[cell] = player
+        counts = self.counts[player]
+        for window_id in self.geometry.cell_windows[cell]:
+            counts[window_id] += 1
+        self.hash ^= self._zobrist[player][cell]
+
+    def undo(self, cell: int):
+        """悔棋"""
+        player = self.cells[cell]
+        self.cells[cell] = None
+        counts = self.counts[player]
+        for window_id in self.geometry.cell_windows[cell]:
+            counts[window_id] -= 1
+        self.hash ^= self._zobrist[player][cell]
+
+    def _empty_cells_in(self, window_id: int):
+        for cell in self.geometry.windows[window_id]:
+            if self.cells[cell] is None:
+                yield cell
+
+    def winning_cells(self, player: str, around: Optional[int] = None) -> Set[int]:
+        """
+        玩家下一步即可成k连的格子
+        :param around: 若给出，只检查经过该格子的窗口（该格子刚落子时使用）
+        """
+        own = self.counts[player]
+        other = self.counts['O' if player == 'X' else 'X']
+        window_ids = range(len(own)) if around is None else self.geometry.cell_windows[around]
+        target = self.k - 1
+        cells = set()
+        for window_id in window_ids:
+            if own[window_id] == target and other[window_id] == 0:
+                cells.update(self._empty_cells_in(window_id))
+        return cells
+
+    def four_moves(self, player: str) -> Set[int]:
+        """玩家下一步可以制造成k连威胁（冲四）的格子"""
+        own = self.counts[player]
+        other = self.counts['O' if player == 'X' else 'X']
+        target = self.k - 2
+        cells = set()
+        for window_id in range(len(own)):
+            if own[window_id] == target and other[window_id] == 0:
+                cells.update(self._empty_cells_in(window_id))
+        return cells
+
+    def cell_score(self, cell: int, player: str) -> int:
+        """启发式：经过该格子、未被对方阻断的窗口中己方棋子数的加权和"""
+        own = self.counts[player]
+        other = self.counts['O' if player == 'X' else 'X']
+        score = 0
+        for window_id in self.geometry.cell_windows[cell]:
+            if other[window_id] == 0:
+                score += 4 ** own[window_id]
+        return score
+
+
+class _SearchAborted(Exception):
+    """节点数或时间耗尽"""
+
+
+class VCFSolver:
+    """连续冲四求解器"""
+
+    def __init__(self, max_depth: int = 12, node_limit: int = 50000,
+                 time_limit: Optional[float] = None):
+        """
+        :param max_depth: 进攻方最多连续冲四的步数
+        :param node_limit: 搜索节点上限
+        :param time_limit: 时间上限（秒），None表示不限
+        """
+        self.max_depth = max_depth
+        self.node_limit = node_limit
+        self.time_limit = time_limit
+        self.nodes = 0
+        self._deadline = None
+        self._failed: Dict[int, int] = {}
+
+    def solve(self, board: ThreatBoard, attacker: str) -> Optional[List[int]]:
+        """
+        寻找进攻方的强制获胜序列
+        :return: 着法序列 [进攻, 防守, 进攻, ...]（格子编号），找不到返回None
+        """
+        self.nodes = 0
+        self._failed = {}
+        self._deadline = time.perf_counter() + self.time_limit if self.time_limit else None
+        try:
+            return self._search(board, attacker, self.max_depth)
+        except _SearchAborted:
+            return None
+
+    def _search(self, board: ThreatBoard, attacker: str, depth: int) -> Optional[List[int]]:
+        self.nodes += 1
+        if self.nodes > self.node_limit:
+            raise _SearchAborted()
+        if self._deadline is not None and self.nodes % 256 == 0 and time.perf_counter() > self._deadline:
+            raise _SearchAborted()
+
+        defender = 'O' if attacker == 'X' else 'X'
+
+        # 能直接获胜
+        wins = board.winning_cells(attacker)
+        if wins:
+            return [min(wins)]
+
+        # 对手有两处以上的成k点，冲四也挡不住
+        defender_wins = board.winning_cells(defender)
+        if len(defender_wins) > 1 or depth == 0:
+            return None
+
+        if self._failed.get(board.hash, -1) >= depth:
+            return None
+
+        candidates = board.four_moves(attacker)
+        if defender_wins:
+            # 必须先封堵对手，且封堵点本身要是冲四
+            candidates &= defender_wins
+        ordered = sorted(candidates, key=lambda cell: -board.cell_score(cell, attacker))
+
+        for cell in ordered:
+            board.place(cell, attacker)
+            # 落子前进攻方没有成k点，所以新的威胁一定经过这一步
+            replies = board.winning_cells(attacker, around=cell)
+            if len(replies) >= 2:
+                board.undo(cell)
+                return [cell]
+            if len(replies) == 1:
+                reply = next(iter(replies))
+                board.place(reply, defender)
+                line = self._search(board, attacker, depth - 1)
+                board.undo(reply)
+                if line is not None:
+                    board.undo(cell)
+                    return [cell, reply] + line
+            board.undo(cell)
+
+        self._failed[board.hash] = depth
+        return None
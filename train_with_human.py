@@ -15,6 +15,9 @@ import os
 from datetime import datetime
 import hashlib
 
+# 等待人类落子时每次长轮询的最长等待（秒）
+LONG_POLL_WAIT = 25
+
 class HumanOpponentEnv(gym.Env):
     """和人类对弈的环境"""
     
@@ -90,7 +93,14 @@ class HumanOpponentEnv(gym.Env):
         while True:
             time.sleep(1)
             
-            response = self.session.get(f'{self.base_url}/api/games?status=in_progress')
+            # 服务器按索引只返回 Agent 是 X、还没有人落子的新游戏
+            response = self.session.get(f'{self.base_url}/api/games', params={
+                'status': 'in_progress',
+                'player_x_type': 'agent',
+                'move_count': 0,
+                'order': 'desc',
+                'fields': 'game_id,player_x_type,move_count'
+            })
             if response.status_code != 200:
                 continue
             
@@ -129,8 +139,7 @@ class HumanOpponentEnv(gym.Env):
         
         print(f"🤖 Agent ({self.player}) 下在: ({row}, {col})")
         
-        # 获取状态
-        response = self.session.get(f'{self.base_url}/api/game/{self.game_id}/state')
+        # 下棋响应已带最新状态
         game_state = response.json()['game_state']
         self.current_board = game_state['board']
         status = game_state['status']
@@ -153,13 +162,29 @@ class HumanOpponentEnv(gym.Env):
                 print("😢 Agent 输了")
                 return obs, -15, True, False, {'result': 'loss'}
         
-        # 等待人类下棋
+        # 等待人类下棋（长轮询：服务器在局面变化时立即返回，超时返回 304）
         print("   等待人类下棋...")
+        version = game_state['version']
         while True:
-            time.sleep(0.5)
-            
-            response = self.session.get(f'{self.base_url}/api/game/{self.game_id}/state')
+            response = self.session.get(
+                f'{self.base_url}/api/game/{self.game_id}/state',
+                params={'since': version, 'wait': LONG_POLL_WAIT},
+                timeout=LONG_POLL_WAIT + 5
+            )
+            if response.status_code == 304:
+                continue
+            if response.status_code == 404:
+                print("❌ 游戏已被删除")
+                return np.zeros(9, dtype=np.float32), 0, True, False, {'result': 'error'}
+            if response.status_code in (429, 503):
+                # 服务器推送连接名额已满，按 Retry-After 退避
+                time.sleep(float(response.headers.get('Retry-After', 5)))
+                continue
+            if response.status_code != 200:
+                time.sleep(0.5)
+                continue
             game_state = response.json()['game_state']
+            version = game_state['version']
             status = game_state['status']
             current_player = game_state['current_player']
             